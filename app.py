@@ -1,19 +1,29 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, RedirectResponse
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from pydantic import BaseModel, conint, conlist, constr
+from typing import List, Dict, Any, Literal, Optional
 import pandas as pd
 import numpy as np
-import json
-import re
+import time
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.preprocessing import StandardScaler
-import joblib
+import hmac
 import os
 import setuptools.dist
+from indexes import SymptomIndex, AgeBucketCache, DatasetStats, parse_age_buckets, get_age_group, MAX_AGE
+from artifacts import file_sha256, load_artifacts, save_artifacts, load_shared_state, save_shared_state
+from case_store import CaseStore
+from summaries import parse_summaries
+from ingest import build_model_state_chunked, estimate_chunk_rows
+from retrieval import build_retriever, recall_at_k
+from serving import ComputePool, ComputePoolFull, RequestCoalescer, ResultCache, LatencyTracker, default_compute_workers
+from snapshot import ModelSnapshot, SnapshotManager
+from delta import IngestLog
+from models import SymptomRecommender
+from hashing import HashingTfidfVectorizer, HASHING_FEATURES
+from tokenization import build_tokenizer, with_tokenizer
 
 app = FastAPI(
     title="Symptom Recommendation System API",
@@ -43,154 +53,402 @@ class SymptomInput(BaseModel):
     symptoms: List[str]
     search_terms: Optional[str] = ""
 
+class CaseInput(BaseModel):
+    """A triaged case for POST /cases, validated since it joins the served corpus and stats"""
+    gender: Literal['male', 'female']
+    age: conint(ge=0, le=MAX_AGE)
+    symptoms: conlist(constr(strip_whitespace=True, min_length=1), min_length=1)
+    search_terms: Optional[str] = ""
+
 class RecommendationResponse(BaseModel):
     recommendations: List[Dict[str, Any]]
     confidence_scores: List[float]
     similar_cases: List[Dict[str, Any]]
 
+class ComprehensiveResponse(BaseModel):
+    primary_diagnosis: List[str]
+    confidence_scores: List[float]
+    cluster_insights: Dict[str, Any]
+    similar_cases: List[Dict[str, Any]]
+    age_specific_insights: Dict[str, Any]
+    gender_specific_insights: Dict[str, Any]
+
 class HealthCheck(BaseModel):
     status: str
     message: str
 
-# Global variables for the recommendation system
-symptom_data = None
-tfidf_vectorizer = None
-symptom_vectors = None
-scaler = None
+# Data file and on-disk artifact cache (set ARTIFACT_DIR to an empty string to disable)
+DATA_FILE = os.getenv("DATA_FILE", "ai_symptom_picker.csv")
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", ".artifacts")
 
-def load_and_preprocess_data():
-    """Load and preprocess the symptom data"""
-    global symptom_data, tfidf_vectorizer, symptom_vectors, scaler
+# Chunked ingestion for CSVs larger than RAM: a fixed chunk size in rows, or a memory
+# ceiling in MB from which the chunk size is derived (both 0 = read the CSV in one go)
+INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "0"))
+INGEST_MEMORY_MB = float(os.getenv("INGEST_MEMORY_MB", "0"))
+
+# When set, workers memory-map the serving state from this directory instead of
+# each holding a private copy (write it up front with `python preprocess.py`)
+SHARED_STATE_DIR = os.getenv("SHARED_STATE_DIR", "")
+
+# TF-IDF settings; part of the artifact key so a change forces a rebuild
+TFIDF_PARAMS = {
+    'max_features': 1000,
+    'stop_words': None,  # Keep medical terms
+    'ngram_range': (1, 2),
+    'min_df': 2
+}
+
+# Feature hashing instead of a fitted vocabulary, for the similarity search and the
+# comprehensive models alike: hashed columns plus an IDF accumulated over parallel
+# shards, O(HASHING_FEATURES) memory whatever the vocabulary size
+FEATURE_HASHING = os.getenv("FEATURE_HASHING", "0") == "1"
+
+# Tokenizer replacing the default token_pattern ("" = default, "thai" = dictionary-based
+# Thai word segmentation over the data's yes_symptoms terms), shared with the models
+TOKENIZER = os.getenv("TOKENIZER", "")
+
+# What the preprocessing cache is keyed on besides the data
+FEATURE_PARAMS = dict(TFIDF_PARAMS)
+if FEATURE_HASHING:
+    FEATURE_PARAMS['hashing_features'] = HASHING_FEATURES
+if TOKENIZER:
+    FEATURE_PARAMS['tokenizer'] = TOKENIZER
+
+# Columns kept per case once preprocessing is done
+CASE_COLUMNS = ['gender', 'age', 'search_term', 'extracted_symptoms', 'age_scaled']
+
+# Similar-case retrieval: "exact" (reference) or "ivf" (approximate inverted-file index)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "exact")
+IVF_LISTS = int(os.getenv("IVF_LISTS", "0"))  # 0 = sqrt(number of cases)
+IVF_PROBES = int(os.getenv("IVF_PROBES", "8"))
+RECALL_CHECK_QUERIES = int(os.getenv("RECALL_CHECK_QUERIES", "200"))
+
+# Largest number of patients accepted by POST /recommend/batch
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "64"))
+
+# Bounded pool for CPU-bound request work; requests beyond workers + queue get a 503
+COMPUTE_WORKERS = int(os.getenv("COMPUTE_WORKERS", str(default_compute_workers())))
+COMPUTE_QUEUE_DEPTH = int(os.getenv("COMPUTE_QUEUE_DEPTH", "32"))
+
+# Micro-batching for /recommend: requests arriving within the window (or until the
+# batch is full) share one vectorizer transform and one similarity pass; 0 disables it
+COALESCE_WINDOW_MS = float(os.getenv("COALESCE_WINDOW_MS", "2"))
+COALESCE_MAX_BATCH = int(os.getenv("COALESCE_MAX_BATCH", "32"))
+
+# Result cache for /recommend keyed on the canonical input; size 0 disables it
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
+
+# Age bands used for age-group insights, e.g. "young:0-30,middle:30-60,elderly:60-120"
+AGE_BUCKETS = parse_age_buckets(os.getenv("AGE_BUCKETS", ""))
+
+# Hot reload: POST /admin/reload (disabled unless ADMIN_TOKEN is set, then guarded by it),
+# and optionally polling DATA_FILE every RELOAD_POLL_SECONDS (0 disables the file watch)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+RELOAD_POLL_SECONDS = float(os.getenv("RELOAD_POLL_SECONDS", "0"))
+
+# POST /cases (guarded by ADMIN_TOKEN like /admin/reload) appends to a delta segment
+# searched next to the main matrix; it is merged and the IDF refitted in the background
+# once it holds DELTA_COMPACT_ROWS cases or its oldest case is DELTA_COMPACT_SECONDS old
+# (0 disables that trigger)
+MAX_INGEST_BATCH = int(os.getenv("MAX_INGEST_BATCH", "1000"))
+DELTA_COMPACT_ROWS = int(os.getenv("DELTA_COMPACT_ROWS", "5000"))
+DELTA_COMPACT_SECONDS = float(os.getenv("DELTA_COMPACT_SECONDS", "300"))
+
+# POST /recommend/comprehensive serves models.SymptomRecommender. Its models are trained
+# offline by preprocess.py into MODELS_DIR and memory-mapped with the snapshot's case
+# store; the server never trains them, and without models for the current data the
+# endpoint answers 503. COMPREHENSIVE_MODELS=0 disables it.
+# Latency is tracked against COMPREHENSIVE_P95_BUDGET_MS and reported in /metrics
+COMPREHENSIVE_MODELS = os.getenv("COMPREHENSIVE_MODELS", "1") == "1"
+MODELS_DIR = os.getenv("MODELS_DIR", ".models")
+COMPREHENSIVE_P95_BUDGET_MS = float(os.getenv("COMPREHENSIVE_P95_BUDGET_MS", "25"))
+
+# Classifier pruning for /recommend/comprehensive: vote with only the first N trees and/or
+# stop descending after N levels (0 = the full forest, identical to predict_proba)
+COMPREHENSIVE_MAX_TREES = int(os.getenv("COMPREHENSIVE_MAX_TREES", "0"))
+COMPREHENSIVE_MAX_DEPTH = int(os.getenv("COMPREHENSIVE_MAX_DEPTH", "0"))
+
+# CSV columns the recommender is trained on (offline, see train_recommender)
+RECOMMENDER_COLUMNS = ['gender', 'age', 'summary']
+
+compute_pool = ComputePool(COMPUTE_WORKERS, COMPUTE_QUEUE_DEPTH)
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+comprehensive_latency = LatencyTracker(COMPREHENSIVE_P95_BUDGET_MS)
+
+def build_model_state(path: str):
+    """Parse the CSV and fit the vectorizer and scaler"""
+    if INGEST_CHUNK_ROWS > 0 or INGEST_MEMORY_MB > 0:
+        chunk_rows = INGEST_CHUNK_ROWS or estimate_chunk_rows(path, INGEST_MEMORY_MB)
+        print(f"Ingesting {path} in chunks of {chunk_rows} rows")
+        return build_model_state_chunked(path, TFIDF_PARAMS, chunk_rows,
+                                         HASHING_FEATURES if FEATURE_HASHING else 0, TOKENIZER)
+    
+    # Load the CSV data
+    df = pd.read_csv(path)
+    
+    # Extract symptoms from JSON summary (parsed once, shared with models.py)
+    df['extracted_symptoms'] = parse_summaries(df['summary'], df.index).texts()
     
+    vectorizer, vectors, age_scaler = fit_model_state(df)
+    return df[CASE_COLUMNS], vectorizer, vectors, age_scaler
+
+def fit_model_state(df: pd.DataFrame):
+    """Fit the vectorizer and scaler on cases with extracted symptoms"""
+    # Combine symptoms with search terms for better matching
+    combined_text = df['extracted_symptoms'] + ' ' + df['search_term'].fillna('')
+    
+    # Create TF-IDF vectors (the tokenizer's dictionary is the symptom texts themselves)
+    params = with_tokenizer(TFIDF_PARAMS, build_tokenizer(TOKENIZER, df['extracted_symptoms']))
+    if FEATURE_HASHING:
+        vectorizer = HashingTfidfVectorizer(**params)
+    else:
+        vectorizer = TfidfVectorizer(**params)
+    vectors = vectorizer.fit_transform(combined_text)
+    
+    # Prepare age scaler
+    age_scaler = StandardScaler()
+    df['age_scaled'] = age_scaler.fit_transform(df[['age']].values)
+    
+    return vectorizer, vectors, age_scaler
+
+def prepare_model_state(data_hash: Optional[str] = None):
+    """Fitted preprocessing state, from the artifact cache when possible"""
+    # Reuse a cached bundle when the CSV has not changed
+    bundle = None
+    if ARTIFACT_DIR:
+        data_hash = data_hash or file_sha256(DATA_FILE)
+        bundle = load_artifacts(ARTIFACT_DIR, data_hash, FEATURE_PARAMS)
+    
+    if bundle is not None:
+        print(f"Loaded cached artifacts for {DATA_FILE}")
+        return bundle['cases'], bundle['vectorizer'], bundle['symptom_vectors'], bundle['scaler']
+    
+    df, vectorizer, vectors, age_scaler = build_model_state(DATA_FILE)
+    if ARTIFACT_DIR:
+        try:
+            save_artifacts(ARTIFACT_DIR, data_hash, FEATURE_PARAMS, vectorizer, age_scaler, vectors, df)
+        except Exception as e:
+            print(f"Could not write artifact cache: {e}")
+    return df, vectorizer, vectors, age_scaler
+
+def prepare_shared_state(data_hash: str) -> Dict[str, Any]:
+    """Memory-map the shared serving state, writing it first if missing"""
+    state = load_shared_state(SHARED_STATE_DIR, data_hash, FEATURE_PARAMS)
+    if state is None:
+        df, vectorizer, vectors, age_scaler = prepare_model_state(data_hash)
+        index = SymptomIndex(vectorizer.tokenizer)
+        index.build(df['extracted_symptoms'])
+        save_shared_state(SHARED_STATE_DIR, data_hash, FEATURE_PARAMS,
+                          vectorizer, age_scaler, vectors, CaseStore.from_frame(df), index)
+        print(f"Wrote shared state to {SHARED_STATE_DIR}")
+        state = load_shared_state(SHARED_STATE_DIR, data_hash, FEATURE_PARAMS)
+    return state
+
+def build_similarity_backend(vectors):
+    """Build the configured retrieval backend and report its recall against exact search"""
+    if RETRIEVAL_BACKEND == 'exact':
+        return build_retriever('exact', vectors)
+    
+    backend = build_retriever(RETRIEVAL_BACKEND, vectors, n_lists=IVF_LISTS or None, n_probe=IVF_PROBES)
+    if RECALL_CHECK_QUERIES > 0:
+        rng = np.random.default_rng(42)
+        sample = rng.choice(vectors.shape[0], min(RECALL_CHECK_QUERIES, vectors.shape[0]), replace=False)
+        recall = recall_at_k(build_retriever('exact', vectors), backend, vectors[np.sort(sample)], k=10)
+        print(f"{RETRIEVAL_BACKEND} retrieval recall@10 vs exact: {recall:.3f}")
+    return backend
+
+def new_recommender() -> SymptomRecommender:
+    """An untrained SymptomRecommender with the configured featurisation, pruning and age bands"""
+    return SymptomRecommender(predict_max_trees=COMPREHENSIVE_MAX_TREES or None,
+                              predict_max_depth=COMPREHENSIVE_MAX_DEPTH or None,
+                              feature_hashing=FEATURE_HASHING,
+                              tokenizer=TOKENIZER,
+                              age_buckets=AGE_BUCKETS)
+
+def train_recommender(data_hash: str) -> SymptomRecommender:
+    """Train the comprehensive models on DATA_FILE and save them to MODELS_DIR (run offline)"""
+    recommender = new_recommender()
+    recommender.train_models(pd.read_csv(DATA_FILE, usecols=RECOMMENDER_COLUMNS))
+    recommender.save_models(MODELS_DIR, data_hash=data_hash)
+    return recommender
+
+def build_recommender(data_hash: str, store: CaseStore) -> Optional[SymptomRecommender]:
+    """The comprehensive recommender from MODELS_DIR, or None when disabled or not trained"""
+    if not COMPREHENSIVE_MODELS:
+        return None
+    
+    recommender = new_recommender()
     try:
-        # Load the CSV data
-        df = pd.read_csv('ai_symptom_picker.csv')
-        
-        # Extract symptoms from JSON summary
-        def extract_symptoms(row):
-            try:
-                summary = json.loads(row['summary'])
-                yes_symptoms = summary.get('yes_symptoms', [])
-                symptoms = [symptom['text'] for symptom in yes_symptoms]
-                return ' '.join(symptoms)
-            except:
-                return ""
-        
-        df['extracted_symptoms'] = df.apply(extract_symptoms, axis=1)
-        
-        # Combine symptoms with search terms for better matching
-        df['combined_text'] = df['extracted_symptoms'] + ' ' + df['search_term'].fillna('')
-        
-        # Create TF-IDF vectors
-        tfidf_vectorizer = TfidfVectorizer(
-            max_features=1000,
-            stop_words=None,  # Keep medical terms
-            ngram_range=(1, 2),
-            min_df=2
-        )
-        
-        symptom_vectors = tfidf_vectorizer.fit_transform(df['combined_text'])
-        
-        # Prepare age scaler
-        scaler = StandardScaler()
-        age_scaled = scaler.fit_transform(df[['age']].values)
-        df['age_scaled'] = age_scaled
-        
-        symptom_data = df
-        print(f"Data loaded successfully: {len(df)} records")
+        # Memory-mapped, so workers serving the same models share the pages; the cases
+        # come from the snapshot's store rather than a second parse of DATA_FILE
+        recommender.load_models(MODELS_DIR, data_hash=data_hash, cases=store)
+    except Exception as e:
+        print(f"/recommend/comprehensive is unavailable: {e}. "
+              f"Run `python preprocess.py` to train its models for {DATA_FILE} into MODELS_DIR")
+        return None
+    print(f"Loaded recommender models from {MODELS_DIR}")
+    return recommender
+
+def build_snapshot(version: int) -> ModelSnapshot:
+    """Load and preprocess the symptom data into a new immutable snapshot"""
+    data_hash = file_sha256(DATA_FILE)
+    if SHARED_STATE_DIR:
+        state = prepare_shared_state(data_hash)
+        vectorizer = state['vectorizer']
+        vectors = state['symptom_vectors']
+        age_scaler = state['scaler']
+        store = state['cases']
+        index = state['index']
+        print(f"Memory-mapped shared state from {SHARED_STATE_DIR}")
+    else:
+        df, vectorizer, vectors, age_scaler = prepare_model_state(data_hash)
+        # Serve from the columnar store; the DataFrame is released after this
+        store = CaseStore.from_frame(df)
+        del df
         
+        # Build symptom frequency / co-occurrence index used by pattern analysis
+        index = SymptomIndex(vectorizer.tokenizer)
+        index.build(list(store.symptoms))
+    
+    snapshot = assemble_snapshot(version, data_hash, vectorizer, vectors, age_scaler, store, index,
+                                 build_recommender(data_hash, store))
+    print(f"Data loaded successfully: {len(store)} records ({store.nbytes / 1e6:.1f} MB case store)")
+    return snapshot
+
+def assemble_snapshot(version: int, data_hash: str, vectorizer, vectors, age_scaler,
+                      store: CaseStore, index: SymptomIndex,
+                      recommender: Optional[SymptomRecommender] = None) -> ModelSnapshot:
+    """Derive the age-bucket tables, dataset stats and retrieval backend, and bundle everything"""
+    # Precompute per-age-bucket symptom tables
+    age_cache = AgeBucketCache(AGE_BUCKETS)
+    age_cache.build(store.ages, index)
+    
+    # /stats is served from these aggregates instead of scanning the cases per call
+    stats = DatasetStats().build(store, index)
+    
+    backend = build_similarity_backend(vectors)
+    return ModelSnapshot(version, data_hash, vectorizer, vectors, age_scaler, index, age_cache, stats, store, backend,
+                         recommender=recommender)
+
+def build_compacted_snapshot(base: ModelSnapshot, version: int) -> ModelSnapshot:
+    """Merge base's delta segment into its main segment, refitting vocabulary and IDF"""
+    df = pd.concat([base.cases.to_frame(), base.delta.frame], ignore_index=True)
+    vectorizer, vectors, age_scaler = fit_model_state(df)
+    store = CaseStore.from_frame(df)
+    del df
+    
+    index = SymptomIndex(vectorizer.tokenizer)
+    index.build(list(store.symptoms))
+    # The recommender is trained on DATA_FILE only, so it carries over unchanged
+    return assemble_snapshot(version, base.data_hash, vectorizer, vectors, age_scaler, store, index,
+                             base.recommender)
+
+def rebase_compacted_snapshot(base: ModelSnapshot, compacted: ModelSnapshot,
+                              live: ModelSnapshot, version: int) -> Optional[ModelSnapshot]:
+    """Carry cases ingested during compaction over to the compacted snapshot"""
+    if live.cases is not base.cases:
+        return None  # A reload replaced the data while compacting
+    ingested = live.delta.frame.iloc[len(base.delta):]
+    if len(ingested) == 0:
+        return compacted
+    return compacted.with_cases(ingested, version)
+
+def rebase_reloaded_snapshot(built: ModelSnapshot, live: Optional[ModelSnapshot],
+                             version: int) -> ModelSnapshot:
+    """Replay every case ingested since startup onto a snapshot rebuilt from DATA_FILE
+
+    Cases acknowledged by POST /cases are not in the CSV, so without this a reload
+    would drop them. The log outlives compactions, and replaying it in order gives
+    every case its original id as long as DATA_FILE holds the same rows.
+    """
+    if len(ingest_log) == 0:
+        return built
+    return built.with_cases(ingest_log.frame(), version)
+
+# Cases acknowledged by POST /cases since startup, replayed by full reloads
+ingest_log = IngestLog()
+
+# The live snapshot; cached responses belong to the snapshot they were computed on
+snapshots = SnapshotManager(build_snapshot, on_swap=lambda snapshot: result_cache.clear(),
+                            finalize=rebase_reloaded_snapshot)
+
+def load_and_preprocess_data():
+    """Load and preprocess the symptom data"""
+    try:
+        snapshots.load()
     except Exception as e:
         print(f"Error loading data: {e}")
         raise
 
-def get_symptom_similarity(input_symptoms: str, top_k: int = 5):
+def _similar_cases(snapshot: ModelSnapshot, top_indices: np.ndarray, scores: np.ndarray) -> List[Dict[str, Any]]:
+    """Response entries for a list of hits"""
+    return [
+        {'id': idx, **case, 'similarity_score': score}
+        for idx, case, score in zip(top_indices.tolist(), snapshot.records(top_indices), scores.tolist())
+    ]
+
+def get_symptom_similarity(snapshot: Optional[ModelSnapshot], input_symptoms: str, top_k: int = 5):
     """Get similar cases based on symptoms"""
-    if tfidf_vectorizer is None or symptom_vectors is None:
+    if snapshot is None:
         raise HTTPException(status_code=500, detail="Model not initialized")
     
     # Vectorize input symptoms
-    input_vector = tfidf_vectorizer.transform([input_symptoms])
-    
-    # Calculate similarity
-    similarities = cosine_similarity(input_vector, symptom_vectors).flatten()
+    input_vector = snapshot.vectorizer.transform([input_symptoms])
     
-    # Get top similar cases
-    top_indices = similarities.argsort()[-top_k:][::-1]
-    
-    similar_cases = []
-    for idx in top_indices:
-        if similarities[idx] > 0:  # Only include cases with some similarity
-            case = symptom_data.iloc[idx]
-            similar_cases.append({
-                'id': int(idx),
-                'gender': case['gender'],
-                'age': int(case['age']),
-                'symptoms': case['extracted_symptoms'],
-                'search_terms': case['search_term'],
-                'similarity_score': float(similarities[idx])
-            })
+    # Get top similar cases (only those with some similarity) from the main and delta segments
+    top_indices, scores = snapshot.search(input_vector, top_k, min_score=0.0)
+    return _similar_cases(snapshot, top_indices, scores)
+
+def get_batch_symptom_similarity(snapshot: Optional[ModelSnapshot],
+                                 input_texts: List[str],
+                                 top_k: int = 5) -> List[List[Dict[str, Any]]]:
+    """get_symptom_similarity for many inputs with one transform and one similarity pass"""
+    if snapshot is None:
+        raise HTTPException(status_code=500, detail="Model not initialized")
     
-    return similar_cases
+    input_vectors = snapshot.vectorizer.transform(input_texts)
+    hits = snapshot.search_batch(input_vectors, top_k, min_score=0.0)
+    return [_similar_cases(snapshot, top_indices, scores) for top_indices, scores in hits]
 
-def analyze_symptom_patterns(symptoms: List[str]) -> Dict[str, Any]:
+def analyze_symptom_patterns(snapshot: Optional[ModelSnapshot], symptoms: List[str]) -> Dict[str, Any]:
     """Analyze symptom patterns and provide insights"""
-    if symptom_data is None:
+    if snapshot is None:
         return {}
     
-    # Count symptom frequencies
-    all_symptoms = []
-    for _, row in symptom_data.iterrows():
-        if row['extracted_symptoms']:
-            all_symptoms.extend(row['extracted_symptoms'].split())
-    
-    symptom_counts = pd.Series(all_symptoms).value_counts()
-    
-    # Find common co-occurring symptoms
-    input_symptom_set = set(symptoms)
-    co_occurring = {}
-    
-    for _, row in symptom_data.iterrows():
-        if row['extracted_symptoms']:
-            case_symptoms = set(row['extracted_symptoms'].split())
-            if input_symptom_set.intersection(case_symptoms):
-                for symptom in case_symptoms - input_symptom_set:
-                    co_occurring[symptom] = co_occurring.get(symptom, 0) + 1
-    
     return {
-        'common_symptoms': symptom_counts.head(10).to_dict(),
-        'co_occurring_symptoms': dict(sorted(co_occurring.items(), key=lambda x: x[1], reverse=True)[:5])
+        'common_symptoms': snapshot.index.common_symptoms(10),
+        'co_occurring_symptoms': snapshot.index.co_occurring_symptoms(symptoms, 5)
     }
 
-def get_age_based_recommendations(age: int, symptoms: List[str]) -> List[str]:
+def get_age_based_recommendations(snapshot: Optional[ModelSnapshot], age: int, symptoms: List[str]) -> List[str]:
     """Get age-specific recommendations"""
-    if symptom_data is None:
+    if snapshot is None:
         return []
     
-    # Filter data by age group
-    age_group = 'young' if age < 30 else 'middle' if age < 60 else 'elderly'
-    
-    age_ranges = {
-        'young': (0, 30),
-        'middle': (30, 60),
-        'elderly': (60, 120)
-    }
-    
-    min_age, max_age = age_ranges[age_group]
-    age_filtered = symptom_data[(symptom_data['age'] >= min_age) & (symptom_data['age'] <= max_age)]
-    
-    # Get common symptoms in this age group
-    common_symptoms = []
-    for _, row in age_filtered.iterrows():
-        if row['extracted_symptoms']:
-            common_symptoms.extend(row['extracted_symptoms'].split())
-    
-    symptom_counts = pd.Series(common_symptoms).value_counts()
-    return symptom_counts.head(5).index.tolist()
+    return snapshot.age_cache.common_symptoms(age, 5)
+
+recommend_coalescer = None
+
+async def run_compute(fn, *args):
+    """Run blocking work on the compute pool, answering 503 when it is saturated"""
+    try:
+        return await compute_pool.run(fn, *args)
+    except ComputePoolFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize the recommendation system on startup"""
     load_and_preprocess_data()
+    if RELOAD_POLL_SECONDS > 0:
+        snapshots.watch(DATA_FILE, RELOAD_POLL_SECONDS)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Let running compute jobs finish"""
+    snapshots.stop()
+    compute_pool.shutdown()
 
 @app.get("/")
 async def root_redirect():
@@ -205,6 +463,36 @@ async def health_check():
         "message": "Symptom Recommendation System API is running"
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Serving metrics"""
+    metrics = {
+        "compute_pool": compute_pool.stats(),
+        "result_cache": result_cache.stats(),
+        "model_snapshot": snapshots.stats(),
+        "comprehensive_latency": comprehensive_latency.stats()
+    }
+    if recommend_coalescer is not None:
+        metrics["recommend_coalescer"] = recommend_coalescer.stats()
+    return metrics
+
+def require_admin_token(x_admin_token: Optional[str]):
+    """Reject admin calls: 404 while ADMIN_TOKEN is unset, 403 for a wrong token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/admin/reload", status_code=202)
+async def reload_model(x_admin_token: Optional[str] = Header(None)):
+    """Rebuild the dataset and models in the background and swap them in when ready"""
+    require_admin_token(x_admin_token)
+    
+    # Requests keep being served from the current snapshot while the new one builds
+    if not snapshots.reload("admin request"):
+        raise HTTPException(status_code=409, detail="A reload is already in progress")
+    return snapshots.stats()
+
 @app.get("/web")
 async def web_interface():
     """Serve the web interface"""
@@ -215,57 +503,215 @@ async def web_interface():
             "message": "Web interface not available. Use /docs for API documentation."
         }
 
-@app.post("/recommend", response_model=RecommendationResponse)
-async def get_recommendations(input_data: SymptomInput):
-    """Get symptom-based recommendations"""
+def recommendation_cache_key(input_data: SymptomInput):
+    """Cache key of an input: the text that gets vectorized, and the age bucket
+    
+    Only whitespace is collapsed; symptom order, repeats and case all change the
+    query vector, so requests differing in them are kept apart.
+    """
+    return (' '.join(build_query_text(input_data).split()), get_age_group(input_data.age, AGE_BUCKETS))
+
+def build_query_text(input_data: SymptomInput) -> str:
+    """Text that is vectorized for a patient's symptoms"""
+    input_symptoms_text = ' '.join(input_data.symptoms)
+    if input_data.search_terms:
+        input_symptoms_text += ' ' + input_data.search_terms
+    return input_symptoms_text
+
+def build_recommendation_response(similar_cases: List[Dict[str, Any]]) -> RecommendationResponse:
+    """Shape similar cases into the recommendation response"""
+    # Calculate confidence scores based on similarity
+    confidence_scores = [case['similarity_score'] for case in similar_cases]
+    
+    # Prepare recommendations
+    recommendations = []
+    for case in similar_cases:
+        recommendations.append({
+            'case_id': case['id'],
+            'demographics': {
+                'gender': case['gender'],
+                'age': case['age']
+            },
+            'symptoms': case['symptoms'],
+            'search_terms': case['search_terms'],
+            'confidence': case['similarity_score'],
+            'age_group': get_age_group(case['age'], AGE_BUCKETS)
+        })
+    
+    return RecommendationResponse(
+        recommendations=recommendations,
+        confidence_scores=confidence_scores,
+        similar_cases=similar_cases
+    )
+
+def recommend(input_data: SymptomInput) -> RecommendationResponse:
+    """Compute recommendations for one patient"""
+    # One snapshot for the whole request, even if a reload swaps it meanwhile
+    snapshot = snapshots.current()
     try:
-        # Prepare input symptoms
-        input_symptoms_text = ' '.join(input_data.symptoms)
-        if input_data.search_terms:
-            input_symptoms_text += ' ' + input_data.search_terms
-        
         # Get similar cases
-        similar_cases = get_symptom_similarity(input_symptoms_text, top_k=10)
+        similar_cases = get_symptom_similarity(snapshot, build_query_text(input_data), top_k=10)
         
         # Analyze patterns
-        pattern_analysis = analyze_symptom_patterns(input_data.symptoms)
+        pattern_analysis = analyze_symptom_patterns(snapshot, input_data.symptoms)
         
         # Get age-based recommendations
-        age_recommendations = get_age_based_recommendations(input_data.age, input_data.symptoms)
+        age_recommendations = get_age_based_recommendations(snapshot, input_data.age, input_data.symptoms)
         
-        # Calculate confidence scores based on similarity
-        confidence_scores = [case['similarity_score'] for case in similar_cases]
+        return build_recommendation_response(similar_cases)
         
-        # Prepare recommendations
-        recommendations = []
-        for i, case in enumerate(similar_cases):
-            recommendations.append({
-                'case_id': case['id'],
-                'demographics': {
-                    'gender': case['gender'],
-                    'age': case['age']
-                },
-                'symptoms': case['symptoms'],
-                'search_terms': case['search_terms'],
-                'confidence': case['similarity_score'],
-                'age_group': 'young' if case['age'] < 30 else 'middle' if case['age'] < 60 else 'elderly'
-            })
-        
-        return RecommendationResponse(
-            recommendations=recommendations,
-            confidence_scores=confidence_scores,
-            similar_cases=similar_cases
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating recommendations: {str(e)}")
+
+@app.post("/recommend", response_model=RecommendationResponse)
+async def get_recommendations(input_data: SymptomInput):
+    """Get symptom-based recommendations"""
+    # Inputs that vectorize to the same query share one cache entry
+    cache_key = recommendation_cache_key(input_data)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    generation = result_cache.generation
+    if recommend_coalescer is None:
+        response = await run_compute(recommend, input_data)
+    else:
+        try:
+            response = await recommend_coalescer.submit(input_data)
+        except ComputePoolFull as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    
+    result_cache.put(cache_key, response, generation)
+    return response
+
+@app.post("/recommend/batch", response_model=List[RecommendationResponse])
+async def get_batch_recommendations(input_batch: List[SymptomInput]):
+    """Get recommendations for a queue of patients, in request order"""
+    if len(input_batch) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(input_batch)} exceeds the maximum of {MAX_BATCH_SIZE} patients"
+        )
+    
+    cache_keys = [recommendation_cache_key(input_data) for input_data in input_batch]
+    responses = [result_cache.get(key) for key in cache_keys]
+    
+    # Only the cache misses are computed, still as one batch
+    missing = [i for i, response in enumerate(responses) if response is None]
+    if missing:
+        generation = result_cache.generation
+        computed = await run_compute(recommend_batch, [input_batch[i] for i in missing])
+        for i, response in zip(missing, computed):
+            responses[i] = response
+            result_cache.put(cache_keys[i], response, generation)
+    
+    return responses
+
+def recommend_batch(input_batch: List[SymptomInput]) -> List[RecommendationResponse]:
+    """Compute recommendations for several patients at once"""
+    try:
+        # One transform and one query-by-corpus product for the whole batch
+        batch_cases = get_batch_symptom_similarity(
+            snapshots.current(),
+            [build_query_text(input_data) for input_data in input_batch], top_k=10
         )
+        return [build_recommendation_response(similar_cases) for similar_cases in batch_cases]
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating recommendations: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error generating batch recommendations: {str(e)}")
+
+@app.post("/recommend/comprehensive", response_model=ComprehensiveResponse)
+async def get_comprehensive_recommendations(input_data: SymptomInput):
+    """Classifier diagnosis, symptom cluster, similar cases and demographic insights"""
+    started = time.perf_counter()
+    response = await run_compute(recommend_comprehensive, input_data)
+    comprehensive_latency.record(time.perf_counter() - started)
+    return response
+
+def recommend_comprehensive(input_data: SymptomInput) -> Dict[str, Any]:
+    """Run the preloaded SymptomRecommender for one patient"""
+    snapshot = snapshots.current()
+    if snapshot is None:
+        raise HTTPException(status_code=500, detail="Model not initialized")
+    if snapshot.recommender is None:
+        raise HTTPException(status_code=503, detail="Comprehensive recommendations are unavailable: "
+                            "disabled (COMPREHENSIVE_MODELS=0) or no models trained on this data in MODELS_DIR "
+                            "(run preprocess.py)")
+    
+    try:
+        return snapshot.recommender.get_comprehensive_recommendations(
+            input_data.symptoms, input_data.age, input_data.gender
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating comprehensive recommendations: {str(e)}")
+
+if COALESCE_WINDOW_MS > 0:
+    recommend_coalescer = RequestCoalescer(recommend_batch, compute_pool.run, COALESCE_WINDOW_MS, COALESCE_MAX_BATCH)
+
+@app.post("/cases", status_code=201)
+async def ingest_cases(cases: List[CaseInput], x_admin_token: Optional[str] = Header(None)):
+    """Append newly triaged cases; they are searchable as soon as this returns"""
+    require_admin_token(x_admin_token)
+    if not cases:
+        raise HTTPException(status_code=400, detail="No cases given")
+    if len(cases) > MAX_INGEST_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(cases)} exceeds the maximum of {MAX_INGEST_BATCH} cases"
+        )
+    return await run_compute(append_cases, cases)
+
+def ingest(live: ModelSnapshot, frame: pd.DataFrame, version: int) -> ModelSnapshot:
+    """Append frame to the live snapshot and to the ingest log, under the update lock"""
+    snapshot = live.with_cases(frame, version)
+    ingest_log.append(frame)
+    return snapshot
+
+def append_cases(cases: List[CaseInput]) -> Dict[str, Any]:
+    """Add cases to the delta segment and schedule compaction when it is due"""
+    if snapshots.current() is None:
+        raise HTTPException(status_code=500, detail="Data not loaded")
+    
+    frame = pd.DataFrame({
+        'gender': [case.gender for case in cases],
+        'age': [case.age for case in cases],
+        'search_term': [case.search_terms or '' for case in cases],
+        'extracted_symptoms': [' '.join(case.symptoms) for case in cases]
+    })
+    try:
+        snapshot = snapshots.update(lambda live, version: ingest(live, frame, version))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error ingesting cases: {str(e)}")
+    
+    delta = snapshot.delta
+    due = len(delta) >= DELTA_COMPACT_ROWS or (
+        DELTA_COMPACT_SECONDS > 0 and time.time() - delta.created_at >= DELTA_COMPACT_SECONDS
+    )
+    compacting = due and snapshots.reload(
+        "delta compaction",
+        build_fn=lambda version: build_compacted_snapshot(snapshot, version),
+        finalize=lambda compacted, live, version: rebase_compacted_snapshot(snapshot, compacted, live, version)
+    )
+    
+    first_id = len(snapshot) - len(cases)
+    return {
+        "ingested": len(cases),
+        "case_ids": list(range(first_id, len(snapshot))),
+        "delta_records": len(delta),
+        "snapshot_version": snapshot.version,
+        "compaction_started": compacting
+    }
 
 @app.get("/symptoms/analysis")
 async def analyze_symptoms(symptoms: str):
     """Analyze specific symptoms and provide insights"""
+    return await run_compute(compute_symptom_analysis, symptoms)
+
+def compute_symptom_analysis(symptoms: str) -> Dict[str, Any]:
+    """Pattern analysis for a comma-separated symptom list"""
     try:
         symptom_list = [s.strip() for s in symptoms.split(',')]
-        analysis = analyze_symptom_patterns(symptom_list)
+        analysis = analyze_symptom_patterns(snapshots.current(), symptom_list)
         return analysis
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing symptoms: {str(e)}")
@@ -274,10 +720,10 @@ async def analyze_symptoms(symptoms: str):
 async def get_age_group_insights(age: int):
     """Get insights for specific age group"""
     try:
-        age_recommendations = get_age_based_recommendations(age, [])
+        age_recommendations = get_age_based_recommendations(snapshots.current(), age, [])
         return {
             "age": age,
-            "age_group": 'young' if age < 30 else 'middle' if age < 60 else 'elderly',
+            "age_group": get_age_group(age, AGE_BUCKETS),
             "common_symptoms": age_recommendations
         }
     except Exception as e:
@@ -286,24 +732,11 @@ async def get_age_group_insights(age: int):
 @app.get("/stats")
 async def get_statistics():
     """Get dataset statistics"""
-    try:
-        if symptom_data is None:
-            raise HTTPException(status_code=500, detail="Data not loaded")
-        
-        stats = {
-            "total_records": len(symptom_data),
-            "gender_distribution": symptom_data['gender'].value_counts().to_dict(),
-            "age_statistics": {
-                "mean": float(symptom_data['age'].mean()),
-                "median": float(symptom_data['age'].median()),
-                "min": int(symptom_data['age'].min()),
-                "max": int(symptom_data['age'].max())
-            },
-            "unique_symptoms": len(set(' '.join(symptom_data['extracted_symptoms'].dropna()).split()))
-        }
-        return stats
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error getting statistics: {str(e)}")
+    # Precomputed with the snapshot, so this is answered directly on the event loop
+    snapshot = snapshots.current()
+    if snapshot is None:
+        raise HTTPException(status_code=500, detail="Data not loaded")
+    return snapshot.stats.as_dict()
 
 if __name__ == "__main__":
     import uvicorn
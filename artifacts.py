@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import joblib
+import pandas as pd
+from scipy import sparse
+from typing import Dict, Any, Optional, Callable
+from storage import save_csr, load_csr
+from case_store import CaseStore
+from indexes import SymptomIndex
+
+# Bump whenever the bundle layout or the preprocessing code changes
+ARTIFACT_FORMAT_VERSION = 2
+
+MANIFEST_FILE = "manifest.json"
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Hash a file without reading it into memory at once"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def frame_sha256(df: pd.DataFrame) -> str:
+    """Hash a DataFrame's contents, index included"""
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes()).hexdigest()
+
+
+def bundle_key(data_hash: str, build_params: Dict[str, Any]) -> str:
+    """Key identifying a bundle built from this data with these parameters"""
+    payload = json.dumps({
+        'format_version': ARTIFACT_FORMAT_VERSION,
+        'data_hash': data_hash,
+        'build_params': build_params
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def _open_manifest(root_dir: str, data_hash: str, build_params: Dict[str, Any]) -> Optional[str]:
+    """Path of the matching bundle directory, if a complete one exists"""
+    bundle_dir = os.path.join(root_dir, bundle_key(data_hash, build_params))
+    manifest_path = os.path.join(bundle_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if (manifest.get('format_version') != ARTIFACT_FORMAT_VERSION or
+            manifest.get('data_hash') != data_hash):
+        return None
+    return bundle_dir
+
+
+def write_atomic_dir(target_dir: str,
+                     manifest: Dict[str, Any],
+                     write_files: Callable[[str], None],
+                     replace: bool = False) -> str:
+    """Write a directory atomically so concurrent readers never see a partial one
+
+    An existing complete directory is kept, or with replace swapped out for the
+    new one; processes that memory-mapped its files keep reading them.
+    """
+    target_dir = os.path.abspath(target_dir)
+    manifest_path = os.path.join(target_dir, MANIFEST_FILE)
+    if not replace and os.path.exists(manifest_path):
+        return target_dir
+
+    parent, name = os.path.split(target_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{name}-", dir=parent)
+    retired = None
+    try:
+        write_files(tmp_dir)
+
+        # Manifest goes last: its presence marks the directory as complete
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, default=str)
+
+        os.chmod(tmp_dir, 0o755)
+        if replace and os.path.exists(target_dir):
+            retired = tempfile.mkdtemp(prefix='.retired-', dir=parent)
+            os.rename(target_dir, os.path.join(retired, name))
+        os.rename(tmp_dir, target_dir)
+    except OSError:
+        # Another worker finished the same directory first
+        if replace or not os.path.exists(manifest_path):
+            raise
+    finally:
+        for leftover in (tmp_dir, retired):
+            if leftover is not None and os.path.exists(leftover):
+                shutil.rmtree(leftover, ignore_errors=True)
+
+    return target_dir
+
+
+def _write_bundle(root_dir: str,
+                  data_hash: str,
+                  build_params: Dict[str, Any],
+                  records: int,
+                  write_files: Callable[[str], None]) -> str:
+    """Write a keyed bundle under root_dir, unless a complete one is already there"""
+    return write_atomic_dir(os.path.join(root_dir, bundle_key(data_hash, build_params)), {
+        'format_version': ARTIFACT_FORMAT_VERSION,
+        'data_hash': data_hash,
+        'build_params': build_params,
+        'records': records
+    }, write_files)
+
+
+def load_artifacts(artifact_dir: str, data_hash: str, build_params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Load a previously built bundle, or return None if there is no matching one"""
+    try:
+        bundle_dir = _open_manifest(artifact_dir, data_hash, build_params)
+        if bundle_dir is None:
+            return None
+
+        return {
+            'vectorizer': joblib.load(os.path.join(bundle_dir, 'vectorizer.joblib')),
+            'scaler': joblib.load(os.path.join(bundle_dir, 'scaler.joblib')),
+            'symptom_vectors': sparse.load_npz(os.path.join(bundle_dir, 'symptom_vectors.npz')).tocsr(),
+            'cases': pd.read_pickle(os.path.join(bundle_dir, 'cases.pkl'))
+        }
+    except Exception as e:
+        print(f"Ignoring unreadable artifact bundle in {artifact_dir}: {e}")
+        return None
+
+
+def save_artifacts(artifact_dir: str,
+                   data_hash: str,
+                   build_params: Dict[str, Any],
+                   vectorizer,
+                   scaler,
+                   symptom_vectors: sparse.csr_matrix,
+                   cases: pd.DataFrame) -> str:
+    """Write the fitted preprocessing state as a bundle"""
+    def write_files(bundle_dir):
+        joblib.dump(vectorizer, os.path.join(bundle_dir, 'vectorizer.joblib'))
+        joblib.dump(scaler, os.path.join(bundle_dir, 'scaler.joblib'))
+        sparse.save_npz(os.path.join(bundle_dir, 'symptom_vectors.npz'), symptom_vectors)
+        cases.to_pickle(os.path.join(bundle_dir, 'cases.pkl'))
+
+    return _write_bundle(artifact_dir, data_hash, build_params, len(cases), write_files)
+
+
+def load_shared_state(state_dir: str, data_hash: str, build_params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Memory-map a shared serving state, or return None if there is no matching one"""
+    bundle_dir = _open_manifest(state_dir, data_hash, build_params)
+    if bundle_dir is None:
+        return None
+
+    vectorizer = joblib.load(os.path.join(bundle_dir, 'vectorizer.joblib'))
+    return {
+        'vectorizer': vectorizer,
+        'scaler': joblib.load(os.path.join(bundle_dir, 'scaler.joblib')),
+        'symptom_vectors': load_csr(bundle_dir, 'symptom_vectors', mmap=True),
+        'cases': CaseStore.load(os.path.join(bundle_dir, 'cases'), mmap=True),
+        'index': SymptomIndex.load(os.path.join(bundle_dir, 'index'), mmap=True, tokenizer=vectorizer.tokenizer)
+    }
+
+
+def save_shared_state(state_dir: str,
+                      data_hash: str,
+                      build_params: Dict[str, Any],
+                      vectorizer,
+                      scaler,
+                      symptom_vectors: sparse.csr_matrix,
+                      cases: CaseStore,
+                      index: SymptomIndex) -> str:
+    """Write the serving state as flat arrays that workers can memory-map"""
+    def write_files(bundle_dir):
+        joblib.dump(vectorizer, os.path.join(bundle_dir, 'vectorizer.joblib'))
+        joblib.dump(scaler, os.path.join(bundle_dir, 'scaler.joblib'))
+        save_csr(bundle_dir, 'symptom_vectors', symptom_vectors)
+        cases.save(os.path.join(bundle_dir, 'cases'))
+        index.save(os.path.join(bundle_dir, 'index'))
+
+    return _write_bundle(state_dir, data_hash, build_params, len(cases), write_files)
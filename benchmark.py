@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Symptom Recommendation System Benchmarks
+
+Runs on synthetic data shaped like the TF-IDF matrix built by app.py, so it
+needs no CSV file. Each benchmark prints one row per corpus size.
+
+Usage:
+    python benchmark.py similarity --sizes 10000 100000 1000000
+    python benchmark.py casestore --sizes 100000 1000000
+    python benchmark.py clustering --sizes 10000 100000 300000
+    python benchmark.py comprehensive --sizes 10000 20000
+    python benchmark.py topk --sizes 5000 --max-classes 300
+    python benchmark.py hashing --sizes 100000 1000000 --vocabulary 200000
+    python benchmark.py tokenizer --sizes 10000 100000 --vocabulary 2000
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import resource
+import time
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from typing import List, Tuple
+from sklearn.metrics import adjusted_rand_score, silhouette_score
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+from case_store import CaseStore
+from retrieval import ExactSearch
+
+SYMPTOM_WORDS = ["ไอ", "เสมหะ", "น้ำมูกไหล", "เจ็บคอ", "ปวดท้อง", "ท้องเสีย", "อาเจียน",
+                 "ปวดหลัง", "ปวดข้อ", "ไข้", "ปวดหัว", "เวียนศีรษะ", "ผื่น", "คัน"]
+
+
+def synthetic_vectors(n_cases: int, n_features: int = 1000, terms_per_case: int = 6, seed: int = 0) -> sparse.csr_matrix:
+    """L2-normalised sparse rows with a skewed (Zipf-like) term distribution"""
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, n_features + 1)
+    weights /= weights.sum()
+    cols = rng.choice(n_features, size=n_cases * terms_per_case, p=weights)
+    rows = np.repeat(np.arange(n_cases), terms_per_case)
+    data = rng.random(len(cols)) + 0.1
+    matrix = sparse.csr_matrix((data, (rows, cols)), shape=(n_cases, n_features))
+    matrix.sum_duplicates()
+    return normalize(matrix).tocsr()
+
+
+def synthetic_cases(n_cases: int, seed: int = 0) -> pd.DataFrame:
+    """Case columns in the shape app.py serves"""
+    rng = np.random.default_rng(seed)
+    words = np.array(SYMPTOM_WORDS, dtype=object)
+    symptoms = [' '.join(words[rng.integers(0, len(words), 3)]) for _ in range(n_cases)]
+    return pd.DataFrame({
+        'gender': rng.choice(['male', 'female'], n_cases),
+        'age': rng.integers(1, 95, n_cases),
+        'search_term': [s.replace(' ', ', ') for s in symptoms],
+        'extracted_symptoms': symptoms
+    })
+
+
+def synthetic_summaries(n_cases: int, n_words: int = 2000, words_per_case: int = 4, seed: int = 0) -> pd.DataFrame:
+    """Cases with a JSON `summary` column, drawing symptom words from a Zipf-like vocabulary"""
+    rng = np.random.default_rng(seed)
+    words = np.array(SYMPTOM_WORDS + [f"symptom{i}" for i in range(n_words)], dtype=object)
+    weights = 1.0 / np.arange(1, len(words) + 1)
+    picks = rng.choice(len(words), size=(n_cases, words_per_case), p=weights / weights.sum())
+    summaries = [json.dumps({'yes_symptoms': [{'text': words[i]} for i in row]}) for row in picks]
+    return pd.DataFrame({
+        'gender': rng.choice(['male', 'female'], n_cases),
+        'age': rng.integers(1, 95, n_cases),
+        'summary': summaries
+    })
+
+
+def synthetic_thai_terms(n_terms: int, seed: int = 0) -> List[str]:
+    """Distinct Thai-looking symptom terms of two or three syllables"""
+    rng = np.random.default_rng(seed)
+    consonants = list("กขคงจฉชซดตถทธนบปผพฟมยรลวสหอ")
+    vowels = ["{}า", "{}ิ", "{}ี", "{}ุ", "{}ู", "เ{}", "แ{}", "โ{}", "ไ{}", "{}ะ"]
+    tones = ["", "", "่", "้"]
+    finals = ["", "", "ก", "ง", "น", "ม", "ด", "บ", "ย"]
+    terms = set()
+    while len(terms) < n_terms:
+        syllables = []
+        for _ in range(rng.integers(2, 4)):
+            syllable = vowels[rng.integers(len(vowels))].format(consonants[rng.integers(len(consonants))])
+            syllables.append(syllable + tones[rng.integers(len(tones))] + finals[rng.integers(len(finals))])
+        terms.add(''.join(syllables))
+    return sorted(terms)
+
+
+def synthetic_thai_texts(n_cases: int, terms: List[str], terms_per_case: int = 4, seed: int = 0) -> Tuple[List[str], List[str]]:
+    """Space-joined yes_symptoms terms plus an unspaced search phrase, as app.py combines them
+
+    Also returns the yes_symptoms texts the tokenizer's dictionary is built from.
+    """
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, len(terms) + 1)
+    picks = rng.choice(len(terms), size=(n_cases, terms_per_case), p=weights / weights.sum())
+    symptoms = [[terms[i] for i in row] for row in picks]
+    # Free-text search terms run words together, as Thai is written
+    texts = [' '.join(row) + ' ' + ''.join(row[:2]) for row in symptoms]
+    return texts, [term for row in symptoms for term in row]
+
+
+def time_call(fn, repeat: int = 20) -> float:
+    """Median wall time of fn in milliseconds"""
+    fn()  # warm-up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def bench_similarity(args):
+    """Previous cosine_similarity + argsort + iloc path vs the exact search engine"""
+    print(f"{'cases':>10} {'baseline ms':>12} {'engine ms':>10} {'speedup':>8}")
+    for n_cases in args.sizes:
+        vectors = synthetic_vectors(n_cases)
+        frame = synthetic_cases(n_cases)
+        store = CaseStore.from_frame(frame)
+        engine = ExactSearch(vectors)
+        queries = [vectors[i] for i in np.random.default_rng(1).integers(0, n_cases, args.queries)]
+
+        def baseline():
+            for query in queries:
+                similarities = cosine_similarity(query, vectors).flatten()
+                top_indices = similarities.argsort()[-args.top_k:][::-1]
+                for idx in top_indices:
+                    if similarities[idx] > 0:
+                        case = frame.iloc[idx]
+                        (case['gender'], int(case['age']), case['extracted_symptoms'], case['search_term'])
+
+        def optimised():
+            for query in queries:
+                top_indices, _ = engine.search(query, args.top_k)
+                store.records(top_indices)
+
+        base_ms = time_call(baseline, args.repeat) / len(queries)
+        engine_ms = time_call(optimised, args.repeat) / len(queries)
+        print(f"{n_cases:>10} {base_ms:>12.3f} {engine_ms:>10.3f} {base_ms / engine_ms:>7.1f}x")
+
+
+def bench_casestore(args):
+    """DataFrame memory and iloc lookups vs the columnar case store"""
+    print(f"{'cases':>10} {'frame MB':>9} {'store MB':>9} {'iloc ms':>8} {'store ms':>9} {'speedup':>8}")
+    for n_cases in args.sizes:
+        frame = synthetic_cases(n_cases)
+        store = CaseStore.from_frame(frame)
+        lookups = [np.random.default_rng(i).integers(0, n_cases, args.top_k) for i in range(args.queries)]
+
+        def baseline():
+            for indices in lookups:
+                for idx in indices:
+                    case = frame.iloc[idx]
+                    (case['gender'], int(case['age']), case['extracted_symptoms'], case['search_term'])
+
+        def columnar():
+            for indices in lookups:
+                store.records(indices)
+
+        frame_mb = frame.memory_usage(deep=True).sum() / 1e6
+        store_mb = store.nbytes / 1e6
+        base_ms = time_call(baseline, args.repeat) / len(lookups)
+        store_ms = time_call(columnar, args.repeat) / len(lookups)
+        print(f"{n_cases:>10} {frame_mb:>9.1f} {store_mb:>9.1f} {base_ms:>8.3f} {store_ms:>9.3f} {base_ms / store_ms:>7.1f}x")
+
+
+def _fit_clusterer(n_cases: int, fit_mode: str, queue):
+    """Fit one SymptomClusterer in a fresh process and report its time, peak RSS and labels"""
+    from models import SymptomClusterer
+    from summaries import parse_summaries
+
+    frame = synthetic_summaries(n_cases)
+    summaries = parse_summaries(frame['summary'])
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    clusterer = SymptomClusterer(fit_mode=fit_mode)
+    start = time.perf_counter()
+    clusterer.fit(frame, summaries)
+    seconds = time.perf_counter() - start
+    peak_mb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_kb) / 1024
+
+    # Silhouette (cosine) on a fixed sample keeps the quality check affordable
+    X = clusterer.vectorizer.transform([t for t in summaries.texts() if t.strip()])
+    labels = clusterer.kmeans.predict(X)
+    sample = np.random.default_rng(0).choice(X.shape[0], min(5000, X.shape[0]), replace=False)
+    silhouette = silhouette_score(X[sample], labels[sample], metric='cosine')
+    queue.put((seconds, peak_mb, float(silhouette), labels))
+
+
+def bench_clustering(args):
+    """SymptomClusterer fit modes: KMeans + dense PCA vs MiniBatchKMeans + TruncatedSVD on the sparse matrix"""
+    print(f"{'cases':>10} {'mode':>10} {'fit s':>8} {'peak +MB':>9} {'silhouette':>11} {'ARI vs full':>12}")
+    context = multiprocessing.get_context('spawn')
+    for n_cases in args.sizes:
+        results = {}
+        for fit_mode in ('full', 'minibatch'):
+            queue = context.Queue()
+            # Separate processes so each mode's peak RSS is measured on its own
+            worker = context.Process(target=_fit_clusterer, args=(n_cases, fit_mode, queue))
+            worker.start()
+            results[fit_mode] = queue.get()
+            worker.join()
+
+        for fit_mode, (seconds, peak_mb, silhouette, labels) in results.items():
+            agreement = adjusted_rand_score(results['full'][3], labels)
+            print(f"{n_cases:>10} {fit_mode:>10} {seconds:>8.2f} {peak_mb:>9.1f} {silhouette:>11.3f} {agreement:>12.3f}")
+
+
+def _previous_comprehensive(recommender, symptoms, age, gender):
+    """get_comprehensive_recommendations as it ran before: two transforms, per-request filtering"""
+    from indexes import get_age_group
+
+    text = ' '.join(symptoms)
+    classifier, clusterer = recommender.classifier, recommender.clusterer
+    probabilities = classifier.model.predict_proba(classifier.vectorizer.transform([text]))[0]
+    dict(sorted(zip(classifier.model.classes_, probabilities.tolist()), key=lambda x: x[1], reverse=True))
+    cluster_id = int(clusterer.kmeans.predict(clusterer.vectorizer.transform([text]))[0])
+    recommender.get_cluster_cases(cluster_id, limit=10)
+    recommender._find_similar_cases(symptoms, age, gender)
+
+    df = recommender.symptom_data
+    bounds = {label: (min_age, max_age) for label, min_age, max_age in recommender.age_buckets}
+    min_age, max_age = bounds[get_age_group(age, recommender.age_buckets)]
+    recommender._get_common_symptoms(df[(df['age'] >= min_age) & (df['age'] <= max_age)].index)
+    recommender._get_common_symptoms(df[df['gender'] == gender].index)
+
+
+def bench_comprehensive(args):
+    """SymptomRecommender.get_comprehensive_recommendations latency percentiles against the p95 budget"""
+    from models import SymptomRecommender
+
+    print(f"{'cases':>10} {'path':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'budget':>8}")
+    for n_cases in args.sizes:
+        frame = synthetic_summaries(n_cases)
+        recommender = SymptomRecommender(max_classes=args.max_classes)
+        recommender.train_models(frame)
+
+        rng = np.random.default_rng(1)
+        words = np.array(SYMPTOM_WORDS, dtype=object)
+        queries = [
+            (list(words[rng.integers(0, len(words), rng.integers(1, 4))]), int(rng.integers(1, 95)), str(rng.choice(['male', 'female'])))
+            for _ in range(args.queries)
+        ]
+
+        paths = {
+            'previous': lambda q: _previous_comprehensive(recommender, *q),
+            'current': lambda q: recommender.get_comprehensive_recommendations(*q)
+        }
+        for name, fn in paths.items():
+            fn(queries[0])  # warm-up
+            timings = []
+            for _ in range(args.repeat):
+                for query in queries:
+                    start = time.perf_counter()
+                    fn(query)
+                    timings.append((time.perf_counter() - start) * 1000)
+            p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+            verdict = 'ok' if p95 <= args.budget_ms else 'over'
+            print(f"{n_cases:>10} {name:>9} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f} {verdict:>8}")
+
+
+def bench_topk(args):
+    """Full sorted probability dict vs top-k extraction, and forest pruning's latency/accuracy trade-off"""
+    from models import SymptomClassifier
+    from summaries import parse_summaries
+
+    print(f"{'cases':>10} {'classes':>8} {'method':>22} {'ms/query':>9} {'top-1 agree':>12} {'accuracy':>9}")
+    for n_cases in args.sizes:
+        frame = synthetic_summaries(n_cases)
+        classifier = SymptomClassifier(max_classes=args.max_classes)
+        classifier.train(frame)
+
+        # Held-out style queries: fresh cases drawn from the same distribution
+        held_out = synthetic_summaries(args.queries, seed=1)
+        summaries = parse_summaries(held_out['summary'])
+        keep = summaries.has_symptoms()
+        queries = [text.split() for text, k in zip(summaries.texts(), keep) if k]
+        truth = classifier.bound_labels(summaries.primary_symptoms()[keep])
+        reference = [next(iter(classifier.predict(q))) for q in queries]
+
+        methods = {
+            'predict (full dict)': (lambda q: classifier.predict(q), None),
+            'predict_top_k k=3': (lambda q: classifier.predict_top_k(q, 3), {}),
+            'max_trees=25': (lambda q: classifier.predict_top_k(q, 3, max_trees=25), {'max_trees': 25}),
+            'max_depth=12': (lambda q: classifier.predict_top_k(q, 3, max_depth=12), {'max_depth': 12}),
+            'max_trees=25 depth=12': (lambda q: classifier.predict_top_k(q, 3, max_trees=25, max_depth=12),
+                                      {'max_trees': 25, 'max_depth': 12})
+        }
+        for name, (fn, options) in methods.items():
+            ms = time_call(lambda: [fn(q) for q in queries], args.repeat) / len(queries)
+            if options is None:
+                top1 = reference
+            else:
+                top1 = [next(iter(p)) for p in classifier.predict_top_k_batch(queries, 1, **options)]
+            agree = np.mean([a == b for a, b in zip(top1, reference)])
+            accuracy = np.mean([a == b for a, b in zip(top1, truth)])
+            print(f"{n_cases:>10} {len(classifier.classes):>8} {name:>22} {ms:>9.3f} {agree:>12.3f} {accuracy:>9.3f}")
+
+        batch_ms = time_call(lambda: classifier.predict_top_k_batch(queries, 3), args.repeat) / len(queries)
+        print(f"{n_cases:>10} {len(classifier.classes):>8} {'predict_top_k_batch':>22} {batch_ms:>9.3f} {1.0:>12.3f} {'':>9}")
+
+
+def bench_hashing(args):
+    """Vocabulary TF-IDF vs feature hashing: fit time, fitted state size and query vectorisation"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from hashing import HashingTfidfVectorizer
+    from models import QueryEncoder
+    from summaries import parse_summaries
+
+    # The app.py settings, plus the two models' featurisations behind one query
+    params = {'max_features': 1000, 'ngram_range': (1, 2), 'min_df': 2}
+    n_workers = os.cpu_count() or 1
+    print(f"{'cases':>10} {'mode':>18} {'fit s':>7} {'state MB':>9} {'encode us':>10}")
+    for n_cases in args.sizes:
+        frame = synthetic_summaries(n_cases, n_words=args.vocabulary)
+        texts = parse_summaries(frame['summary']).texts()
+        queries = texts[:args.queries]
+
+        modes = {
+            'tfidf': lambda: TfidfVectorizer(**params),
+            'hashing': lambda: HashingTfidfVectorizer(**params, n_jobs=1),
+            f'hashing {n_workers} procs': lambda: HashingTfidfVectorizer(**params, n_jobs=-1,
+                                                                       chunk_size=-(-n_cases // n_workers))
+        }
+        for name, make in modes.items():
+            vectorizer = make()
+            start = time.perf_counter()
+            vectorizer.fit_transform(texts)
+            seconds = time.perf_counter() - start
+            state_mb = len(pickle.dumps(vectorizer)) / 1e6
+
+            if name == 'tfidf':
+                models = [TfidfVectorizer(max_features=500, ngram_range=(1, 2)), TfidfVectorizer(max_features=300)]
+            else:
+                models = [HashingTfidfVectorizer(max_features=500, n_jobs=1), HashingTfidfVectorizer(max_features=300, n_jobs=1)]
+            encoder = QueryEncoder([model.fit(texts) for model in models])
+            encode_us = time_call(lambda: [encoder.encode(q) for q in queries], args.repeat) / len(queries) * 1000
+            print(f"{n_cases:>10} {name:>18} {seconds:>7.2f} {state_mb:>9.2f} {encode_us:>10.1f}")
+
+
+def bench_tokenizer(args):
+    """Default token_pattern vs the Thai dictionary tokenizer: vocabulary size, fit time and transform throughput"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from tokenization import build_tokenizer, with_tokenizer
+
+    params = {'ngram_range': (1, 2)}
+    terms = synthetic_thai_terms(args.vocabulary)
+    print(f"{'cases':>10} {'tokenizer':>10} {'vocabulary':>11} {'fit s':>7} {'transform docs/s':>17}")
+    for n_cases in args.sizes:
+        texts, symptom_texts = synthetic_thai_texts(n_cases, terms)
+        queries, _ = synthetic_thai_texts(max(1000, args.queries), terms, seed=1)
+
+        for name in ('', 'thai'):
+            start = time.perf_counter()
+            # Building the dictionary is part of fitting with the Thai tokenizer
+            vectorizer = TfidfVectorizer(**with_tokenizer(params, build_tokenizer(name, symptom_texts)))
+            vectorizer.fit_transform(texts)
+            seconds = time.perf_counter() - start
+            per_doc_ms = time_call(lambda: vectorizer.transform(queries), args.repeat) / len(queries)
+            print(f"{n_cases:>10} {name or 'default':>10} {len(vectorizer.vocabulary_):>11} "
+                  f"{seconds:>7.2f} {1000 / per_doc_ms:>17.0f}")
+
+
+BENCHMARKS = {
+    'similarity': bench_similarity,
+    'casestore': bench_casestore,
+    'clustering': bench_clustering,
+    'comprehensive': bench_comprehensive,
+    'topk': bench_topk,
+    'hashing': bench_hashing,
+    'tokenizer': bench_tokenizer
+}
+
+
+def main():
+    """Parse arguments and run the selected benchmark"""
+    parser = argparse.ArgumentParser(description="Symptom Recommendation System benchmarks")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-classes', type=int, default=50,
+                        help="classifier label bound for the comprehensive and topk benchmarks")
+    parser.add_argument('--vocabulary', type=int, default=200000,
+                        help="distinct symptom words in the hashing and tokenizer benchmarks' corpora")
+    parser.add_argument('--budget-ms', type=float, default=25.0,
+                        help="p95 budget of POST /recommend/comprehensive (COMPREHENSIVE_P95_BUDGET_MS)")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"Benchmark: {args.benchmark}")
+    print("=" * 60)
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
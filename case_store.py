@@ -0,0 +1,127 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Any
+from storage import StringColumn, save_array, load_array
+
+# Gender code for missing / unparseable values
+UNKNOWN_GENDER = 255
+
+
+class CaseStore:
+    """Columnar per-case metadata served in API responses
+
+    Gender is integer-coded, ages are uint8 whenever they fit, and symptom /
+    search-term strings are interned so each distinct combination is stored once.
+    """
+
+    def __init__(self,
+                 gender_codes: np.ndarray,
+                 gender_labels: List[str],
+                 ages: np.ndarray,
+                 symptoms: StringColumn,
+                 search_terms: StringColumn):
+        self.gender_codes = gender_codes
+        self.gender_labels = list(gender_labels)
+        self.ages = ages
+        self.symptoms = symptoms
+        self.search_terms = search_terms
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'CaseStore':
+        """Build the store from the preprocessed case columns"""
+        genders = pd.Categorical(df['gender'])
+        codes = genders.codes.astype(np.int16)
+        codes[codes < 0] = UNKNOWN_GENDER
+
+        ages = df['age'].to_numpy(dtype=np.int64)
+        age_dtype = np.uint8 if len(ages) == 0 or (ages.min() >= 0 and ages.max() <= 255) else np.int32
+
+        return cls(
+            gender_codes=codes.astype(np.uint8),
+            gender_labels=[str(label) for label in genders.categories],
+            ages=ages.astype(age_dtype),
+            symptoms=StringColumn.from_values(df['extracted_symptoms'], intern=True),
+            search_terms=StringColumn.from_values(df['search_term'], intern=True)
+        )
+
+    def __len__(self) -> int:
+        return len(self.ages)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the store's arrays"""
+        return (self.gender_codes.nbytes + self.ages.nbytes +
+                self.symptoms.nbytes + self.search_terms.nbytes)
+
+    def gender(self, idx: int):
+        """Gender label of a case"""
+        code = self.gender_codes[idx]
+        return None if code == UNKNOWN_GENDER else self.gender_labels[code]
+
+    def record(self, idx: int) -> Dict[str, Any]:
+        """Fields of one case as served by the API"""
+        return {
+            'gender': self.gender(idx),
+            'age': int(self.ages[idx]),
+            'symptoms': self.symptoms[idx],
+            'search_terms': self.search_terms[idx]
+        }
+
+    def records(self, indices: np.ndarray) -> List[Dict[str, Any]]:
+        """Fields of several cases, gathering the numeric columns in one go"""
+        indices = np.asarray(indices, dtype=np.int64)
+        codes = self.gender_codes[indices].tolist()
+        ages = self.ages[indices].tolist()
+        labels = self.gender_labels + [None] * (UNKNOWN_GENDER + 1 - len(self.gender_labels))
+        return [
+            {
+                'gender': labels[code],
+                'age': age,
+                'symptoms': self.symptoms[idx],
+                'search_terms': self.search_terms[idx]
+            }
+            for idx, code, age in zip(indices.tolist(), codes, ages)
+        ]
+
+    def gender_counts(self) -> Dict[str, int]:
+        """Case count per gender, most common first"""
+        counts = np.bincount(self.gender_codes, minlength=len(self.gender_labels))[:len(self.gender_labels)]
+        order = np.argsort(-counts, kind='stable')
+        return {self.gender_labels[i]: int(counts[i]) for i in order if counts[i] > 0}
+
+    def to_frame(self) -> pd.DataFrame:
+        """The case columns as a DataFrame, e.g. to refit the model from served data"""
+        labels = np.array(self.gender_labels + [None], dtype=object)
+        codes = np.where(self.gender_codes == UNKNOWN_GENDER, len(self.gender_labels), self.gender_codes)
+        return pd.DataFrame({
+            'gender': labels[codes],
+            'age': np.asarray(self.ages, dtype=np.int64),
+            'search_term': list(self.search_terms),
+            'extracted_symptoms': list(self.symptoms)
+        })
+
+    def save(self, directory: str):
+        """Write every column as flat arrays under directory"""
+        os.makedirs(directory, exist_ok=True)
+        save_array(directory, 'gender_codes', self.gender_codes)
+        save_array(directory, 'ages', self.ages)
+        self.symptoms.save(directory, 'symptoms')
+        self.search_terms.save(directory, 'search_terms')
+        with open(os.path.join(directory, 'gender_labels.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.gender_labels, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'CaseStore':
+        """Open a store written by save(), memory-mapped by default"""
+        with open(os.path.join(directory, 'gender_labels.json'), encoding='utf-8') as f:
+            gender_labels = json.load(f)
+
+        return cls(
+            gender_codes=load_array(directory, 'gender_codes', mmap),
+            gender_labels=gender_labels,
+            ages=load_array(directory, 'ages', mmap),
+            symptoms=StringColumn.load(directory, 'symptoms', mmap),
+            search_terms=StringColumn.load(directory, 'search_terms', mmap)
+        )
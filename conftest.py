@@ -0,0 +1,47 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+
+# Symptom words of the fixture data; the README examples ("ไอ", "เสมหะ", "pain", "fever") are among them
+FIXTURE_SYMPTOMS = ['ไอ', 'เสมหะ', 'ไข้', 'ปวดหัว', 'เจ็บคอ', 'น้ำมูกไหล', 'ปวดท้อง', 'ท้องเสีย',
+                    'ผื่น', 'คลื่นไส้', 'pain', 'fever', 'cough', 'headache']
+
+
+def fixture_cases(n_cases: int = 400, seed: int = 0) -> pd.DataFrame:
+    """Cases shaped like ai_symptom_picker.csv: gender, age, summary JSON and search_term"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(n_cases):
+        symptoms = list(rng.choice(FIXTURE_SYMPTOMS, rng.integers(1, 4), replace=False))
+        search = list(rng.choice(symptoms, rng.integers(1, len(symptoms) + 1), replace=False))
+        rows.append({
+            'gender': str(rng.choice(['male', 'female'])),
+            'age': int(rng.integers(1, 95)),
+            'summary': json.dumps({'yes_symptoms': [{'text': s, 'answers': []} for s in symptoms]},
+                                  ensure_ascii=False),
+            'search_term': ', '.join(search)
+        })
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture(scope='session')
+def sample_csv(tmp_path_factory):
+    path = tmp_path_factory.mktemp('data') / 'cases.csv'
+    fixture_cases().to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture
+def api(sample_csv, tmp_path, monkeypatch):
+    """The app module configured for the fixture CSV: no disk caches, no comprehensive models"""
+    import app
+    monkeypatch.setattr(app, 'DATA_FILE', str(sample_csv))
+    monkeypatch.setattr(app, 'ARTIFACT_DIR', '')
+    monkeypatch.setattr(app, 'SHARED_STATE_DIR', '')
+    monkeypatch.setattr(app, 'MODELS_DIR', str(tmp_path / 'models'))
+    monkeypatch.setattr(app, 'RELOAD_POLL_SECONDS', 0)
+    monkeypatch.setattr(app, 'ADMIN_TOKEN', 'test-token')
+    monkeypatch.setattr(app, 'ingest_log', app.IngestLog())
+    app.result_cache.clear()
+    return app
@@ -0,0 +1,138 @@
+import bisect
+import time
+import pandas as pd
+from scipy import sparse
+from typing import Any, Dict, List, Tuple
+from case_store import CaseStore
+from ingest import SERVED_COLUMNS, combined_texts
+from retrieval import ExactSearch, merge_hits
+
+
+class DeltaBlock:
+    """A run of consecutive delta rows; its case store and search engine are built on first use"""
+
+    def __init__(self, start: int, frame: pd.DataFrame, vectors: sparse.csr_matrix):
+        self.start = start  # Position of the first row within the delta segment
+        self.frame = frame
+        self.vectors = vectors
+        self._cases = None
+        self._engine = None
+
+    @classmethod
+    def merged(cls, blocks: List['DeltaBlock']) -> 'DeltaBlock':
+        """One block holding the rows of consecutive blocks"""
+        frame = pd.concat([block.frame for block in blocks], ignore_index=True)
+        vectors = sparse.vstack([block.vectors for block in blocks], format='csr')
+        return cls(blocks[0].start, frame, vectors)
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    @property
+    def cases(self) -> CaseStore:
+        # Racing threads may both build it; either result is the same
+        if self._cases is None:
+            self._cases = CaseStore.from_frame(self.frame)
+        return self._cases
+
+    @property
+    def engine(self) -> ExactSearch:
+        if self._engine is None:
+            self._engine = ExactSearch(self.vectors)
+        return self._engine
+
+
+class DeltaSegment:
+    """Cases ingested since the last full build, searched next to the main matrix
+
+    Rows are vectorised with the already-fitted vocabulary and IDF, so their scores
+    are directly comparable with the main segment's. Segments are append-only:
+    appended() returns a new segment and leaves this one untouched. The rows are
+    kept in blocks whose sizes shrink towards the end; an append merges trailing
+    blocks no larger than the new one, like carries in a binary counter. Each row
+    is thus copied O(log n) times over a run of ingests, and a search visits
+    O(log n) blocks.
+    """
+
+    def __init__(self, offset: int, blocks: List[DeltaBlock], created_at: float):
+        self.offset = offset  # Case id of the first delta row (= number of main cases)
+        self.blocks = blocks
+        self.created_at = created_at
+        self.starts = [block.start for block in blocks]
+
+    @classmethod
+    def create(cls, offset: int, frame: pd.DataFrame, vectorizer) -> 'DeltaSegment':
+        """First segment after a full build"""
+        return cls(offset, [cls._block(0, frame, vectorizer)], time.time())
+
+    @staticmethod
+    def _block(start: int, frame: pd.DataFrame, vectorizer) -> DeltaBlock:
+        frame = frame[SERVED_COLUMNS].reset_index(drop=True)
+        return DeltaBlock(start, frame, vectorizer.transform(combined_texts(frame)))
+
+    def appended(self, frame: pd.DataFrame, vectorizer) -> 'DeltaSegment':
+        """New segment holding this segment's cases followed by frame's"""
+        blocks = list(self.blocks)
+        block = self._block(len(self), frame, vectorizer)
+        while blocks and len(blocks[-1]) <= len(block):
+            block = DeltaBlock.merged([blocks.pop(), block])
+        blocks.append(block)
+        return DeltaSegment(self.offset, blocks, self.created_at)
+
+    def __len__(self) -> int:
+        last = self.blocks[-1]
+        return last.start + len(last)
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """All delta rows as one frame (for compaction)"""
+        return pd.concat([block.frame for block in self.blocks], ignore_index=True)
+
+    def record(self, position: int) -> Dict[str, Any]:
+        """Served fields of the delta row at position"""
+        block = self.blocks[bisect.bisect_right(self.starts, position) - 1]
+        return block.cases.record(position - block.start)
+
+    def search(self, query_vector, top_k: int, min_score: float = 0.0) -> Tuple:
+        """Exact search over the delta rows, returning global case ids"""
+        hits = []
+        for block in self.blocks:
+            indices, scores = block.engine.search(query_vector, top_k, min_score)
+            hits.append((indices + self.offset + block.start, scores))
+        return merge_hits(hits, top_k)
+
+    def search_batch(self, query_vectors, top_k: int, min_score: float = 0.0) -> List[Tuple]:
+        """search() for every query row"""
+        per_block = [
+            [(indices + self.offset + block.start, scores)
+             for indices, scores in block.engine.search_batch(query_vectors, top_k, min_score)]
+            for block in self.blocks
+        ]
+        return [merge_hits(list(hits), top_k) for hits in zip(*per_block)]
+
+
+class IngestLog:
+    """Every case ingested since startup, in case id order
+
+    Compaction empties the delta segment into the main one, but a rebuild from
+    DATA_FILE knows nothing of either, so it replays this log instead. Only touched
+    under the snapshot manager's update lock.
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self.rows = 0
+
+    def append(self, frame: pd.DataFrame):
+        """Record frame's cases after all earlier ones"""
+        self.blocks.append(frame[SERVED_COLUMNS].reset_index(drop=True))
+        self.rows += len(frame)
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def frame(self) -> pd.DataFrame:
+        """All logged cases as one frame"""
+        if not self.blocks:
+            return pd.DataFrame(columns=SERVED_COLUMNS)
+        return pd.concat(self.blocks, ignore_index=True)
@@ -0,0 +1,140 @@
+import numpy as np
+from typing import Optional
+from storage import save_array, load_array
+
+# Node arrays of every tree, concatenated; child indices are global and a leaf's
+# children point back at the leaf itself, so a traversal step never needs a mask
+FOREST_ARRAYS = ('roots', 'children_left', 'children_right', 'feature', 'threshold', 'probabilities')
+
+# Upper bound on the (rows, trees, classes) block gathered at once by predict_proba
+ACCUMULATE_BLOCK = 1 << 22
+
+
+def top_k_columns(scores: np.ndarray, k: int) -> np.ndarray:
+    """Columns of each row's k largest scores, best first, ties in column order
+
+    The same columns as the first k of a stable descending sort, found with
+    argpartition instead of sorting whole rows.
+    """
+    n_rows, n_cols = scores.shape
+    k = min(k, n_cols)
+    if k <= 0:
+        return np.empty((n_rows, 0), dtype=np.int64)
+
+    kth = np.take_along_axis(scores, np.argpartition(-scores, k - 1, axis=1)[:, k - 1:k], axis=1)
+    above = scores > kth
+    # Of the scores tied with the k-th, keep as many as still fit, leftmost first
+    ties = scores == kth
+    ties &= np.cumsum(ties, axis=1) <= k - above.sum(axis=1, keepdims=True)
+    columns = np.nonzero(above | ties)[1].reshape(n_rows, k)
+
+    order = np.argsort(-np.take_along_axis(scores, columns, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(columns, order, axis=1)
+
+
+class ForestArrays:
+    """A fitted random forest as flat node arrays, predicted without the sklearn tree objects
+
+    The arrays can be memory-mapped straight from .npy files, so loading is
+    near-instant and processes serving the same model share the pages.
+    predict_proba reproduces RandomForestClassifier.predict_proba exactly.
+    """
+
+    def __init__(self,
+                 roots: np.ndarray,
+                 children_left: np.ndarray,
+                 children_right: np.ndarray,
+                 feature: np.ndarray,
+                 threshold: np.ndarray,
+                 probabilities: np.ndarray):
+        self.roots = roots
+        self.children_left = children_left
+        self.children_right = children_right
+        self.feature = feature
+        self.threshold = threshold
+        self.probabilities = probabilities
+
+    @classmethod
+    def from_estimator(cls, forest) -> 'ForestArrays':
+        """Flatten a fitted single-output RandomForestClassifier"""
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        sizes = np.array([tree.node_count for tree in trees], dtype=np.int64)
+        roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+
+        def children(tree, root, side):
+            child = getattr(tree, side).astype(np.int64)
+            return np.where(child >= 0, child + root, np.arange(tree.node_count) + root)
+
+        # Per-node class distribution, normalised exactly as DecisionTreeClassifier.predict_proba
+        values = [tree.value[:, 0, :] for tree in trees]
+        probabilities = []
+        for value in values:
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            probabilities.append(value / normalizer)
+
+        return cls(
+            roots=roots,
+            children_left=np.concatenate([children(t, r, 'children_left') for t, r in zip(trees, roots)]),
+            children_right=np.concatenate([children(t, r, 'children_right') for t, r in zip(trees, roots)]),
+            feature=np.concatenate([np.maximum(t.feature, 0) for t in trees]).astype(np.int32),
+            threshold=np.concatenate([t.threshold for t in trees]),
+            probabilities=np.concatenate(probabilities)
+        )
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def apply(self, X, max_trees: Optional[int] = None, max_depth: Optional[int] = None) -> np.ndarray:
+        """Node reached in each of the first max_trees trees, shape (n_samples, n_trees)
+
+        Without max_depth that is the leaf; with it, traversal stops after
+        max_depth levels, possibly at an internal node.
+        """
+        # sklearn compares float32 feature values against float64 thresholds
+        features = np.asarray(X.astype(np.float32).toarray() if hasattr(X, 'toarray') else X, dtype=np.float32)
+        rows = np.arange(features.shape[0])[:, np.newaxis]
+        roots = self.roots[:max_trees]
+        nodes = np.broadcast_to(roots, (features.shape[0], len(roots)))
+
+        # One level of every tree per step; finished once no sample moves
+        depth = 0
+        while max_depth is None or depth < max_depth:
+            go_left = features[rows, self.feature[nodes]] <= self.threshold[nodes]
+            step = np.where(go_left, self.children_left[nodes], self.children_right[nodes])
+            if np.array_equal(step, nodes):
+                break
+            nodes = step
+            depth += 1
+        return nodes
+
+    def predict_proba(self, X, max_trees: Optional[int] = None, max_depth: Optional[int] = None) -> np.ndarray:
+        """Class probabilities averaged over the trees, shape (n_samples, n_classes)
+
+        By default identical to the forest's predict_proba. max_trees (use only the
+        first trees) and max_depth (stop early and use the internal node's class
+        distribution) trade accuracy for latency.
+        """
+        if max_trees is not None and max_trees < 1:
+            raise ValueError("max_trees must be at least 1")
+        nodes = self.apply(X, max_trees, max_depth)
+        n_samples, n_trees = nodes.shape
+        proba = np.empty((n_samples, self.probabilities.shape[1]), dtype=np.float64)
+        # Summing over the tree axis adds the trees one by one, in the same order (and so
+        # with the same rounding) as sklearn; rows go in blocks to bound the gathered copy
+        block = max(1, ACCUMULATE_BLOCK // max(1, n_trees * self.probabilities.shape[1]))
+        for start in range(0, n_samples, block):
+            proba[start:start + block] = self.probabilities[nodes[start:start + block]].sum(axis=1)
+        proba /= n_trees
+        return proba
+
+    def save(self, directory: str):
+        """Write every node array as a .npy file"""
+        for name in FOREST_ARRAYS:
+            save_array(directory, f"forest.{name}", getattr(self, name))
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'ForestArrays':
+        """Open a forest written by save(), memory-mapped by default"""
+        return cls(**{name: load_array(directory, f"forest.{name}", mmap) for name in FOREST_ARRAYS})
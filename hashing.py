@@ -0,0 +1,229 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy import sparse
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+from sklearn.utils import murmurhash3_32
+from sklearn.utils.validation import check_is_fitted
+from typing import Callable, Iterable, List, Optional, Tuple
+
+# Hashed feature space shared by every component in hashing mode: a term maps to the
+# same column everywhere, so one hashed query row can be weighted for all of them
+HASHING_FEATURES = 1 << 20
+HASHING_NGRAM_RANGE = (1, 2)
+
+# Fitted state of a HashingTfidfVectorizer, kept as flat arrays
+HASHED_ARRAYS = ('columns_', 'idf_')
+
+
+def hash_terms(terms: Iterable[str], n_features: int) -> List[int]:
+    """Column of each term, as FeatureHasher computes it, without building a matrix"""
+    columns = []
+    for term in terms:
+        h = murmurhash3_32(term, seed=0)
+        # FeatureHasher's value for abs(-2**31) % n_features
+        columns.append((2147483647 - (n_features - 1)) % n_features if h == -2147483648 else abs(h) % n_features)
+    return columns
+
+
+def select_features(term_counts: np.ndarray,
+                    doc_counts: np.ndarray,
+                    n_docs: int,
+                    min_df=1,
+                    max_df=1.0,
+                    max_features: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Positions kept by TfidfVectorizer's min_df / max_df / max_features pruning, and their IDF
+
+    term_counts and doc_counts are corpus-wide counts in feature order (sorted terms,
+    or hashed columns); the positions come back in that order.
+    """
+    low = min_df if isinstance(min_df, (int, np.integer)) else min_df * n_docs
+    high = max_df if isinstance(max_df, (int, np.integer)) else max_df * n_docs
+    positions = np.flatnonzero((doc_counts >= max(low, 1)) & (doc_counts <= high))
+    if max_features is not None and len(positions) > max_features:
+        # Same selection as CountVectorizer._limit_features, so a vocabulary matches a one-shot fit
+        positions = np.sort(positions[(-term_counts[positions]).argsort()[:max_features]])
+    if len(positions) == 0:
+        raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+
+    # Smoothed IDF exactly as TfidfTransformer computes it
+    idf = np.log((n_docs + 1) / (doc_counts[positions] + 1.0)) + 1
+    return positions, idf
+
+
+class TermStatistics:
+    """Document count plus per-column term and document frequencies of a hashed corpus
+
+    Statistics of disjoint shards add up to those of the whole corpus.
+    """
+
+    def __init__(self, n_docs: int, term_counts: np.ndarray, doc_counts: np.ndarray):
+        self.n_docs = n_docs
+        self.term_counts = term_counts
+        self.doc_counts = doc_counts
+
+    @classmethod
+    def from_counts(cls, counts: sparse.csr_matrix) -> 'TermStatistics':
+        """Statistics of a hashed count matrix (one row per document)"""
+        n_features = counts.shape[1]
+        term_counts = np.bincount(counts.indices, weights=counts.data, minlength=n_features)
+        return cls(counts.shape[0],
+                   np.rint(term_counts).astype(np.int64),
+                   np.bincount(counts.indices, minlength=n_features).astype(np.int64))
+
+    def __add__(self, other: 'TermStatistics') -> 'TermStatistics':
+        return TermStatistics(self.n_docs + other.n_docs,
+                              self.term_counts + other.term_counts,
+                              self.doc_counts + other.doc_counts)
+
+
+def _shard_counts(hasher: HashingVectorizer, texts: List[str]) -> sparse.csr_matrix:
+    if not texts:
+        return sparse.csr_matrix((0, hasher.n_features), dtype=np.float64)
+    return hasher.transform(texts)
+
+
+def _shard_statistics(hasher: HashingVectorizer, texts: List[str]) -> TermStatistics:
+    return TermStatistics.from_counts(_shard_counts(hasher, texts))
+
+
+class HashingTfidfVectorizer(TransformerMixin, BaseEstimator):
+    """TF-IDF over hashed features: no vocabulary dict, and fitted in parallel shards
+
+    Terms are hashed into n_features columns (HashingVectorizer), so fitting only
+    accumulates per-column statistics, which shards compute independently and add
+    up. min_df / max_df / max_features then select hashed columns the way
+    TfidfVectorizer selects terms, and the IDF is smoothed as TfidfTransformer's.
+    Memory is O(n_features) whatever the vocabulary size; the price is the odd hash
+    collision and feature names that must be recovered from text (resolve_feature_names).
+    """
+
+    def __init__(self,
+                 n_features: int = HASHING_FEATURES,
+                 ngram_range=HASHING_NGRAM_RANGE,
+                 lowercase: bool = True,
+                 token_pattern: Optional[str] = r"(?u)\b\w\w+\b",
+                 tokenizer: Optional[Callable[[str], List[str]]] = None,
+                 stop_words=None,
+                 min_df=1,
+                 max_df=1.0,
+                 max_features: Optional[int] = None,
+                 n_jobs: Optional[int] = -1,
+                 chunk_size: int = 50000):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.lowercase = lowercase
+        self.token_pattern = token_pattern
+        self.tokenizer = tokenizer
+        self.stop_words = stop_words
+        self.min_df = min_df
+        self.max_df = max_df
+        self.max_features = max_features
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+
+    def hashing_params(self) -> tuple:
+        """Settings that decide the hashed columns; equal tuples mean one shared feature space"""
+        return (self.n_features, tuple(self.ngram_range), self.lowercase, self.token_pattern,
+                repr(self.tokenizer), repr(self.stop_words))
+
+    def hasher(self) -> HashingVectorizer:
+        """The stateless hasher producing raw term counts"""
+        return HashingVectorizer(n_features=self.n_features, ngram_range=tuple(self.ngram_range),
+                                 lowercase=self.lowercase, token_pattern=self.token_pattern,
+                                 tokenizer=self.tokenizer, stop_words=self.stop_words, alternate_sign=False, norm=None)
+
+    def _map_shards(self, fn: Callable, texts: Iterable[str]) -> list:
+        """fn(hasher, shard) per chunk of texts, across worker processes (n_jobs=-1: one per CPU)"""
+        texts = list(texts)
+        hasher = self.hasher()
+        n_workers = (os.cpu_count() or 1) if self.n_jobs is None or self.n_jobs < 0 else self.n_jobs
+        if n_workers <= 1 or len(texts) <= self.chunk_size:
+            return [fn(hasher, texts)]
+
+        starts = range(0, len(texts), self.chunk_size)
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            return list(pool.map(fn, [hasher] * len(starts), [texts[start:start + self.chunk_size] for start in starts]))
+
+    def statistics(self, texts: Iterable[str]) -> TermStatistics:
+        """Corpus statistics of texts, accumulated shard by shard"""
+        parts = self._map_shards(_shard_statistics, texts)
+        total = parts[0]
+        for part in parts[1:]:
+            total = total + part
+        return total
+
+    def fit_statistics(self, statistics: TermStatistics) -> 'HashingTfidfVectorizer':
+        """Select the columns and compute the IDF from (possibly merged) statistics"""
+        self.columns_, self.idf_ = select_features(statistics.term_counts, statistics.doc_counts, statistics.n_docs,
+                                                   self.min_df, self.max_df, self.max_features)
+        self.__dict__.pop('feature_names_', None)
+        return self
+
+    def fit(self, texts: Iterable[str], y=None) -> 'HashingTfidfVectorizer':
+        return self.fit_statistics(self.statistics(texts))
+
+    def fit_transform(self, texts: Iterable[str], y=None) -> sparse.csr_matrix:
+        parts = self._map_shards(_shard_counts, texts)
+        statistics = TermStatistics.from_counts(parts[0])
+        for part in parts[1:]:
+            statistics = statistics + TermStatistics.from_counts(part)
+        self.fit_statistics(statistics)
+        return sparse.vstack([self.weight(part) for part in parts], format='csr')
+
+    def transform(self, texts: Iterable[str]) -> sparse.csr_matrix:
+        check_is_fitted(self, 'idf_')
+        parts = self._map_shards(_shard_counts, texts)
+        return sparse.vstack([self.weight(part) for part in parts], format='csr')
+
+    def weight(self, counts: sparse.csr_matrix) -> sparse.csr_matrix:
+        """TF-IDF rows (l2-normalised) from hashed counts, restricted to the selected columns"""
+        counts = sparse.csr_matrix(counts)
+        positions = np.minimum(np.searchsorted(self.columns_, counts.indices), len(self.columns_) - 1)
+        keep = self.columns_[positions] == counts.indices
+        # Hashed indices are sorted within each row, and so are their positions
+        indptr = np.concatenate([[0], np.cumsum(keep)])[counts.indptr]
+        X = sparse.csr_matrix(
+            (counts.data[keep] * self.idf_[positions[keep]], positions[keep].astype(np.int32), indptr),
+            shape=(counts.shape[0], len(self.columns_))
+        )
+        return normalize(X, copy=False) if X.shape[0] else X
+
+    def resolve_feature_names(self, texts: Iterable[str], batch_size: int = 1000) -> 'HashingTfidfVectorizer':
+        """Name each selected column after the first term of texts that hashes to it
+
+        Scans texts only until every column is named, holding one batch of distinct
+        terms at a time rather than a vocabulary.
+        """
+        check_is_fitted(self, 'idf_')
+        texts = list(texts)
+        analyzer = self.hasher().build_analyzer()
+        term_hasher = FeatureHasher(n_features=self.n_features, input_type='string', alternate_sign=False)
+        names = np.full(len(self.columns_), None, dtype=object)
+        missing = len(names)
+
+        for start in range(0, len(texts), batch_size):
+            terms = list(dict.fromkeys(term for text in texts[start:start + batch_size] for term in analyzer(text)))
+            if not terms:
+                continue
+            # One term per row, so the row's only index is the term's column
+            indices = term_hasher.transform([[term] for term in terms]).indices
+            positions = np.minimum(np.searchsorted(self.columns_, indices), len(self.columns_) - 1)
+            for i in np.flatnonzero(self.columns_[positions] == indices).tolist():
+                if names[positions[i]] is None:
+                    names[positions[i]] = terms[i]
+                    missing -= 1
+            if missing == 0:
+                break
+
+        self.feature_names_ = names
+        return self
+
+    def get_feature_names_out(self, input_features=None) -> np.ndarray:
+        """Names from resolve_feature_names (None for a column no text hashed to)"""
+        if not hasattr(self, 'feature_names_'):
+            raise ValueError("Hashed columns have no names; call resolve_feature_names(texts) first")
+        return self.feature_names_
@@ -0,0 +1,362 @@
+import os
+import numpy as np
+from scipy import sparse
+from typing import Callable, List, Dict, Iterable, Tuple, Optional
+from storage import StringColumn, save_array, load_array, save_csr, load_csr, save_csc, load_csc
+
+# (label, min_age, max_age); both ends are inclusive when selecting cases
+DEFAULT_AGE_BUCKETS = [
+    ('young', 0, 30),
+    ('middle', 30, 60),
+    ('elderly', 60, 120)
+]
+
+# Ages outside 0..MAX_AGE are clipped in DatasetStats' histogram (and rejected by POST /cases)
+MAX_AGE = 150
+
+
+def parse_age_buckets(spec: str) -> List[Tuple[str, int, int]]:
+    """Parse an age bucket spec such as 'young:0-30,middle:30-60,elderly:60-120'"""
+    if not spec or not spec.strip():
+        return list(DEFAULT_AGE_BUCKETS)
+
+    buckets = []
+    for part in spec.split(','):
+        try:
+            label, bounds = part.strip().split(':')
+            min_age, max_age = (int(b) for b in bounds.split('-'))
+        except ValueError:
+            raise ValueError(f"Invalid age bucket '{part.strip()}', expected label:min-max")
+        if min_age > max_age:
+            raise ValueError(f"Invalid age bucket '{part.strip()}', min is greater than max")
+        buckets.append((label.strip(), min_age, max_age))
+
+    return sorted(buckets, key=lambda b: b[1])
+
+
+def get_age_group(age: int, buckets: List[Tuple[str, int, int]] = DEFAULT_AGE_BUCKETS) -> str:
+    """Map an age to its bucket label (upper bound exclusive, last bucket open-ended)"""
+    for label, _, max_age in buckets[:-1]:
+        if age < max_age:
+            return label
+    return buckets[-1][0]
+
+
+def _pad_csr(matrix: sparse.csr_matrix, shape: Tuple[int, int]) -> sparse.csr_matrix:
+    """CSR matrix grown to shape with empty rows / columns, sharing the original arrays"""
+    extra_rows = shape[0] - matrix.shape[0]
+    indptr = matrix.indptr
+    if extra_rows > 0:
+        indptr = np.concatenate([indptr, np.full(extra_rows, indptr[-1], dtype=indptr.dtype)])
+    return sparse.csr_matrix((matrix.data, matrix.indices, indptr), shape=shape, copy=False)
+
+
+class SymptomIndex:
+    """Precomputed symptom token statistics for pattern analysis"""
+    # สร้างครั้งเดียวตอนโหลดข้อมูล แทนการวน iterrows() ทุก request
+
+    def __init__(self, tokenizer: Optional[Callable[[str], List[str]]] = None):
+        # Splits case texts and query symptoms into tokens (default: whitespace)
+        self.tokenizer = tokenizer
+        self.vocabulary = {}
+        self.tokens = np.array([], dtype=object)
+        self.token_counts = np.array([], dtype=np.int64)
+        self.case_counts = None
+        self.case_tokens = None
+        self.postings = None
+        self.cooccurrence = None
+        # Cases appended after the build (see extended()); None until the first append
+        self.delta_counts = None
+        self.delta_tokens = None
+        self.is_built = False
+
+    def tokenize(self, text: str) -> List[str]:
+        """Tokens of one text"""
+        return self.tokenizer(text) if self.tokenizer is not None else text.split()
+
+    def build(self, symptom_texts: Iterable[str]):
+        """Build token frequencies, the inverted index and the co-occurrence matrix"""
+        vocabulary = {}
+        rows, cols = [], []
+        n_cases = 0
+
+        for case_id, text in enumerate(symptom_texts):
+            n_cases = case_id + 1
+            if not text:
+                continue
+            for token in self.tokenize(text):
+                token_id = vocabulary.setdefault(token, len(vocabulary))
+                rows.append(case_id)
+                cols.append(token_id)
+
+        counts = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int64), (rows, cols)),
+            shape=(n_cases, len(vocabulary))
+        )
+        counts.sum_duplicates()
+
+        # Binary case x token matrix: one entry per distinct token in a case
+        case_tokens = counts.copy()
+        case_tokens.data = np.ones_like(case_tokens.data, dtype=np.int32)
+
+        self.vocabulary = vocabulary
+        self.tokens = np.array(list(vocabulary), dtype=object)
+        self.token_counts = np.asarray(counts.sum(axis=0)).ravel()
+        self.case_counts = counts
+        self.case_tokens = case_tokens
+        self.postings = case_tokens.tocsc()
+        self.cooccurrence = (case_tokens.T @ case_tokens).tocsr()
+        self.is_built = True
+
+    def extended(self, symptom_texts: Iterable[str]) -> 'SymptomIndex':
+        """New index that also covers the given cases, sharing this index's built arrays
+
+        Token counts and the co-occurrence matrix are updated in place of a rebuild;
+        the appended cases are kept in small delta matrices next to the built ones.
+        """
+        vocabulary = dict(self.vocabulary)
+        rows, cols = [], []
+        n_cases = 0
+        for case_id, text in enumerate(symptom_texts):
+            n_cases = case_id + 1
+            if not text:
+                continue
+            for token in self.tokenize(text):
+                rows.append(case_id)
+                cols.append(vocabulary.setdefault(token, len(vocabulary)))
+
+        n_tokens = len(vocabulary)
+        counts = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int64), (rows, cols)),
+            shape=(n_cases, n_tokens)
+        )
+        counts.sum_duplicates()
+        case_tokens = counts.copy()
+        case_tokens.data = np.ones_like(case_tokens.data, dtype=np.int32)
+
+        index = SymptomIndex(self.tokenizer)
+        index.vocabulary = vocabulary
+        index.tokens = np.array(list(vocabulary), dtype=object)
+        index.token_counts = np.zeros(n_tokens, dtype=np.int64)
+        index.token_counts[:len(self.token_counts)] = self.token_counts
+        index.token_counts += np.asarray(counts.sum(axis=0)).ravel()
+        index.case_counts = self.case_counts
+        index.case_tokens = self.case_tokens
+        index.postings = self.postings
+        index.cooccurrence = (_pad_csr(self.cooccurrence, (n_tokens, n_tokens)) +
+                              (case_tokens.T @ case_tokens)).tocsr()
+
+        if self.delta_counts is None:
+            index.delta_counts, index.delta_tokens = counts, case_tokens
+        else:
+            width = (self.delta_counts.shape[0], n_tokens)
+            index.delta_counts = sparse.vstack([_pad_csr(self.delta_counts, width), counts], format='csr')
+            index.delta_tokens = sparse.vstack([_pad_csr(self.delta_tokens, width), case_tokens], format='csr')
+        index.is_built = True
+        return index
+
+    def save(self, directory: str):
+        """Write the index as flat arrays under directory (built cases only, not appended ones)"""
+        os.makedirs(directory, exist_ok=True)
+        StringColumn.from_values(self.tokens).save(directory, 'tokens')
+        save_array(directory, 'token_counts', self.token_counts)
+        save_csr(directory, 'case_counts', self.case_counts)
+        save_csr(directory, 'case_tokens', self.case_tokens)
+        save_csc(directory, 'postings', self.postings)
+        save_csr(directory, 'cooccurrence', self.cooccurrence)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True,
+             tokenizer: Optional[Callable[[str], List[str]]] = None) -> 'SymptomIndex':
+        """Open an index written by save(), memory-mapped by default (pass the tokenizer it was built with)"""
+        index = cls(tokenizer)
+        index.tokens = np.array(list(StringColumn.load(directory, 'tokens', mmap)), dtype=object)
+        index.vocabulary = {token: i for i, token in enumerate(index.tokens)}
+        index.token_counts = load_array(directory, 'token_counts', mmap)
+        index.case_counts = load_csr(directory, 'case_counts', mmap)
+        index.case_tokens = load_csr(directory, 'case_tokens', mmap)
+        index.postings = load_csc(directory, 'postings', mmap)
+        index.cooccurrence = load_csr(directory, 'cooccurrence', mmap)
+        index.is_built = True
+        return index
+
+    def common_symptoms(self, top_n: int = 10) -> Dict[str, int]:
+        """Most frequent symptom tokens across all cases"""
+        order = self._top(self.token_counts, top_n)
+        return {self.tokens[i]: int(self.token_counts[i]) for i in order}
+
+    def co_occurring_symptoms(self, symptoms: List[str], top_n: int = 5) -> Dict[str, int]:
+        """Tokens that appear in cases sharing at least one of the given symptoms"""
+        if self.tokenizer is not None:
+            # Symptoms are matched by the tokens the cases were indexed with
+            symptoms = [token for symptom in symptoms for token in self.tokenizer(symptom)]
+        query_ids = sorted({self.vocabulary[s] for s in symptoms if s in self.vocabulary})
+        if not query_ids:
+            return {}
+
+        if len(query_ids) == 1:
+            # Single symptom: the co-occurrence row already holds the counts
+            counts = self.cooccurrence[query_ids[0]].toarray().ravel()
+        else:
+            # Several symptoms: union the posting lists so each case is counted once
+            counts = np.zeros(len(self.tokens), dtype=np.int64)
+            built_ids = [i for i in query_ids if i < self.postings.shape[1]]
+            if built_ids:
+                case_ids = np.unique(np.concatenate([
+                    self.postings.indices[self.postings.indptr[i]:self.postings.indptr[i + 1]]
+                    for i in built_ids
+                ]))
+                built = np.asarray(self.case_tokens[case_ids].sum(axis=0)).ravel()
+                counts[:len(built)] += built
+            if self.delta_tokens is not None:
+                matched = np.flatnonzero(np.asarray(self.delta_tokens[:, query_ids].sum(axis=1)).ravel())
+                counts += np.asarray(self.delta_tokens[matched].sum(axis=0)).ravel()
+
+        counts[query_ids] = 0
+        order = self._top(counts, top_n)
+        return {self.tokens[i]: int(counts[i]) for i in order if counts[i] > 0}
+
+    @staticmethod
+    def _top(counts: np.ndarray, top_n: int) -> np.ndarray:
+        """Indices of the largest counts, ties broken by first appearance"""
+        if len(counts) <= top_n:
+            return np.argsort(-counts, kind='stable')
+        candidates = np.argpartition(-counts, top_n - 1)[:top_n]
+        threshold = counts[candidates].min()
+        candidates = np.flatnonzero(counts >= threshold)
+        return candidates[np.argsort(-counts[candidates], kind='stable')][:top_n]
+
+
+class AgeBucketCache:
+    """Per-age-bucket symptom frequency tables computed once at load time"""
+
+    def __init__(self, buckets: Optional[List[Tuple[str, int, int]]] = None, top_n: int = 10):
+        self.buckets = list(buckets or DEFAULT_AGE_BUCKETS)
+        self.top_n = top_n
+        self.counts = {}
+        self.tables = {}
+        self.case_totals = {}
+        self.is_built = False
+
+    def build(self, ages: np.ndarray, index: SymptomIndex):
+        """Precompute the top symptom tokens for every bucket"""
+        ages = np.asarray(ages)
+        for label, min_age, max_age in self.buckets:
+            mask = (ages >= min_age) & (ages <= max_age)
+            self.counts[label] = np.asarray(index.case_counts[mask].sum(axis=0)).ravel()
+            self.case_totals[label] = int(mask.sum())
+        self._rank(index)
+
+    def extended(self, ages: np.ndarray, index: SymptomIndex) -> 'AgeBucketCache':
+        """New cache that also counts the last len(ages) cases appended to index"""
+        ages = np.asarray(ages)
+        appended = index.delta_counts[index.delta_counts.shape[0] - len(ages):]
+
+        cache = AgeBucketCache(self.buckets, self.top_n)
+        for label, min_age, max_age in self.buckets:
+            mask = (ages >= min_age) & (ages <= max_age)
+            counts = np.zeros(len(index.tokens), dtype=np.int64)
+            counts[:len(self.counts[label])] = self.counts[label]
+            counts += np.asarray(appended[mask].sum(axis=0)).ravel()
+            cache.counts[label] = counts
+            cache.case_totals[label] = self.case_totals[label] + int(mask.sum())
+        cache._rank(index)
+        return cache
+
+    def _rank(self, index: SymptomIndex):
+        """Top-token tables from the per-bucket counts"""
+        for label, counts in self.counts.items():
+            order = SymptomIndex._top(counts, self.top_n)
+            self.tables[label] = [(index.tokens[i], int(counts[i])) for i in order if counts[i] > 0]
+        self.is_built = True
+
+    def age_group(self, age: int) -> str:
+        """Bucket label for an age"""
+        return get_age_group(age, self.buckets)
+
+    def common_symptoms(self, age: int, top_n: int = 5) -> List[str]:
+        """Most frequent symptom tokens in the age's bucket"""
+        return [token for token, _ in self.tables.get(self.age_group(age), [])[:top_n]]
+
+
+class DatasetStats:
+    """Dataset aggregates for /stats, kept as counts so appended cases can be added cheaply
+
+    Ages are clipped to 0..MAX_AGE, so a small age histogram gives the exact mean,
+    median, min and max of any valid data.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.gender_counts = {}
+        self.age_offset = 0
+        self.age_histogram = np.zeros(0, dtype=np.int64)
+        self.unique_symptoms = 0
+        self.summary = {}
+
+    def build(self, cases, index: SymptomIndex) -> 'DatasetStats':
+        """Aggregate a CaseStore and its symptom index"""
+        self.total = len(cases)
+        self.gender_counts = cases.gender_counts()
+        self._add_ages(np.asarray(cases.ages))
+        self.unique_symptoms = len(index.tokens)
+        self._summarise()
+        return self
+
+    def extended(self, genders: Iterable, ages: np.ndarray, index: SymptomIndex) -> 'DatasetStats':
+        """New stats that also count the given cases; index must already include them"""
+        stats = DatasetStats()
+        stats.total = self.total + len(ages)
+        stats.gender_counts = dict(self.gender_counts)
+        for gender in genders:
+            if gender is not None:
+                stats.gender_counts[gender] = stats.gender_counts.get(gender, 0) + 1
+        stats.age_offset, stats.age_histogram = self.age_offset, self.age_histogram
+        stats._add_ages(np.asarray(ages))
+        stats.unique_symptoms = len(index.tokens)
+        stats._summarise()
+        return stats
+
+    def _add_ages(self, ages: np.ndarray):
+        """Add ages to the histogram, widening it when they fall outside its range"""
+        if len(ages) == 0:
+            return
+        # Clipped, so a bad age can never size the histogram
+        ages = np.clip(ages.astype(np.int64), 0, MAX_AGE)
+        low = min(self.age_offset, int(ages.min())) if len(self.age_histogram) else int(ages.min())
+        high = max(self.age_offset + len(self.age_histogram) - 1, int(ages.max()))
+        histogram = np.zeros(high - low + 1, dtype=np.int64)
+        start = self.age_offset - low
+        histogram[start:start + len(self.age_histogram)] = self.age_histogram
+        histogram += np.bincount(ages - low, minlength=len(histogram))
+        self.age_offset, self.age_histogram = low, histogram
+
+    def _age_at(self, rank: int, cumulative: np.ndarray) -> int:
+        """Age of the rank-th case in ascending order"""
+        return self.age_offset + int(np.searchsorted(cumulative, rank, side='right'))
+
+    def _summarise(self):
+        """Precompute the /stats payload"""
+        ages = np.arange(len(self.age_histogram)) + self.age_offset
+        cumulative = np.cumsum(self.age_histogram)
+        present = np.flatnonzero(self.age_histogram)
+        # Same definition as np.median: the mean of the two middle values for an even count
+        age_statistics = {}
+        if self.total > 0:
+            median = (self._age_at((self.total - 1) // 2, cumulative) + self._age_at(self.total // 2, cumulative)) / 2
+            age_statistics = {
+                "mean": float((ages * self.age_histogram).sum() / self.total),
+                "median": float(median),
+                "min": int(ages[present[0]]),
+                "max": int(ages[present[-1]])
+            }
+        self.summary = {
+            "total_records": self.total,
+            "gender_distribution": dict(sorted(self.gender_counts.items(), key=lambda item: -item[1])),
+            "age_statistics": age_statistics,
+            "unique_symptoms": self.unique_symptoms
+        }
+
+    def as_dict(self) -> Dict:
+        """The /stats payload"""
+        return self.summary
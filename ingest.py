@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import StandardScaler
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from summaries import parse_summaries
+from hashing import HashingTfidfVectorizer, select_features
+from tokenization import build_tokenizer, with_tokenizer
+
+# Columns read from the CSV; everything else is skipped while parsing
+SOURCE_COLUMNS = ['gender', 'age', 'summary', 'search_term']
+
+# Columns kept per case after extraction (the raw summary JSON is dropped per chunk)
+SERVED_COLUMNS = ['gender', 'age', 'search_term', 'extracted_symptoms']
+
+# Rough peak memory of a parsed chunk relative to its raw row size (JSON parsing, joins, copies)
+CHUNK_OVERHEAD_FACTOR = 6
+
+
+def estimate_chunk_rows(path: str, memory_mb: float, sample_rows: int = 1000) -> int:
+    """Rows per chunk that keep one chunk's working set under memory_mb"""
+    sample = pd.read_csv(path, usecols=SOURCE_COLUMNS, nrows=sample_rows)
+    if len(sample) == 0:
+        return sample_rows
+    bytes_per_row = sample.memory_usage(deep=True).sum() / len(sample)
+    return max(100, int(memory_mb * 1024 * 1024 / (bytes_per_row * CHUNK_OVERHEAD_FACTOR)))
+
+
+def iter_case_chunks(path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Stream the CSV, extracting symptoms per chunk and keeping only the served columns"""
+    reader = pd.read_csv(
+        path,
+        usecols=SOURCE_COLUMNS,
+        dtype={'gender': object, 'summary': object, 'search_term': object},
+        chunksize=chunk_rows
+    )
+    for chunk in reader:
+        chunk['extracted_symptoms'] = parse_summaries(chunk['summary'], chunk.index).texts()
+        yield chunk[SERVED_COLUMNS]
+
+
+def combined_texts(chunk: pd.DataFrame) -> pd.Series:
+    """Symptoms plus search terms, the text that is vectorized"""
+    return chunk['extracted_symptoms'] + ' ' + chunk['search_term'].fillna('')
+
+
+def fit_tfidf_chunked(chunks: List[pd.DataFrame], params: Dict[str, Any]) -> TfidfVectorizer:
+    """Pass 1 of the chunked TF-IDF fit: vocabulary and IDF from corpus-wide term statistics"""
+    analyzer = TfidfVectorizer(**params).build_analyzer()
+
+    # Pass 1: term and document frequencies, O(vocabulary) memory
+    term_counts, doc_counts = {}, {}
+    n_docs = 0
+    for chunk in chunks:
+        for text in combined_texts(chunk):
+            terms = analyzer(text)
+            n_docs += 1
+            for term in terms:
+                term_counts[term] = term_counts.get(term, 0) + 1
+            for term in set(terms):
+                doc_counts[term] = doc_counts.get(term, 0) + 1
+
+    # Sorted terms, as CountVectorizer orders them before pruning
+    terms = sorted(term_counts)
+    positions, idf = select_features(np.array([term_counts[t] for t in terms], dtype=np.int64),
+                                     np.array([doc_counts[t] for t in terms], dtype=np.int64),
+                                     n_docs, params.get('min_df', 1), params.get('max_df', 1.0),
+                                     params.get('max_features'))
+    vocabulary = [terms[i] for i in positions]
+
+    vectorizer = TfidfVectorizer(**params, vocabulary=vocabulary)
+    vectorizer.idf_ = idf
+    return vectorizer
+
+
+def fit_hashed_chunked(chunks: List[pd.DataFrame], vectorizer: HashingTfidfVectorizer) -> HashingTfidfVectorizer:
+    """Hashing-mode pass 1: per-chunk statistics simply add up, so it keeps no vocabulary"""
+    statistics = None
+    for chunk in chunks:
+        part = vectorizer.statistics(combined_texts(chunk))
+        statistics = part if statistics is None else statistics + part
+    vectorizer.fit_statistics(statistics)
+    return vectorizer
+
+
+def transform_chunks(chunks: List[Optional[pd.DataFrame]],
+                     vectorizer,
+                     age_scaler: StandardScaler) -> Tuple[pd.DataFrame, sparse.csr_matrix]:
+    """Pass 2: vectorize each chunk and move its columns into preallocated arrays
+
+    Each chunk is released from the list as soon as it is copied, so the served
+    columns are never held twice (as chunks and as one concatenated frame).
+    """
+    n_rows = sum(len(chunk) for chunk in chunks)
+    columns = {
+        name: np.empty(n_rows, dtype=np.result_type(*(chunk[name].dtype for chunk in chunks)))
+        for name in SERVED_COLUMNS
+    }
+    columns['age_scaled'] = np.empty(n_rows, dtype=np.float64)
+
+    parts = []
+    start = 0
+    for i in range(len(chunks)):
+        chunk, chunks[i] = chunks[i], None
+        stop = start + len(chunk)
+        parts.append(vectorizer.transform(combined_texts(chunk)))
+        for name in SERVED_COLUMNS:
+            columns[name][start:stop] = chunk[name].to_numpy()
+        columns['age_scaled'][start:stop] = age_scaler.transform(chunk[['age']].values).ravel()
+        start = stop
+        del chunk
+
+    # copy=False keeps each array as its own column instead of consolidating them
+    return pd.DataFrame(columns, copy=False), sparse.vstack(parts, format='csr')
+
+
+def build_model_state_chunked(path: str,
+                              tfidf_params: Dict[str, Any],
+                              chunk_rows: int,
+                              hashing_features: int = 0,
+                              tokenizer: str = '') -> Tuple[pd.DataFrame, TfidfVectorizer, sparse.csr_matrix, StandardScaler]:
+    """Chunked equivalent of app.build_model_state for CSVs too large to parse in one go
+
+    With hashing_features > 0 the TF-IDF is fitted over that many hashed columns;
+    a tokenizer name (see tokenization.TOKENIZERS) replaces the default token_pattern.
+    """
+    chunks = []
+    age_scaler = StandardScaler()
+    for chunk in iter_case_chunks(path, chunk_rows):
+        age_scaler.partial_fit(chunk[['age']].values)
+        chunks.append(chunk)
+
+    # The tokenizer's dictionary comes from the extracted symptom texts of every chunk
+    tfidf_params = with_tokenizer(
+        tfidf_params, build_tokenizer(tokenizer, (text for chunk in chunks for text in chunk['extracted_symptoms']))
+    )
+    if hashing_features > 0:
+        vectorizer = fit_hashed_chunked(chunks, HashingTfidfVectorizer(n_features=hashing_features, **tfidf_params))
+    else:
+        vectorizer = fit_tfidf_chunked(chunks, tfidf_params)
+
+    df, vectors = transform_chunks(chunks, vectorizer, age_scaler)
+    return df, vectorizer, vectors, age_scaler
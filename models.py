@@ -2,64 +2,170 @@ import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report, accuracy_score
+from sklearn.metrics import classification_report, accuracy_score, f1_score
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.decomposition import PCA, TruncatedSVD
+from sklearn.base import clone
+import copy
 import joblib
 import json
-from typing import List, Dict, Any, Tuple
+import math
+import os
+import time
+from typing import List, Dict, Any, Tuple, Optional
 import setuptools.dist
+from summaries import ParsedSummaries, parse_summaries, parse_summaries_parallel
+from indexes import SymptomIndex, DEFAULT_AGE_BUCKETS, get_age_group
+from forest import ForestArrays, top_k_columns
+from hashing import HashingTfidfVectorizer, HASHED_ARRAYS, hash_terms
+from tokenization import build_tokenizer, with_tokenizer
+from storage import StringColumn, save_array, load_array
+from artifacts import MANIFEST_FILE, frame_sha256, write_atomic_dir
+
+def summaries_for(df: pd.DataFrame, summaries: Optional[ParsedSummaries] = None) -> ParsedSummaries:
+    """Reuse already parsed summaries, or parse the frame's summary column once"""
+    if summaries is None:
+        summaries = parse_summaries(df['summary'], df.index)
+    return summaries
+
+# Label that replaces every class outside the top max_classes
+OTHER_LABEL = 'other'
+
+# Bump whenever the layout written by SymptomRecommender.save_models changes
+MODEL_FORMAT_VERSION = 2
+
+MODEL_MANIFEST = MANIFEST_FILE
+
+def _save_vectorizer(directory: str, name: str, vectorizer: TfidfVectorizer):
+    """Vocabulary and IDF as flat arrays; only the unfitted parameters are pickled"""
+    if isinstance(vectorizer, HashingTfidfVectorizer):
+        # No vocabulary: selected hashed columns and their IDF
+        _save_estimator(directory, name, vectorizer, list(HASHED_ARRAYS))
+        return
+    StringColumn.from_values(vectorizer.get_feature_names_out()).save(directory, f"{name}.vocabulary")
+    save_array(directory, f"{name}.idf", vectorizer.idf_)
+    joblib.dump(clone(vectorizer), os.path.join(directory, f"{name}.joblib"))
+
+def _load_vectorizer(directory: str, name: str, mmap: bool) -> TfidfVectorizer:
+    """Rebuild a fitted vectorizer from _save_vectorizer's files (same approach as ingest.py)"""
+    vectorizer = joblib.load(os.path.join(directory, f"{name}.joblib"))
+    if isinstance(vectorizer, HashingTfidfVectorizer):
+        for attr in HASHED_ARRAYS:
+            setattr(vectorizer, attr, load_array(directory, f"{name}.{attr}", mmap))
+        return vectorizer
+    vectorizer.set_params(vocabulary=list(StringColumn.load(directory, f"{name}.vocabulary", mmap)))
+    vectorizer.idf_ = load_array(directory, f"{name}.idf", mmap)
+    return vectorizer
+
+def _save_estimator(directory: str, name: str, estimator, arrays: List[str], drop: Tuple[str, ...] = ()):
+    """Fitted arrays as .npy files, the rest of the estimator as a small joblib"""
+    skeleton = copy.copy(estimator)
+    for attr in list(arrays) + list(drop):
+        skeleton.__dict__.pop(attr, None)
+    for attr in arrays:
+        save_array(directory, f"{name}.{attr}", getattr(estimator, attr))
+    joblib.dump(skeleton, os.path.join(directory, f"{name}.joblib"))
+
+def _load_estimator(directory: str, name: str, arrays: List[str], mmap: bool):
+    """Inverse of _save_estimator, memory-mapping the arrays by default"""
+    estimator = joblib.load(os.path.join(directory, f"{name}.joblib"))
+    for attr in arrays:
+        setattr(estimator, attr, load_array(directory, f"{name}.{attr}", mmap))
+    return estimator
 
 class SymptomClassifier:
     """Advanced symptom classification model"""
     # TF–IDF + RandomForest	แปลงข้อความ → จำแนกอาการ
     
-    def __init__(self):
+    def __init__(self,
+                 n_jobs: Optional[int] = -1,
+                 max_classes: Optional[int] = None,
+                 validation_size: float = 0.2,
+                 feature_hashing: bool = False):
         self.model = RandomForestClassifier(n_estimators=100, random_state=42)
-        self.vectorizer = TfidfVectorizer(max_features=500, ngram_range=(1, 2))
+        if feature_hashing:
+            self.vectorizer = HashingTfidfVectorizer(max_features=500, n_jobs=n_jobs)
+        else:
+            self.vectorizer = TfidfVectorizer(max_features=500, ngram_range=(1, 2))
+        self.feature_hashing = feature_hashing
+        self.n_jobs = n_jobs
+        self.max_classes = max_classes
+        self.validation_size = validation_size
+        self.metrics = {}
+        # Flat node arrays of the fitted forest, used for prediction (and what gets saved)
+        self.forest = None
+        self.classes = None
         self.is_trained = False
         
-    def prepare_features(self, df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    def prepare_features(self, df: pd.DataFrame, summaries: Optional[ParsedSummaries] = None) -> Tuple[np.ndarray, np.ndarray]:
         """Prepare features for training"""
-        # Extract symptoms
-        symptoms = []
-        labels = []
-        
-        for _, row in df.iterrows():
-            try:
-                summary = json.loads(row['summary'])
-                yes_symptoms = summary.get('yes_symptoms', [])
-                symptom_text = ' '.join([s['text'] for s in yes_symptoms])
-                
-                if symptom_text.strip():
-                    symptoms.append(symptom_text)
-                    # Create a simple label based on primary symptom
-                    primary_symptom = yes_symptoms[0]['text'] if yes_symptoms else 'unknown'
-                    labels.append(primary_symptom)
-            except:
-                continue
+        summaries = summaries_for(df, summaries)
+        
+        # Keep cases with symptoms; label each by its primary (first) symptom
+        keep = summaries.has_symptoms()
+        symptoms = [text for text, k in zip(summaries.texts(), keep) if k]
+        labels = summaries.primary_symptoms()[keep].tolist()
         
         return np.array(symptoms), np.array(labels)
     
-    def train(self, df: pd.DataFrame):
+    def bound_labels(self, labels: np.ndarray) -> np.ndarray:
+        """Keep the max_classes most frequent labels and map the rest to OTHER_LABEL"""
+        if self.max_classes is None:
+            return labels
+        counts = pd.Series(labels).value_counts(sort=True)
+        kept = counts.index[:self.max_classes]
+        return np.where(np.isin(labels, kept), labels, OTHER_LABEL)
+    
+    def train(self, df: pd.DataFrame, summaries: Optional[ParsedSummaries] = None):
         """Train the symptom classifier"""
-        symptoms, labels = self.prepare_features(df)
+        symptoms, labels = self.prepare_features(df, summaries)
         
         if len(symptoms) == 0:
             raise ValueError("No valid symptoms found in data")
         
-        # Vectorize symptoms
-        X = self.vectorizer.fit_transform(symptoms)
+        # A bounded label space keeps every tree's per-node class arrays small
+        labels = self.bound_labels(labels)
+        
+        # Hold out a split for metrics instead of re-predicting the training set
+        validation = {}
+        if 0 < self.validation_size < 1 and len(symptoms) >= 2:
+            train_symptoms, test_symptoms, train_labels, test_labels = train_test_split(
+                symptoms, labels, test_size=self.validation_size, random_state=42
+            )
+            self._fit(train_symptoms, train_labels)
+            y_pred = self.model.predict(self.vectorizer.transform(test_symptoms))
+            validation = {
+                'validation_cases': len(test_symptoms),
+                'validation_accuracy': accuracy_score(test_labels, y_pred),
+                'validation_macro_f1': f1_score(test_labels, y_pred, average='macro', zero_division=0)
+            }
         
-        # Train model
-        self.model.fit(X, labels)
+        # The served model is refitted on every case, so measuring it costs no training data
+        self._fit(symptoms, labels)
+        self.forest = ForestArrays.from_estimator(self.model)
+        self.classes = self.model.classes_
         self.is_trained = True
         
-        # Calculate accuracy
-        y_pred = self.model.predict(X)
-        accuracy = accuracy_score(labels, y_pred)
-        print(f"Model trained with accuracy: {accuracy:.3f}")
+        self.metrics = {
+            'train_cases': len(symptoms),
+            'classes': len(self.model.classes_),
+            **validation
+        }
+        if validation:
+            print(f"Model trained on {len(symptoms)} cases ({self.metrics['classes']} classes), "
+                  f"held-out accuracy: {self.metrics['validation_accuracy']:.3f}, "
+                  f"macro F1: {self.metrics['validation_macro_f1']:.3f}")
+        else:
+            print(f"Model trained on {len(symptoms)} cases ({self.metrics['classes']} classes)")
+    
+    def _fit(self, symptoms: np.ndarray, labels: np.ndarray):
+        """Fit the vectorizer and the forest, building the trees in parallel"""
+        X = self.vectorizer.fit_transform(symptoms)
+        self.model.set_params(n_jobs=self.n_jobs)
+        self.model.fit(X, labels)
+        # Single-query predictions are faster without the parallel dispatch overhead
+        self.model.set_params(n_jobs=None)
         
     def predict(self, symptoms: List[str]) -> Dict[str, float]:
         """Predict symptom categories"""
@@ -67,11 +173,16 @@ class SymptomClassifier:
             raise ValueError("Model not trained")
         
         symptom_text = ' '.join(symptoms)
-        X = self.vectorizer.transform([symptom_text])
+        return self.predict_features(self.vectorizer.transform([symptom_text]))
+    
+    def predict_features(self, X) -> Dict[str, float]:
+        """predict() for a query already vectorised with self.vectorizer"""
+        if not self.is_trained:
+            raise ValueError("Model not trained")
         
-        # Get prediction probabilities
-        probabilities = self.model.predict_proba(X)[0]
-        classes = self.model.classes_
+        # Get prediction probabilities (identical to the forest's predict_proba)
+        probabilities = self.forest.predict_proba(X)[0]
+        classes = self.classes
         
         # Create result dictionary
         predictions = {}
@@ -79,62 +190,148 @@ class SymptomClassifier:
             predictions[class_name] = float(prob)
         
         return dict(sorted(predictions.items(), key=lambda x: x[1], reverse=True))
+    
+    def predict_top_k(self,
+                      symptoms: List[str],
+                      k: int = 3,
+                      max_trees: Optional[int] = None,
+                      max_depth: Optional[int] = None) -> Dict[str, float]:
+        """The k most likely categories only: the first k entries of predict()
+        
+        max_trees (only the first trees vote) and max_depth (stop descending early
+        and use that node's class distribution) trade accuracy for latency.
+        """
+        return self.predict_top_k_batch([symptoms], k, max_trees, max_depth)[0]
+    
+    def predict_top_k_batch(self,
+                            symptom_lists: List[List[str]],
+                            k: int = 3,
+                            max_trees: Optional[int] = None,
+                            max_depth: Optional[int] = None) -> List[Dict[str, float]]:
+        """predict_top_k for many queries with one transform and one forest pass"""
+        if not self.is_trained:
+            raise ValueError("Model not trained")
+        if not symptom_lists:
+            return []
+        
+        X = self.vectorizer.transform([' '.join(symptoms) for symptoms in symptom_lists])
+        labels, scores = self.top_k_features(X, k, max_trees, max_depth)
+        return [dict(zip(row_labels, row_scores)) for row_labels, row_scores in zip(labels.tolist(), scores.tolist())]
+    
+    def top_k_features(self,
+                       X,
+                       k: int = 3,
+                       max_trees: Optional[int] = None,
+                       max_depth: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Labels and probabilities of the k most likely classes per row of X, best first"""
+        if not self.is_trained:
+            raise ValueError("Model not trained")
+        
+        # argpartition per row instead of a dict and a sort over every class
+        probabilities = self.forest.predict_proba(X, max_trees, max_depth)
+        columns = top_k_columns(probabilities, k)
+        return self.classes[columns], np.take_along_axis(probabilities, columns, axis=1)
+    
+    def save(self, directory: str):
+        """Write the forest, classes and vectorizer as flat arrays under directory"""
+        if not self.is_trained:
+            raise ValueError("Model not trained")
+        
+        os.makedirs(directory, exist_ok=True)
+        self.forest.save(directory)
+        StringColumn.from_values(self.classes).save(directory, 'classes')
+        _save_vectorizer(directory, 'vectorizer', self.vectorizer)
+        with open(os.path.join(directory, 'classifier.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'params': {
+                    'n_jobs': self.n_jobs,
+                    'max_classes': self.max_classes,
+                    'validation_size': self.validation_size,
+                    'feature_hashing': self.feature_hashing
+                },
+                'metrics': self.metrics
+            }, f, ensure_ascii=False, indent=2)
+    
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'SymptomClassifier':
+        """Open a classifier written by save(), memory-mapped by default"""
+        with open(os.path.join(directory, 'classifier.json'), encoding='utf-8') as f:
+            state = json.load(f)
+        
+        classifier = cls(**state['params'])
+        classifier.forest = ForestArrays.load(directory, mmap)
+        classifier.classes = np.array(list(StringColumn.load(directory, 'classes', mmap)), dtype=object)
+        classifier.vectorizer = _load_vectorizer(directory, 'vectorizer', mmap)
+        classifier.metrics = state['metrics']
+        classifier.is_trained = True
+        return classifier
+
+# SymptomClusterer fit modes: "full" (KMeans + PCA on the densified matrix) or
+# "minibatch" (MiniBatchKMeans + TruncatedSVD, both on the sparse matrix)
+CLUSTER_FIT_MODES = ('full', 'minibatch')
 
 class SymptomClusterer:
     """Clustering model for symptom patterns"""
     # TF–IDF + K-Means + PCA	จัดกลุ่มอาการ, ลดมิติข้อมูล    
     
-    def __init__(self, n_clusters=5):
-        self.kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-        self.vectorizer = TfidfVectorizer(max_features=300)
-        self.pca = PCA(n_components=2)
+    def __init__(self, n_clusters=5, fit_mode: str = 'full', batch_size: int = 4096,
+                 feature_hashing: bool = False):
+        if fit_mode not in CLUSTER_FIT_MODES:
+            raise ValueError(f"Unknown fit mode '{fit_mode}', expected one of {CLUSTER_FIT_MODES}")
+        self.fit_mode = fit_mode
+        if fit_mode == 'minibatch':
+            # Mini-batches are drawn from the sparse matrix; nothing is densified
+            self.kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, batch_size=batch_size, n_init=3)
+            self.pca = TruncatedSVD(n_components=2, random_state=42)
+        else:
+            self.kmeans = KMeans(n_clusters=n_clusters, random_state=42)
+            self.pca = PCA(n_components=2)
+        if feature_hashing:
+            # Same hashed space as the classifier (unigrams and bigrams), own columns and IDF
+            self.vectorizer = HashingTfidfVectorizer(max_features=300)
+        else:
+            self.vectorizer = TfidfVectorizer(max_features=300)
+        self.feature_hashing = feature_hashing
         self.is_fitted = False
+        # Cluster membership of the fitted cases, computed once in fit()
+        self.member_positions = np.array([], dtype=np.int64)
+        self.member_offsets = np.zeros(1, dtype=np.int64)
+        self.cluster_summaries = {}
         
-    def fit(self, df: pd.DataFrame):
+    def fit(self, df: pd.DataFrame, summaries: Optional[ParsedSummaries] = None):
         """Fit the clustering model"""
         # Extract symptoms
-        symptoms = []
-        for _, row in df.iterrows():
-            try:
-                summary = json.loads(row['summary'])
-                yes_symptoms = summary.get('yes_symptoms', [])
-                symptom_text = ' '.join([s['text'] for s in yes_symptoms])
-                if symptom_text.strip():
-                    symptoms.append(symptom_text)
-            except:
-                continue
+        summaries = summaries_for(df, summaries)
+        symptoms = [text for text in summaries.texts() if text.strip()]
         
         if len(symptoms) == 0:
             raise ValueError("No valid symptoms found")
         
         # Vectorize and cluster
         X = self.vectorizer.fit_transform(symptoms)
+        if self.feature_hashing:
+            # Centroid symptoms need names for the hashed columns
+            self.vectorizer.resolve_feature_names(symptoms)
         self.kmeans.fit(X)
         
-        # Reduce dimensions for visualization
-        self.pca.fit(X.toarray())
+        # Reduce dimensions for visualization (TruncatedSVD takes the sparse matrix as is)
+        self.pca.fit(X if self.fit_mode == 'minibatch' else X.toarray())
         self.is_fitted = True
         
+        # Membership only changes on refit, so assign every case once here
+        self._cache_assignments(np.flatnonzero(summaries.has_symptoms()), self.kmeans.predict(X))
+        
         print(f"Clustering model fitted with {len(symptoms)} samples")
         
-    def get_clusters(self, df: pd.DataFrame) -> List[Dict[str, Any]]:
+    def get_clusters(self, df: pd.DataFrame, summaries: Optional[ParsedSummaries] = None) -> List[Dict[str, Any]]:
         """Get cluster information"""
         if not self.is_fitted:
             raise ValueError("Model not fitted")
         
-        symptoms = []
-        valid_indices = []
-        
-        for idx, row in df.iterrows():
-            try:
-                summary = json.loads(row['summary'])
-                yes_symptoms = summary.get('yes_symptoms', [])
-                symptom_text = ' '.join([s['text'] for s in yes_symptoms])
-                if symptom_text.strip():
-                    symptoms.append(symptom_text)
-                    valid_indices.append(idx)
-            except:
-                continue
+        summaries = summaries_for(df, summaries)
+        valid_positions = np.flatnonzero(summaries.has_symptoms())
+        all_texts = summaries.texts()
+        symptoms = [all_texts[pos] for pos in valid_positions]
         
         if not symptoms:
             return []
@@ -143,18 +340,20 @@ class SymptomClusterer:
         clusters = self.kmeans.predict(X)
         
         # Group by cluster
+        case_ids = summaries.case_ids[valid_positions].tolist()
+        genders = df['gender'].to_numpy()[valid_positions].tolist()
+        ages = df['age'].to_numpy()[valid_positions].astype(int).tolist()
         cluster_data = {}
         for i, cluster_id in enumerate(clusters):
             if cluster_id not in cluster_data:
                 cluster_data[cluster_id] = []
             
-            original_idx = valid_indices[i]
             cluster_data[cluster_id].append({
-                'id': int(original_idx),
+                'id': case_ids[i],
                 'symptoms': symptoms[i],
                 'demographics': {
-                    'gender': df.iloc[original_idx]['gender'],
-                    'age': int(df.iloc[original_idx]['age'])
+                    'gender': genders[i],
+                    'age': ages[i]
                 }
             })
         
@@ -168,6 +367,58 @@ class SymptomClusterer:
             for cluster_id, cases in cluster_data.items()
         ]
     
+    def _cache_assignments(self, positions: np.ndarray, labels: np.ndarray):
+        """Group the fitted case positions by cluster and summarise each cluster"""
+        order = np.argsort(labels, kind='stable')
+        self.member_positions = positions[order]
+        self.member_offsets = np.searchsorted(labels[order], np.arange(self.kmeans.n_clusters + 1))
+        
+        # Clusters in order of first appearance, as get_clusters() lists them
+        _, first_seen = np.unique(labels, return_index=True)
+        self.cluster_summaries = {}
+        for cluster_id in labels[np.sort(first_seen)].tolist():
+            self.cluster_summaries[cluster_id] = {
+                'cluster_id': cluster_id,
+                'size': int(self.member_offsets[cluster_id + 1] - self.member_offsets[cluster_id]),
+                'centroid_symptoms': self._get_centroid_symptoms(cluster_id)
+            }
+    
+    def assign(self, symptoms: List[str]) -> int:
+        """Cluster that a symptom list's vector maps to"""
+        if not self.is_fitted:
+            raise ValueError("Model not fitted")
+        
+        X = self.vectorizer.transform([' '.join(symptoms)])
+        return self.assign_features(X)
+    
+    def assign_features(self, X) -> int:
+        """Nearest centroid of one vectorised query, as kmeans.predict without its per-call setup"""
+        centers = self.kmeans.cluster_centers_
+        # ||x - c||^2 up to the ||x||^2 term every centroid shares
+        distances = (centers * centers).sum(axis=1) - 2 * np.asarray(X @ centers.T)[0]
+        return int(np.argmin(distances))
+    
+    def get_cluster_members(self,
+                            cases: 'CaseMatcher',
+                            cluster_id: int,
+                            offset: int = 0,
+                            limit: int = 20) -> Dict[str, Any]:
+        """One page of a cluster's member cases; cases holds the fitted data's columns"""
+        if not self.is_fitted:
+            raise ValueError("Model not fitted")
+        if cluster_id not in self.cluster_summaries:
+            raise ValueError(f"Unknown cluster {cluster_id}")
+        
+        start = self.member_offsets[cluster_id] + max(0, offset)
+        end = min(start + max(0, limit), self.member_offsets[cluster_id + 1])
+        positions = self.member_positions[start:end]
+        return {
+            **self.cluster_summaries[cluster_id],
+            'offset': offset,
+            'limit': limit,
+            'cases': cases.cases(positions)
+        }
+    
     def _get_centroid_symptoms(self, cluster_id: int) -> List[str]:
         """Get representative symptoms for a cluster"""
         centroid = self.kmeans.cluster_centers_[cluster_id]
@@ -176,25 +427,334 @@ class SymptomClusterer:
         # Get top features for this cluster
         top_indices = centroid.argsort()[-10:][::-1]
         return [feature_names[i] for i in top_indices if centroid[i] > 0]
+    
+    def save(self, directory: str):
+        """Write centroids, projection, vectorizer and cached membership under directory"""
+        if not self.is_fitted:
+            raise ValueError("Model not fitted")
+        
+        os.makedirs(directory, exist_ok=True)
+        pca_arrays = [attr for attr in ('components_', 'mean_') if hasattr(self.pca, attr)]
+        # labels_ holds one entry per training case and is never read after fit()
+        _save_estimator(directory, 'kmeans', self.kmeans, ['cluster_centers_'], drop=('labels_',))
+        _save_estimator(directory, 'pca', self.pca, pca_arrays)
+        _save_vectorizer(directory, 'vectorizer', self.vectorizer)
+        save_array(directory, 'member_positions', self.member_positions)
+        save_array(directory, 'member_offsets', self.member_offsets)
+        with open(os.path.join(directory, 'clusterer.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'params': {
+                    'n_clusters': self.kmeans.n_clusters,
+                    'fit_mode': self.fit_mode,
+                    'feature_hashing': self.feature_hashing
+                },
+                'pca_arrays': pca_arrays,
+                'clusters': list(self.cluster_summaries.values())
+            }, f, ensure_ascii=False, indent=2)
+    
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'SymptomClusterer':
+        """Open a clusterer written by save(), memory-mapped by default"""
+        with open(os.path.join(directory, 'clusterer.json'), encoding='utf-8') as f:
+            state = json.load(f)
+        
+        clusterer = cls(**state['params'])
+        clusterer.kmeans = _load_estimator(directory, 'kmeans', ['cluster_centers_'], mmap)
+        clusterer.pca = _load_estimator(directory, 'pca', state['pca_arrays'], mmap)
+        clusterer.vectorizer = _load_vectorizer(directory, 'vectorizer', mmap)
+        clusterer.member_positions = load_array(directory, 'member_positions', mmap)
+        clusterer.member_offsets = load_array(directory, 'member_offsets', mmap)
+        clusterer.cluster_summaries = {summary['cluster_id']: summary for summary in state['clusters']}
+        clusterer.is_fitted = True
+        return clusterer
+
+class CaseMatcher:
+    """Vectorised SymptomRecommender._calculate_similarity against every case
+
+    Symptom-word sets live in a binary case x token index, so the Jaccard
+    intersections of a query come from its posting lists and the unions from
+    per-case set sizes; the age and gender terms are NumPy array operations.
+    """
+    # ให้คะแนนเหมือน _calculate_similarity ทุกประการ แต่คิดทั้งชุดข้อมูลด้วย sparse/NumPy
+
+    # Best possible score of a case sharing no symptom word with the query
+    NO_OVERLAP_MAX = 0.3 * 1.0 + 0.1 * 1.0
+
+    def __init__(self,
+                 texts,
+                 case_ids: np.ndarray,
+                 gender_codes: np.ndarray,
+                 gender_labels: List[str],
+                 ages: np.ndarray,
+                 index: Optional[SymptomIndex] = None):
+        self.texts = texts
+        self.case_ids = case_ids
+        # Codes outside gender_labels (missing genders) are served as None
+        self.gender_codes = gender_codes
+        self.gender_labels = list(gender_labels)
+        self.gender_lookup = {label: code for code, label in enumerate(self.gender_labels)}
+        
+        ages = np.asarray(ages, dtype=np.float64)
+        self.ages = np.trunc(ages)
+        
+        if index is None:
+            index = SymptomIndex()
+            index.build([(text or '').lower() for text in texts])
+        self.index = index
+        self.set_sizes = np.diff(self.index.case_tokens.indptr)
+        
+        # Cases _find_similar_cases can score: with symptoms (unparseable summaries have
+        # none) and a numeric age
+        self.scorable = (self.set_sizes > 0) & np.isfinite(ages)
+    
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, summaries: ParsedSummaries) -> 'CaseMatcher':
+        """Matcher over a training frame's gender and age columns and its parsed summaries"""
+        gender_codes, gender_labels = pd.factorize(df['gender'])
+        return cls(summaries.texts(), summaries.case_ids, gender_codes, list(gender_labels),
+                   pd.to_numeric(df['age'], errors='coerce').to_numpy(dtype=np.float64))
+    
+    @classmethod
+    def from_store(cls, store, index: Optional[SymptomIndex] = None) -> 'CaseMatcher':
+        """Matcher over a CaseStore's columns (its rows are the cases, in order), with no copy of the texts"""
+        return cls(store.symptoms, np.arange(len(store), dtype=np.int64), store.gender_codes,
+                   store.gender_labels, store.ages, index)
+    
+    def __len__(self) -> int:
+        return len(self.case_ids)
+    
+    def cases(self, positions: np.ndarray, scores: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """id, symptoms and demographics of the cases at positions (plus their similarity_score)"""
+        positions = np.asarray(positions, dtype=np.int64)
+        labels = self.gender_labels
+        cases = [
+            {
+                'id': case_id,
+                'symptoms': self.texts[pos],
+                'demographics': {
+                    'gender': labels[code] if 0 <= code < len(labels) else None,
+                    'age': int(age)
+                }
+            }
+            for pos, case_id, code, age in zip(positions.tolist(), self.case_ids[positions].tolist(),
+                                                self.gender_codes[positions].tolist(), self.ages[positions].tolist())
+        ]
+        if scores is not None:
+            for case, score in zip(cases, scores):
+                case['similarity_score'] = score
+        return cases
+
+    def _scores(self, positions: np.ndarray, intersections: np.ndarray, n_words: int,
+                age: int, gender: str) -> np.ndarray:
+        """_calculate_similarity for the cases at positions, in the same operation order"""
+        symptom_similarity = intersections / (n_words + self.set_sizes[positions] - intersections)
+        age_similarity = 1.0 - np.abs(age - self.ages[positions]) / 100.0
+        gender_similarity = (self.gender_codes[positions] == self.gender_lookup.get(gender, -2)).astype(np.float64)
+        return 0.6 * symptom_similarity + 0.3 * age_similarity + 0.1 * gender_similarity
+
+    def find(self, symptom_text: str, age: int, gender: str,
+             threshold: float = 0.3, top_n: int = 10) -> List[Dict[str, Any]]:
+        """Top cases scoring above threshold, best first (ties in case order)"""
+        words = set(symptom_text.lower().split())
+        if not words:
+            return []
+        
+        # Candidates: cases sharing at least one word, found through the posting lists
+        postings = self.index.postings
+        token_ids = [self.index.vocabulary[w] for w in words if w in self.index.vocabulary]
+        intersections = np.bincount(
+            np.concatenate([postings.indices[postings.indptr[t]:postings.indptr[t + 1]] for t in token_ids]
+                           + [np.array([], dtype=np.int32)]),
+            minlength=len(self)
+        )
+        positions = np.flatnonzero((intersections > 0) & self.scorable)
+        scores = self._scores(positions, intersections[positions], len(words), age, gender)
+        
+        # Cases without overlap can still pass on age and gender alone, so they are only
+        # skipped when top_n candidates already beat the best score they could reach
+        if np.count_nonzero(scores > self.NO_OVERLAP_MAX) < top_n:
+            positions = np.flatnonzero(self.scorable)
+            scores = self._scores(positions, intersections[positions], len(words), age, gender)
+        
+        keep = scores > threshold
+        positions, scores = positions[keep], scores[keep]
+        order = np.argsort(-scores, kind='stable')[:top_n]
+        return self.cases(positions[order], scores[order].tolist())
+
+class QueryEncoder:
+    """TF-IDF rows of one query for several fitted vectorizers, analysing the text once
+
+    Vectorizers that tokenise alike share one analysis over their widest n-gram
+    range (n-grams outside a vocabulary simply find no column). Rows are filled in
+    directly rather than through TfidfVectorizer.transform, whose validation and
+    sparse-matrix plumbing dominate the cost for one short text, and are
+    bit-identical to it. Hashing vectorizers must share one feature space: the
+    query is then analysed and hashed once, and each weights the hashed terms
+    with its own selected columns and IDF.
+    """
+    # Settings that must agree for two vectorizers to share an analysis
+    ANALYSIS_PARAMS = ('input', 'encoding', 'decode_error', 'strip_accents', 'lowercase',
+                       'preprocessor', 'tokenizer', 'analyzer', 'stop_words', 'token_pattern')
+    
+    def __init__(self, vectorizers: List[TfidfVectorizer]):
+        self.vectorizers = list(vectorizers)
+        self.hashed_features = None
+        if self.vectorizers and all(isinstance(v, HashingTfidfVectorizer) for v in self.vectorizers):
+            if len({v.hashing_params() for v in self.vectorizers}) != 1:
+                raise ValueError("Hashing vectorizers must share one feature space")
+            self.hashed_features = self.vectorizers[0].n_features
+            self.vocabularies = [{column: i for i, column in enumerate(v.columns_.tolist())} for v in self.vectorizers]
+            self.idfs = [np.asarray(v.idf_, dtype=np.float64) for v in self.vectorizers]
+            self.direct = [True] * len(self.vectorizers)
+            self.analyzers = [(self.vectorizers[0].hasher().build_analyzer(), list(range(len(self.vectorizers))))]
+            return
+        
+        self.vocabularies = [{term: i for i, term in enumerate(v.get_feature_names_out())} for v in self.vectorizers]
+        self.idfs = [np.asarray(v.idf_, dtype=np.float64) for v in self.vectorizers]
+        # The direct path reproduces the default weighting only
+        self.direct = [
+            v.norm == 'l2' and v.use_idf and not v.sublinear_tf and not v.binary
+            for v in self.vectorizers
+        ]
+        
+        groups = {}
+        for i, vectorizer in enumerate(self.vectorizers):
+            params = vectorizer.get_params()
+            groups.setdefault(tuple(repr(params[name]) for name in self.ANALYSIS_PARAMS), []).append(i)
+        self.analyzers = []
+        for members in groups.values():
+            low = min(self.vectorizers[i].ngram_range[0] for i in members)
+            high = max(self.vectorizers[i].ngram_range[1] for i in members)
+            # The tokenizer itself is reused rather than cloned, keeping its phrase cache
+            first = self.vectorizers[members[0]]
+            analyzer = clone(first).set_params(ngram_range=(low, high), tokenizer=first.tokenizer).build_analyzer()
+            self.analyzers.append((analyzer, members))
+    
+    def encode(self, text: str) -> List[np.ndarray]:
+        """One dense (1, n_features) row per vectorizer, in constructor order"""
+        rows = [None] * len(self.vectorizers)
+        for analyzer, members in self.analyzers:
+            tokens = analyzer(text)
+            if self.hashed_features is not None:
+                tokens = hash_terms(tokens, self.hashed_features)
+            for i in members:
+                if self.direct[i]:
+                    rows[i] = self._row(tokens, self.vocabularies[i], self.idfs[i],
+                                        descending=self.hashed_features is None)
+                else:
+                    rows[i] = self.vectorizers[i].transform([text]).toarray()
+        return rows
+    
+    @staticmethod
+    def _row(tokens: list, vocabulary: Dict[Any, int], idf: np.ndarray, descending: bool = True) -> np.ndarray:
+        """Term counts weighted by IDF and l2-normalised, as TfidfVectorizer.transform
+
+        tokens are terms, or hashed columns for a HashingTfidfVectorizer.
+        """
+        counts = {}
+        for token in tokens:
+            column = vocabulary.get(token)
+            if column is not None:
+                counts[column] = counts.get(column, 0) + 1
+        
+        row = np.zeros((1, len(idf)), dtype=np.float64)
+        # Squares are summed in descending column order, the order scipy's sparse
+        # product leaves the entries in before sklearn normalises them (hashing
+        # vectorizers normalise rows whose columns are still ascending)
+        columns = sorted(counts, reverse=descending)
+        weights = [counts[column] * idf[column] for column in columns]
+        norm = math.sqrt(sum(weight * weight for weight in weights))
+        if norm > 0:
+            row[0, columns] = [weight / norm for weight in weights]
+        return row
 
 class SymptomRecommender:
     """Advanced symptom recommendation system"""
     # Similarity-based + insights	ร่วมผล classification + clustering + matching ในคิวเดียว
     
-    def __init__(self):
-        self.classifier = SymptomClassifier()
-        self.clusterer = SymptomClusterer()
+    def __init__(self,
+                 cluster_fit_mode: str = 'full',
+                 n_jobs: Optional[int] = -1,
+                 max_classes: Optional[int] = None,
+                 predict_max_trees: Optional[int] = None,
+                 predict_max_depth: Optional[int] = None,
+                 feature_hashing: bool = False,
+                 tokenizer: Optional[str] = None,
+                 age_buckets: Optional[List[Tuple[str, int, int]]] = None):
+        self.n_jobs = n_jobs
+        self.feature_hashing = feature_hashing
+        # Named tokenizer for both models' vectorizers (see tokenization.TOKENIZERS)
+        self.tokenizer = tokenizer or None
+        # Forest pruning for recommendations (see SymptomClassifier.predict_top_k)
+        self.predict_max_trees = predict_max_trees
+        self.predict_max_depth = predict_max_depth
+        # Age bands of the age-specific insights, as the API's get_age_group maps them
+        self.age_buckets = list(age_buckets or DEFAULT_AGE_BUCKETS)
+        self.classifier = SymptomClassifier(n_jobs=n_jobs, max_classes=max_classes, feature_hashing=feature_hashing)
+        self.clusterer = SymptomClusterer(fit_mode=cluster_fit_mode, feature_hashing=feature_hashing)
         self.symptom_data = None
+        self.summaries = None
+        self.case_matcher = None
+        self.query_encoder = None
+        self.age_insights = {}
+        self.gender_insights = {}
+        self.data_hash = None
         
     def train_models(self, df: pd.DataFrame):
         """Train all models"""
-        self.symptom_data = df
+        self.set_case_data(df)
+        self.fit_models()
+    
+    def set_case_data(self, df: pd.DataFrame, summaries: Optional[ParsedSummaries] = None):
+        """Attach the training cases that fitting, matching, cluster pages and insights draw on"""
+        self.data_hash = frame_sha256(df)
+        
+        # Parse every summary once (in parallel chunks) and share it across the models;
+        # the raw JSON is not needed after that
+        if summaries is None:
+            summaries = parse_summaries_parallel(df['summary'], df.index, n_jobs=self.n_jobs)
+        self.summaries = summaries
+        self.symptom_data = df.drop(columns='summary', errors='ignore')
+        
+        self.case_matcher = CaseMatcher.from_frame(self.symptom_data, self.summaries)
+        self._build_insights()
+    
+    def fit_models(self):
+        """Train the classifier and clusterer on the attached cases"""
+        # One tokenizer over the yes_symptoms terms, shared by both vectorizers
+        tokenizer = build_tokenizer(self.tokenizer, self.summaries.symptom_texts)
+        for vectorizer in (self.classifier.vectorizer, self.clusterer.vectorizer):
+            vectorizer.set_params(**with_tokenizer({}, tokenizer))
         
         print("Training symptom classifier...")
-        self.classifier.train(df)
+        self.classifier.train(self.symptom_data, self.summaries)
         
         print("Training symptom clusterer...")
-        self.clusterer.fit(df)
+        self.clusterer.fit(self.symptom_data, self.summaries)
+        
+        self.query_encoder = QueryEncoder([self.classifier.vectorizer, self.clusterer.vectorizer])
+    
+    def _build_insights(self):
+        """Age-group and gender insight tables, computed once per dataset instead of per request"""
+        ages = self.symptom_data['age']
+        self.age_insights = {}
+        # Both ends are inclusive, as in AgeBucketCache, so a boundary age counts towards two tables
+        for age_group, min_age, max_age in self.age_buckets:
+            age_filtered = self.symptom_data[(ages >= min_age) & (ages <= max_age)]
+            self.age_insights[age_group] = {
+                'age_group': age_group,
+                'total_cases': len(age_filtered),
+                'common_symptoms': self._get_common_symptoms(age_filtered.index)
+            }
+        
+        genders = self.symptom_data['gender']
+        self.gender_insights = {
+            gender: {
+                'total_cases': int(count),
+                'common_symptoms': self._get_common_symptoms(genders.index[(genders == gender).to_numpy()])
+            }
+            for gender, count in genders.value_counts(sort=False).items()
+        }
         
     def get_comprehensive_recommendations(self, 
                                         symptoms: List[str], 
@@ -204,20 +764,25 @@ class SymptomRecommender:
         if not self.classifier.is_trained:
             raise ValueError("Models not trained")
         
-        # Get classification predictions
-        predictions = self.classifier.predict(symptoms)
+        # Vectorise the query once for both the classifier and the clusterer
+        classifier_row, cluster_row = self.query_encoder.encode(' '.join(symptoms))
+        
+        # Only the three most likely classes are returned, so only those are extracted
+        labels, scores = self.classifier.top_k_features(
+            classifier_row, 3, self.predict_max_trees, self.predict_max_depth
+        )
         
-        # Get cluster information
-        clusters = self.clusterer.get_clusters(self.symptom_data)
+        # Only the query's own cluster, from the assignments cached at fit time
+        cluster_insights = self.get_cluster_cases(self.clusterer.assign_features(cluster_row), limit=10)
         
         # Find similar cases in clusters
         similar_cases = self._find_similar_cases(symptoms, age, gender)
         
         # Generate recommendations
         recommendations = {
-            'primary_diagnosis': list(predictions.keys())[:3],
-            'confidence_scores': list(predictions.values())[:3],
-            'cluster_insights': clusters,
+            'primary_diagnosis': labels[0].tolist(),
+            'confidence_scores': scores[0].tolist(),
+            'cluster_insights': cluster_insights,
             'similar_cases': similar_cases,
             'age_specific_insights': self._get_age_insights(age),
             'gender_specific_insights': self._get_gender_insights(gender)
@@ -225,38 +790,26 @@ class SymptomRecommender:
         
         return recommendations
     
+    @property
+    def n_cases(self) -> Optional[int]:
+        """Number of attached cases (None before set_case_data / load_models with cases)"""
+        return len(self.case_matcher) if self.case_matcher is not None else None
+    
+    def _require_cases(self):
+        if self.case_matcher is None:
+            raise ValueError("No case data; call set_case_data(df) or load_models(directory, cases=store)")
+    
+    def get_cluster_cases(self, cluster_id: int, offset: int = 0, limit: int = 20) -> Dict[str, Any]:
+        """Summary and one page of member cases of a cluster"""
+        self._require_cases()
+        return self.clusterer.get_cluster_members(self.case_matcher, cluster_id, offset, limit)
+    
     def _find_similar_cases(self, symptoms: List[str], age: int, gender: str) -> List[Dict[str, Any]]:
         """Find similar cases based on symptoms, age, and gender"""
-        similar_cases = []
-        symptom_text = ' '.join(symptoms)
+        self._require_cases()
         
-        for _, row in self.symptom_data.iterrows():
-            try:
-                summary = json.loads(row['summary'])
-                yes_symptoms = summary.get('yes_symptoms', [])
-                case_symptoms = ' '.join([s['text'] for s in yes_symptoms])
-                
-                # Calculate similarity score
-                similarity = self._calculate_similarity(
-                    symptom_text, case_symptoms, age, int(row['age']), gender, row['gender']
-                )
-                
-                if similarity > 0.3:  # Threshold for similarity
-                    similar_cases.append({
-                        'id': int(row.name),
-                        'symptoms': case_symptoms,
-                        'demographics': {
-                            'gender': row['gender'],
-                            'age': int(row['age'])
-                        },
-                        'similarity_score': similarity
-                    })
-            except:
-                continue
-        
-        # Sort by similarity and return top 10
-        similar_cases.sort(key=lambda x: x['similarity_score'], reverse=True)
-        return similar_cases[:10]
+        # Same weighting and threshold as _calculate_similarity, scored for all cases at once
+        return self.case_matcher.find(' '.join(symptoms), age, gender, threshold=0.3, top_n=10)
     
     def _calculate_similarity(self, 
                             symptoms1: str, 
@@ -291,65 +844,95 @@ class SymptomRecommender:
     
     def _get_age_insights(self, age: int) -> Dict[str, Any]:
         """Get age-specific insights"""
-        age_group = 'young' if age < 30 else 'middle' if age < 60 else 'elderly'
-        
-        # Filter data by age group
-        age_ranges = {
-            'young': (0, 30),
-            'middle': (30, 60),
-            'elderly': (60, 120)
-        }
-        
-        min_age, max_age = age_ranges[age_group]
-        age_filtered = self.symptom_data[
-            (self.symptom_data['age'] >= min_age) & 
-            (self.symptom_data['age'] <= max_age)
-        ]
-        
-        return {
-            'age_group': age_group,
-            'total_cases': len(age_filtered),
-            'common_symptoms': self._get_common_symptoms(age_filtered)
-        }
+        return dict(self.age_insights[get_age_group(age, self.age_buckets)])
     
     def _get_gender_insights(self, gender: str) -> Dict[str, Any]:
         """Get gender-specific insights"""
-        gender_filtered = self.symptom_data[self.symptom_data['gender'] == gender]
-        
-        return {
-            'total_cases': len(gender_filtered),
-            'common_symptoms': self._get_common_symptoms(gender_filtered)
-        }
+        insights = self.gender_insights.get(gender)
+        if insights is None:
+            return {'total_cases': 0, 'common_symptoms': []}
+        return dict(insights)
     
-    def _get_common_symptoms(self, df: pd.DataFrame) -> List[str]:
+    def _get_common_symptoms(self, case_index: pd.Index) -> List[str]:
         """Get common symptoms from filtered data"""
-        all_symptoms = []
-        
-        for _, row in df.iterrows():
-            try:
-                summary = json.loads(row['summary'])
-                yes_symptoms = summary.get('yes_symptoms', [])
-                symptoms = [s['text'] for s in yes_symptoms]
-                all_symptoms.extend(symptoms)
-            except:
-                continue
-        
-        if not all_symptoms:
+        summaries = summaries_for(self.symptom_data, self.summaries)
+        positions = self.symptom_data.index.get_indexer(case_index)
+        all_symptoms = summaries.symptoms_of(positions)
+        
+        if len(all_symptoms) == 0:
             return []
         
         symptom_counts = pd.Series(all_symptoms).value_counts()
         return symptom_counts.head(5).index.tolist()
     
-    def save_models(self, filepath: str):
-        """Save trained models"""
-        model_data = {
-            'classifier': self.classifier,
-            'clusterer': self.clusterer
-        }
-        joblib.dump(model_data, filepath)
+    def save_models(self, directory: str, data_hash: Optional[str] = None):
+        """Save trained models as .npy arrays plus a manifest, replacing directory atomically"""
+        if not self.classifier.is_trained or not self.clusterer.is_fitted:
+            raise ValueError("Models not trained")
+        
+        def write_files(tmp_dir):
+            self.classifier.save(os.path.join(tmp_dir, 'classifier'))
+            self.clusterer.save(os.path.join(tmp_dir, 'clusterer'))
+            # Serving state derived from the training cases, so a server needs only their
+            # CaseStore columns (load_models(cases=...)) and never the summaries
+            if self.case_matcher is not None:
+                self.case_matcher.index.save(os.path.join(tmp_dir, 'matcher'))
+                with open(os.path.join(tmp_dir, 'insights.json'), 'w', encoding='utf-8') as f:
+                    json.dump({'age': self.age_insights, 'gender': self.gender_insights}, f, ensure_ascii=False)
+        
+        write_atomic_dir(directory, {
+            'format_version': MODEL_FORMAT_VERSION,
+            'data_hash': data_hash or self.data_hash,
+            'feature_hashing': self.classifier.feature_hashing,
+            'tokenizer': self.tokenizer,
+            'age_buckets': self.age_buckets,
+            'cases': self.n_cases,
+            'saved_at': time.time(),
+            'classifier_metrics': self.classifier.metrics
+        }, write_files, replace=True)
     
-    def load_models(self, filepath: str):
-        """Load trained models"""
-        model_data = joblib.load(filepath)
-        self.classifier = model_data['classifier']
-        self.clusterer = model_data['clusterer'] 
\ No newline at end of file
+    def load_models(self, directory: str, mmap: bool = True, data_hash: Optional[str] = None, cases=None):
+        """Load models written by save_models, memory-mapped (and shared between processes) by default
+
+        cases, a CaseStore of the training cases in training order, attaches them for
+        matching, cluster pages and insights without the training frame.
+        """
+        manifest_path = os.path.join(directory, MODEL_MANIFEST)
+        if not os.path.exists(manifest_path):
+            raise ValueError(f"No saved models in {directory}")
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        
+        if manifest.get('format_version') != MODEL_FORMAT_VERSION:
+            raise ValueError(f"Saved models use format {manifest.get('format_version')}, "
+                             f"expected {MODEL_FORMAT_VERSION}; retrain and save them again")
+        if data_hash is not None and manifest.get('data_hash') != data_hash:
+            raise ValueError("Saved models were trained on different data")
+        # Featurisation options must match the ones the models were trained with
+        for option, default in (('feature_hashing', False), ('tokenizer', None)):
+            if manifest.get(option, default) != getattr(self, option):
+                raise ValueError(f"Saved models use {option}={manifest.get(option, default)!r}, "
+                                 f"expected {getattr(self, option)!r}")
+        age_buckets = [tuple(bucket) for bucket in manifest.get('age_buckets', DEFAULT_AGE_BUCKETS)]
+        if age_buckets != [tuple(bucket) for bucket in self.age_buckets]:
+            raise ValueError(f"Saved models' age insights use age buckets {age_buckets}, expected {self.age_buckets}")
+        
+        if cases is not None:
+            if manifest.get('cases') is None:
+                raise ValueError("Saved models hold no case data; save them after set_case_data or train_models")
+            if manifest['cases'] != len(cases):
+                raise ValueError(f"Saved models hold case data for {manifest['cases']} cases, got {len(cases)}")
+            index = SymptomIndex.load(os.path.join(directory, 'matcher'), mmap)
+            with open(os.path.join(directory, 'insights.json'), encoding='utf-8') as f:
+                insights = json.load(f)
+        
+        self.classifier = SymptomClassifier.load(os.path.join(directory, 'classifier'), mmap)
+        self.clusterer = SymptomClusterer.load(os.path.join(directory, 'clusterer'), mmap)
+        self.query_encoder = QueryEncoder([self.classifier.vectorizer, self.clusterer.vectorizer])
+        self.data_hash = manifest.get('data_hash')
+        if cases is not None:
+            self.symptom_data = None
+            self.summaries = None
+            self.case_matcher = CaseMatcher.from_store(cases, index)
+            self.age_insights = insights['age']
+            self.gender_insights = insights['gender']
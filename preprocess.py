@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Symptom Recommendation System Preprocessing
+
+Builds what the server loads but never builds itself, once, before it starts:
+- the memory-mapped serving state (when SHARED_STATE_DIR is set), so that every
+  uvicorn worker maps the same files instead of fitting its own copy
+- the /recommend/comprehensive models in MODELS_DIR (unless COMPREHENSIVE_MODELS=0)
+
+Usage:
+    SHARED_STATE_DIR=/var/lib/symptoms python preprocess.py
+    MODELS_DIR=/var/lib/symptoms/models python preprocess.py
+"""
+
+import sys
+import time
+import app
+
+
+def main():
+    """Write the shared serving state and train the comprehensive models for the current data file"""
+    train_models = app.COMPREHENSIVE_MODELS and bool(app.MODELS_DIR)
+    if not app.SHARED_STATE_DIR and not train_models:
+        print("✗ Nothing to do: SHARED_STATE_DIR is not set and the comprehensive models are disabled")
+        print("Set SHARED_STATE_DIR to the directory the workers will memory-map the state from,")
+        print("and/or MODELS_DIR (with COMPREHENSIVE_MODELS=1) to train the comprehensive models")
+        sys.exit(1)
+
+    data_hash = app.file_sha256(app.DATA_FILE)
+    if app.SHARED_STATE_DIR:
+        print(f"Preprocessing {app.DATA_FILE} into {app.SHARED_STATE_DIR}...")
+        start = time.time()
+        state = app.prepare_shared_state(data_hash)
+        print(f"✓ Shared state ready: {len(state['cases'])} records in {time.time() - start:.1f}s")
+
+    if train_models:
+        print(f"Training comprehensive models on {app.DATA_FILE} into {app.MODELS_DIR}...")
+        start = time.time()
+        recommender = app.train_recommender(data_hash)
+        print(f"✓ Models ready: {recommender.n_cases} cases in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
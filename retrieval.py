@@ -0,0 +1,156 @@
+import numpy as np
+from scipy import sparse
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.preprocessing import normalize
+from typing import Tuple, Optional, List
+
+RETRIEVAL_BACKENDS = ('exact', 'ivf')
+
+
+def top_k_scores(scores: np.ndarray, top_k: int, min_score: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+    """Positions and values of the top_k scores above min_score, best first"""
+    # Threshold first: the partition then only touches cases that can be returned
+    positions = np.flatnonzero(scores > min_score)
+    if len(positions) > top_k:
+        best = np.argpartition(-scores[positions], top_k - 1)[:top_k]
+        positions = positions[best]
+    positions = positions[np.argsort(-scores[positions], kind='stable')]
+    return positions, scores[positions]
+
+
+def merge_hits(hits: List[Tuple[np.ndarray, np.ndarray]], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Combine best-first (indices, scores) results from several segments into one top_k"""
+    indices = np.concatenate([segment_indices for segment_indices, _ in hits])
+    scores = np.concatenate([segment_scores for _, segment_scores in hits])
+    # Stable, so ties keep the earlier segment's order
+    order = np.argsort(-scores, kind='stable')[:top_k]
+    return indices[order], scores[order]
+
+
+class ExactSearch:
+    """Exact cosine search: one sparse matrix-vector product over every case (reference backend)"""
+
+    def __init__(self, vectors: sparse.csr_matrix):
+        # TfidfVectorizer rows are already L2-normalised, so a dot product is the cosine
+        self.vectors = vectors
+
+    def search(self,
+               query_vector: sparse.csr_matrix,
+               top_k: int,
+               min_score: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+        """Indices and scores of the top_k most similar cases above min_score, best first"""
+        query = normalize(query_vector).toarray().ravel()
+        scores = self.vectors @ query
+        return top_k_scores(scores, top_k, min_score)
+
+    def search_batch(self,
+                     query_vectors: sparse.csr_matrix,
+                     top_k: int,
+                     min_score: float = 0.0,
+                     max_scores: int = 1 << 23) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """search() for every query row, scoring them with one sparse-dense product per block"""
+        queries = normalize(query_vectors).toarray()
+        # Bound the dense (cases x queries) score block to max_scores entries
+        block_size = max(1, max_scores // max(1, self.vectors.shape[0]))
+
+        results = []
+        for start in range(0, queries.shape[0], block_size):
+            scores = self.vectors @ queries[start:start + block_size].T
+            for column in range(scores.shape[1]):
+                results.append(top_k_scores(np.ascontiguousarray(scores[:, column]), top_k, min_score))
+        return results
+
+
+class IVFSearch:
+    """Approximate search over an inverted-file index of the L2-normalised vectors"""
+    # แบ่ง case เป็นกลุ่มด้วย k-means แล้วค้นเฉพาะกลุ่มที่ใกล้ query ที่สุด
+
+    def __init__(self,
+                 vectors: sparse.csr_matrix,
+                 n_lists: Optional[int] = None,
+                 n_probe: int = 8,
+                 random_state: int = 42,
+                 chunk_size: int = 10000):
+        self.vectors = vectors
+        self.n_lists = max(1, min(n_lists or int(np.sqrt(vectors.shape[0])), vectors.shape[0]))
+        self.n_probe = max(1, min(n_probe, self.n_lists))
+        self.random_state = random_state
+        self.chunk_size = chunk_size
+        self.centroids = None
+        self.list_offsets = None
+        self.list_members = None
+
+    def build(self) -> 'IVFSearch':
+        """Partition the cases by their most similar (spherical) centroid"""
+        kmeans = MiniBatchKMeans(
+            n_clusters=self.n_lists,
+            random_state=self.random_state,
+            batch_size=1024,
+            n_init=3
+        )
+        kmeans.fit(self.vectors)
+        self.centroids = normalize(kmeans.cluster_centers_)
+
+        # Assign by cosine to the normalised centroids, in chunks to bound memory
+        labels = np.empty(self.vectors.shape[0], dtype=np.int32)
+        for start in range(0, self.vectors.shape[0], self.chunk_size):
+            block = self.vectors[start:start + self.chunk_size]
+            labels[start:start + self.chunk_size] = np.asarray(
+                (block @ self.centroids.T).argmax(axis=1)
+            ).ravel()
+
+        self.list_members = np.argsort(labels, kind='stable').astype(np.int64)
+        self.list_offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=self.n_lists), out=self.list_offsets[1:])
+        return self
+
+    def search(self,
+               query_vector: sparse.csr_matrix,
+               top_k: int,
+               min_score: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+        """Indices and scores of the approximate top_k cases above min_score, best first"""
+        query = normalize(query_vector).toarray().ravel()
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(-centroid_scores, self.n_probe - 1)[:self.n_probe]
+
+        candidates = np.concatenate([
+            self.list_members[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probes
+        ])
+        if len(candidates) == 0:
+            return candidates, np.array([], dtype=np.float64)
+
+        scores = self.vectors[candidates] @ query
+        best, best_scores = top_k_scores(scores, top_k, min_score)
+        return candidates[best], best_scores
+
+    def search_batch(self,
+                     query_vectors: sparse.csr_matrix,
+                     top_k: int,
+                     min_score: float = 0.0) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """search() for every query row (each probes its own partitions)"""
+        return [self.search(query_vectors[i], top_k, min_score) for i in range(query_vectors.shape[0])]
+
+
+def build_retriever(backend: str, vectors: sparse.csr_matrix, **options):
+    """Create the retrieval backend selected by configuration"""
+    if backend == 'exact':
+        return ExactSearch(vectors)
+    if backend == 'ivf':
+        return IVFSearch(vectors, **options).build()
+    raise ValueError(f"Unknown retrieval backend '{backend}', expected one of {RETRIEVAL_BACKENDS}")
+
+
+def recall_at_k(reference, candidate, queries: sparse.csr_matrix, k: int = 10) -> float:
+    """Share of the reference backend's positive-score top-k that the candidate also returns"""
+    found, expected = 0, 0
+    for i in range(queries.shape[0]):
+        query = queries[i]
+        _, ref_scores = reference.search(query, k)
+        if len(ref_scores) == 0:
+            continue
+        _, cand_scores = candidate.search(query, k)
+        # Tie-aware: any hit scoring at least the k-th reference score counts
+        hits = int(np.sum(cand_scores >= ref_scores.min() - 1e-12))
+        found += min(hits, len(ref_scores))
+        expected += len(ref_scores)
+    return found / expected if expected else 1.0
@@ -0,0 +1,275 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from typing import Callable, Dict, Any, List, Awaitable, Hashable, Optional
+
+
+class ComputePoolFull(Exception):
+    """Raised when the compute pool already holds its maximum number of jobs"""
+
+
+class ComputePool:
+    """Bounded thread pool that keeps CPU-bound request work off the event loop
+
+    The threads are started on first use and again after shutdown(), so the pool
+    survives several application lifespans in one process.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 32):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.executor = None
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Run fn in the pool, or raise ComputePoolFull if no slot is free"""
+        with self.lock:
+            if self.in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ComputePoolFull(
+                    f"Compute pool is full ({self.max_workers} running, {self.max_queue} queued)"
+                )
+            self.in_flight += 1
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="compute")
+            executor = self.executor
+
+        submitted = time.perf_counter()
+
+        def job():
+            waited = time.perf_counter() - submitted
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
+                    self.completed += 1
+                    self.total_wait += waited
+
+        return await asyncio.get_running_loop().run_in_executor(executor, job)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool occupancy and counters"""
+        with self.lock:
+            return {
+                'workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'in_flight': self.in_flight,
+                'queued': max(0, self.in_flight - self.max_workers),
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'avg_queue_wait_ms': 1000 * self.total_wait / self.completed if self.completed else 0.0
+            }
+
+    def shutdown(self):
+        """Wait for running jobs and stop the threads; the next run() starts new ones"""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+class RequestCoalescer:
+    """Collects requests arriving within a short window and runs them as one batch"""
+
+    def __init__(self,
+                 batch_fn: Callable[[List[Any]], List[Any]],
+                 runner: Callable[..., Awaitable[Any]],
+                 window_ms: float = 2.0,
+                 max_batch: int = 32):
+        self.batch_fn = batch_fn
+        self.runner = runner
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.pending = []
+        self.timer = None
+        self.tasks = set()
+        self.batches = 0
+        self.requests = 0
+        self.max_batch_size = 0
+        self.batch_sizes = {}
+        self.total_delay = 0.0
+        self.max_delay = 0.0
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its share of the batch result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((item, future, time.perf_counter()))
+
+        if len(self.pending) >= self.max_batch:
+            self._flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """Hand the pending items to a batch job"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            # Keep a reference so the task is not garbage collected mid-flight
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, batch):
+        """Run one batch and fan the results back out to the waiting requests"""
+        started = time.perf_counter()
+        self._record(len(batch), [started - queued for _, _, queued in batch])
+
+        try:
+            results = await self.runner(self.batch_fn, [item for item, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _record(self, size: int, delays: List[float]):
+        """Update batch size and queueing delay metrics"""
+        self.batches += 1
+        self.requests += size
+        self.max_batch_size = max(self.max_batch_size, size)
+        bucket = 1 << (size - 1).bit_length()  # 1, 2, 4, 8, ...
+        self.batch_sizes[bucket] = self.batch_sizes.get(bucket, 0) + 1
+        self.total_delay += sum(delays)
+        self.max_delay = max([self.max_delay] + delays)
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch size and queueing delay metrics"""
+        return {
+            'window_ms': self.window * 1000,
+            'max_batch': self.max_batch,
+            'batches': self.batches,
+            'requests': self.requests,
+            'avg_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'max_batch_size': self.max_batch_size,
+            'batch_size_histogram': {f"<={size}": count for size, count in sorted(self.batch_sizes.items())},
+            'avg_queue_delay_ms': 1000 * self.total_delay / self.requests if self.requests else 0.0,
+            'max_queue_delay_ms': 1000 * self.max_delay
+        }
+
+
+class ResultCache:
+    """Bounded LRU cache with per-entry TTL for computed responses"""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0):
+        self.max_entries = max(0, max_entries)
+        self.ttl = ttl_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Cached value for key, or None on a miss"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        """Store value unless the cache was cleared since generation was read"""
+        if self.max_entries == 0:
+            return
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return  # Computed against data that has since been reloaded
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry, e.g. after the data or model is reloaded"""
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit / miss counters and occupancy"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'generation': self.generation
+            }
+
+
+class LatencyTracker:
+    """Rolling window of request latencies, reported as percentiles against a budget"""
+
+    def __init__(self, budget_ms: float, window: int = 1000):
+        self.budget_ms = budget_ms
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.over_budget = 0
+
+    def record(self, seconds: float):
+        """Add one request's wall time"""
+        elapsed_ms = seconds * 1000
+        with self.lock:
+            self.samples.append(elapsed_ms)
+            self.requests += 1
+            if elapsed_ms > self.budget_ms:
+                self.over_budget += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Percentiles over the window and the share of all requests over budget"""
+        with self.lock:
+            samples = list(self.samples)
+            requests, over_budget = self.requests, self.over_budget
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99]).tolist() if samples else (0.0, 0.0, 0.0)
+        return {
+            'budget_p95_ms': self.budget_ms,
+            'window': len(samples),
+            'p50_ms': p50,
+            'p95_ms': p95,
+            'p99_ms': p99,
+            'within_budget': p95 <= self.budget_ms,
+            'requests': requests,
+            'over_budget_rate': over_budget / requests if requests else 0.0
+        }
+
+
+def default_compute_workers() -> int:
+    """Pool size when COMPUTE_WORKERS is not set"""
+    return min(4, os.cpu_count() or 1)
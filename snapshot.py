@@ -0,0 +1,241 @@
+import itertools
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, Any, List, Optional, Tuple
+from delta import DeltaSegment
+from retrieval import merge_hits
+
+
+class ModelSnapshot:
+    """Immutable bundle of everything a request reads: model, indexes and case data
+
+    Requests take one reference at the start and use it throughout, so a reload
+    that swaps in a new snapshot never mixes state from two datasets.
+    """
+
+    __slots__ = ('version', 'data_hash', 'loaded_at', 'vectorizer', 'vectors', 'scaler',
+                 'index', 'age_cache', 'stats', 'cases', 'retriever', 'delta', 'recommender')
+
+    def __init__(self, version: int, data_hash: str, vectorizer, vectors, scaler,
+                 index, age_cache, stats, cases, retriever, delta: Optional[DeltaSegment] = None,
+                 recommender=None):
+        fields = {
+            'version': version,
+            'data_hash': data_hash,
+            'loaded_at': time.time(),
+            'vectorizer': vectorizer,
+            'vectors': vectors,
+            'scaler': scaler,
+            'index': index,
+            'age_cache': age_cache,
+            'stats': stats,
+            'cases': cases,
+            'retriever': retriever,
+            'delta': delta,
+            'recommender': recommender
+        }
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ModelSnapshot is immutable; build a new one instead")
+
+    def __len__(self) -> int:
+        return len(self.cases) + (len(self.delta) if self.delta is not None else 0)
+
+    def describe(self) -> Dict[str, Any]:
+        """Identity of the snapshot for status endpoints"""
+        return {
+            'version': self.version,
+            'data_hash': self.data_hash,
+            'loaded_at': self.loaded_at,
+            'records': len(self),
+            'delta_records': len(self.delta) if self.delta is not None else 0,
+            'recommender_cases': self.recommender.n_cases if self.recommender is not None else None
+        }
+
+    def search(self, query_vector, top_k: int, min_score: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+        """Top cases over the main matrix and the delta segment"""
+        hits = self.retriever.search(query_vector, top_k, min_score)
+        if self.delta is None:
+            return hits
+        return merge_hits([hits, self.delta.search(query_vector, top_k, min_score)], top_k)
+
+    def search_batch(self, query_vectors, top_k: int, min_score: float = 0.0) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """search() for every query row"""
+        hits = self.retriever.search_batch(query_vectors, top_k, min_score)
+        if self.delta is None:
+            return hits
+        delta_hits = self.delta.search_batch(query_vectors, top_k, min_score)
+        return [merge_hits(pair, top_k) for pair in zip(hits, delta_hits)]
+
+    def records(self, indices: np.ndarray) -> List[Dict[str, Any]]:
+        """Served fields of main and delta cases by global case id"""
+        indices = np.asarray(indices, dtype=np.int64)
+        n_main = len(self.cases)
+        if self.delta is None or not (indices >= n_main).any():
+            return self.cases.records(indices)
+        return [
+            self.cases.record(idx) if idx < n_main else self.delta.record(idx - n_main)
+            for idx in indices.tolist()
+        ]
+
+    def with_cases(self, frame: pd.DataFrame, version: int) -> 'ModelSnapshot':
+        """New snapshot with frame's cases appended to the delta segment
+
+        The fitted model, main segment and recommender are shared; only the delta,
+        the symptom index, the age-bucket tables and the dataset stats are extended.
+        """
+        if self.delta is None:
+            delta = DeltaSegment.create(len(self.cases), frame, self.vectorizer)
+        else:
+            delta = self.delta.appended(frame, self.vectorizer)
+        index = self.index.extended(frame['extracted_symptoms'])
+        age_cache = self.age_cache.extended(frame['age'].to_numpy(), index)
+        stats = self.stats.extended(frame['gender'], frame['age'].to_numpy(), index)
+        return ModelSnapshot(version, self.data_hash, self.vectorizer, self.vectors, self.scaler,
+                             index, age_cache, stats, self.cases, self.retriever, delta, self.recommender)
+
+
+class SnapshotManager:
+    """Holds the live ModelSnapshot and rebuilds it in the background on demand
+
+    finalize, if given, is applied to every full rebuild (see reload), e.g. to carry
+    over state of the live snapshot that the build does not reproduce.
+    """
+
+    def __init__(self,
+                 build_fn: Callable[[int], ModelSnapshot],
+                 on_swap: Optional[Callable[[ModelSnapshot], None]] = None,
+                 finalize: Optional[Callable[[ModelSnapshot, ModelSnapshot, int], Optional[ModelSnapshot]]] = None):
+        self.build_fn = build_fn
+        self.on_swap = on_swap
+        self.finalize = finalize
+        self.snapshot = None
+        self.versions = itertools.count(1)
+        self.lock = threading.Lock()
+        self.update_lock = threading.Lock()
+        self.reloader = None
+        self.watcher = None
+        self.stopped = threading.Event()
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_duration = None
+
+    def current(self) -> Optional[ModelSnapshot]:
+        """The live snapshot (None until the first load)"""
+        return self.snapshot
+
+    def next_version(self) -> int:
+        """A fresh snapshot version number"""
+        with self.lock:
+            return next(self.versions)
+
+    def _swap(self, snapshot: ModelSnapshot):
+        # A single reference assignment: readers see either the old or the new snapshot
+        self.snapshot = snapshot
+        if self.on_swap is not None:
+            self.on_swap(snapshot)
+
+    def load(self):
+        """Build and install a snapshot in the calling thread (used at startup)"""
+        snapshot = self.build_fn(self.next_version())
+        with self.update_lock:
+            self._swap(snapshot)
+
+    def update(self, fn: Callable[[ModelSnapshot, int], ModelSnapshot]) -> ModelSnapshot:
+        """Derive and install a new snapshot from the live one, one update at a time"""
+        with self.update_lock:
+            snapshot = fn(self.snapshot, self.next_version())
+            self._swap(snapshot)
+            return snapshot
+
+    def reload(self,
+               reason: str = "manual",
+               build_fn: Optional[Callable[[int], ModelSnapshot]] = None,
+               finalize: Optional[Callable[[ModelSnapshot, ModelSnapshot, int], Optional[ModelSnapshot]]] = None) -> bool:
+        """Start a background rebuild; False if one is already running
+
+        build_fn defaults to the full build, and then finalize to the manager's.
+        finalize(built, live, version), called under the update lock, may adapt the
+        result to updates made while it was building, or return None to discard it.
+        """
+        if build_fn is None:
+            build_fn, finalize = self.build_fn, finalize or self.finalize
+        with self.lock:
+            if self.reloader is not None and self.reloader.is_alive():
+                return False
+            self.reloader = threading.Thread(
+                target=self._rebuild, args=(reason, build_fn, finalize),
+                name="snapshot-reload", daemon=True
+            )
+            self.reloader.start()
+            return True
+
+    def _rebuild(self, reason: str, build_fn: Callable, finalize: Optional[Callable]):
+        """Build the next snapshot off the request path, keeping the old one on failure"""
+        print(f"Reloading model snapshot ({reason})")
+        started = time.perf_counter()
+        try:
+            snapshot = build_fn(self.next_version())
+            with self.update_lock:
+                if finalize is not None:
+                    snapshot = finalize(snapshot, self.snapshot, self.next_version())
+                if snapshot is None:
+                    print(f"Discarded rebuilt snapshot ({reason}): superseded while building")
+                    return
+                self._swap(snapshot)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            print(f"Snapshot reload failed, still serving the previous snapshot: {e}")
+            return
+
+        self.reloads += 1
+        self.last_error = None
+        self.last_duration = time.perf_counter() - started
+        print(f"Swapped in snapshot {snapshot.version} after {self.last_duration:.1f}s")
+
+    def watch(self, path: str, interval: float):
+        """Poll path and reload once a change has been stable for one interval"""
+        def fingerprint() -> Optional[Tuple[int, int]]:
+            try:
+                stat = os.stat(path)
+                return stat.st_mtime_ns, stat.st_size
+            except OSError:
+                return None
+
+        def poll():
+            loaded = seen = fingerprint()
+            while not self.stopped.wait(interval):
+                current = fingerprint()
+                # Waiting for two identical readings avoids loading a half-written file
+                if current is not None and current != loaded and current == seen:
+                    if self.reload(f"{path} changed"):
+                        loaded = current
+                seen = current
+
+        self.stopped.clear()
+        self.watcher = threading.Thread(target=poll, name="snapshot-watch", daemon=True)
+        self.watcher.start()
+
+    def stop(self):
+        """Stop the file watcher"""
+        self.stopped.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Live snapshot identity and reload counters"""
+        snapshot = self.snapshot
+        return {
+            'snapshot': snapshot.describe() if snapshot is not None else None,
+            'reloading': self.reloader is not None and self.reloader.is_alive(),
+            'watching': self.watcher is not None and not self.stopped.is_set(),
+            'reloads': self.reloads,
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'last_reload_seconds': self.last_duration
+        }
@@ -0,0 +1,151 @@
+import os
+import numpy as np
+from scipy import sparse
+from typing import Optional
+
+
+def save_array(directory: str, name: str, array: np.ndarray):
+    """Write an array as a flat .npy file"""
+    np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(array), allow_pickle=False)
+
+
+def load_array(directory: str, name: str, mmap: bool = True) -> np.ndarray:
+    """Read an array, memory-mapped read-only so processes share the pages"""
+    return np.load(os.path.join(directory, f"{name}.npy"),
+                   mmap_mode='r' if mmap else None,
+                   allow_pickle=False)
+
+
+def _save_compressed(directory: str, name: str, matrix):
+    """Write a CSR/CSC matrix as separate data/indices/indptr arrays"""
+    save_array(directory, f"{name}.data", matrix.data)
+    save_array(directory, f"{name}.indices", matrix.indices)
+    save_array(directory, f"{name}.indptr", matrix.indptr)
+    save_array(directory, f"{name}.shape", np.array(matrix.shape, dtype=np.int64))
+
+
+def _load_compressed(directory: str, name: str, mmap: bool, matrix_class):
+    """Rebuild a CSR/CSC matrix on top of the stored arrays without copying them"""
+    data = load_array(directory, f"{name}.data", mmap)
+    indices = load_array(directory, f"{name}.indices", mmap)
+    indptr = load_array(directory, f"{name}.indptr", mmap)
+    shape = tuple(int(n) for n in load_array(directory, f"{name}.shape", mmap=False))
+
+    matrix = matrix_class(shape, dtype=data.dtype)
+    # Assign the arrays directly; the constructor would validate and may copy them
+    matrix.data, matrix.indices, matrix.indptr = data, indices, indptr
+    return matrix
+
+
+def save_csr(directory: str, name: str, matrix: sparse.spmatrix):
+    """Write a matrix in CSR layout"""
+    _save_compressed(directory, name, sparse.csr_matrix(matrix))
+
+
+def load_csr(directory: str, name: str, mmap: bool = True) -> sparse.csr_matrix:
+    """Open a matrix written by save_csr()"""
+    return _load_compressed(directory, name, mmap, sparse.csr_matrix)
+
+
+def save_csc(directory: str, name: str, matrix: sparse.spmatrix):
+    """Write a matrix in CSC layout"""
+    _save_compressed(directory, name, sparse.csc_matrix(matrix))
+
+
+def load_csc(directory: str, name: str, mmap: bool = True) -> sparse.csc_matrix:
+    """Open a matrix written by save_csc()"""
+    return _load_compressed(directory, name, mmap, sparse.csc_matrix)
+
+
+class StringColumn:
+    """Strings stored as one UTF-8 buffer plus an offsets array
+
+    With interning, each distinct string is stored once and `codes` maps every
+    row to its slot in the buffer (-1 for nulls).
+    """
+
+    def __init__(self,
+                 buffer: np.ndarray,
+                 offsets: np.ndarray,
+                 nulls: Optional[np.ndarray] = None,
+                 codes: Optional[np.ndarray] = None):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.nulls = nulls
+        self.codes = codes
+
+    @classmethod
+    def from_values(cls, values, intern: bool = False) -> 'StringColumn':
+        """Encode a sequence of strings (None / NaN become nulls)"""
+        encoded = []
+        nulls = []
+        codes = []
+        slots = {}
+        for value in values:
+            is_null = value is None or (isinstance(value, float) and np.isnan(value))
+            if intern:
+                if is_null:
+                    codes.append(-1)
+                    continue
+                value = str(value)
+                slot = slots.get(value)
+                if slot is None:
+                    slot = slots[value] = len(encoded)
+                    encoded.append(value.encode('utf-8'))
+                codes.append(slot)
+            else:
+                nulls.append(is_null)
+                encoded.append(b'' if is_null else str(value).encode('utf-8'))
+
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        buffer = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        if intern:
+            return cls(buffer, offsets, codes=np.array(codes, dtype=np.int32))
+        nulls = np.array(nulls, dtype=bool)
+        return cls(buffer, offsets, nulls if nulls.any() else None)
+
+    def __len__(self) -> int:
+        if self.codes is not None:
+            return len(self.codes)
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> Optional[str]:
+        if self.codes is not None:
+            idx = self.codes[idx]
+            if idx < 0:
+                return None
+        elif self.nulls is not None and self.nulls[idx]:
+            return None
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return self.buffer[start:end].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the column's arrays"""
+        arrays = [self.buffer, self.offsets, self.nulls, self.codes]
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    def save(self, directory: str, name: str):
+        """Write the column as flat arrays"""
+        save_array(directory, f"{name}.buffer", self.buffer)
+        save_array(directory, f"{name}.offsets", self.offsets)
+        if self.nulls is not None:
+            save_array(directory, f"{name}.nulls", self.nulls)
+        if self.codes is not None:
+            save_array(directory, f"{name}.codes", self.codes)
+
+    @classmethod
+    def load(cls, directory: str, name: str, mmap: bool = True) -> 'StringColumn':
+        """Open a column written by save()"""
+        optional = {}
+        for part in ('nulls', 'codes'):
+            if os.path.exists(os.path.join(directory, f"{name}.{part}.npy")):
+                optional[part] = load_array(directory, f"{name}.{part}", mmap)
+        return cls(load_array(directory, f"{name}.buffer", mmap),
+                   load_array(directory, f"{name}.offsets", mmap),
+                   **optional)
@@ -0,0 +1,131 @@
+import json
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Iterable, Optional
+
+
+class ParsedSummaries:
+    """The `summary` JSON column parsed once into flat, position-aligned arrays"""
+    # แปลง JSON ครั้งเดียว แล้วให้ทั้ง app.py และ models.py ใช้ร่วมกัน
+
+    def __init__(self,
+                 case_ids: np.ndarray,
+                 valid: np.ndarray,
+                 offsets: np.ndarray,
+                 symptom_texts: np.ndarray):
+        self.case_ids = case_ids
+        self.valid = valid
+        self.offsets = offsets
+        self.symptom_texts = symptom_texts
+        self._joined = None
+
+    def __len__(self) -> int:
+        return len(self.case_ids)
+
+    def symptoms(self, position: int) -> List[str]:
+        """yes_symptoms texts of one case"""
+        return self.symptom_texts[self.offsets[position]:self.offsets[position + 1]].tolist()
+
+    def texts(self) -> List[str]:
+        """Space-joined symptom text per case ('' when the summary could not be parsed)"""
+        if self._joined is None:
+            flat = self.symptom_texts.tolist()
+            self._joined = [
+                ' '.join(flat[start:end])
+                for start, end in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist())
+            ]
+        return self._joined
+
+    def has_symptoms(self) -> np.ndarray:
+        """Mask of cases whose joined symptom text is not blank"""
+        return np.array([bool(text.strip()) for text in self.texts()], dtype=bool)
+
+    def primary_symptoms(self) -> np.ndarray:
+        """First yes_symptoms text per case ('unknown' when there is none)"""
+        primary = np.full(len(self), 'unknown', dtype=object)
+        non_empty = self.offsets[1:] > self.offsets[:-1]
+        primary[non_empty] = self.symptom_texts[self.offsets[:-1][non_empty]]
+        return primary
+
+    def symptoms_of(self, positions: Iterable[int]) -> np.ndarray:
+        """Flat array of the symptom texts of several cases"""
+        positions = np.asarray(list(positions), dtype=np.int64)
+        if len(positions) == 0:
+            return np.array([], dtype=object)
+        starts, ends = self.offsets[positions], self.offsets[positions + 1]
+        lengths = ends - starts
+        # Expand [start, end) ranges into one gather index without a Python loop
+        gather = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return self.symptom_texts[gather]
+
+
+def _parse_one(summary) -> Optional[List[str]]:
+    """yes_symptoms texts of one summary, or None if it is malformed"""
+    try:
+        yes_symptoms = json.loads(summary).get('yes_symptoms', [])
+        texts = [symptom['text'] for symptom in yes_symptoms]
+        ' '.join(texts)  # Non-string texts make the row unusable, as before
+        return texts
+    except Exception:
+        return None
+
+
+def parse_summaries(summaries: Iterable[str], case_ids: Optional[Iterable[int]] = None) -> ParsedSummaries:
+    """Parse every summary exactly once"""
+    parsed = [_parse_one(summary) for summary in summaries]
+    valid = np.array([texts is not None for texts in parsed], dtype=bool)
+
+    lengths = np.array([len(texts) if texts else 0 for texts in parsed], dtype=np.int64)
+    offsets = np.zeros(len(parsed) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    symptom_texts = np.empty(int(offsets[-1]), dtype=object)
+    symptom_texts[:] = [text for texts in parsed if texts for text in texts]
+
+    if case_ids is None:
+        case_ids = np.arange(len(parsed), dtype=np.int64)
+    else:
+        case_ids = np.asarray(list(case_ids), dtype=np.int64)
+
+    return ParsedSummaries(case_ids, valid, offsets, symptom_texts)
+
+
+def concat_summaries(parts: List[ParsedSummaries]) -> ParsedSummaries:
+    """Join parsed chunks back into one ParsedSummaries, in order"""
+    offsets = [np.zeros(1, dtype=np.int64)]
+    shift = 0
+    for part in parts:
+        offsets.append(part.offsets[1:] + shift)
+        shift += part.offsets[-1]
+
+    symptom_texts = np.empty(int(shift), dtype=object)
+    if parts:
+        symptom_texts[:] = np.concatenate([part.symptom_texts for part in parts])
+    return ParsedSummaries(
+        np.concatenate([part.case_ids for part in parts] or [np.array([], dtype=np.int64)]),
+        np.concatenate([part.valid for part in parts] or [np.array([], dtype=bool)]),
+        np.concatenate(offsets),
+        symptom_texts
+    )
+
+
+def parse_summaries_parallel(summaries: Iterable[str],
+                             case_ids: Optional[Iterable[int]] = None,
+                             n_jobs: Optional[int] = -1,
+                             chunk_size: int = 50000) -> ParsedSummaries:
+    """parse_summaries split into chunks across worker processes (n_jobs=-1: one per CPU)"""
+    summaries = list(summaries)
+    case_ids = np.arange(len(summaries), dtype=np.int64) if case_ids is None else np.asarray(list(case_ids), dtype=np.int64)
+    n_workers = (os.cpu_count() or 1) if n_jobs is None or n_jobs < 0 else n_jobs
+    if n_workers <= 1 or len(summaries) <= chunk_size:
+        return parse_summaries(summaries, case_ids)
+
+    starts = range(0, len(summaries), chunk_size)
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        parts = list(pool.map(
+            parse_summaries,
+            [summaries[start:start + chunk_size] for start in starts],
+            [case_ids[start:start + chunk_size] for start in starts]
+        ))
+    return concat_summaries(parts)
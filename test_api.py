@@ -1,3 +1,4 @@
+import os
 import requests
 import json
 import time
@@ -5,6 +6,9 @@ import time
 # API base URL
 BASE_URL = "http://localhost:8000"
 
+# /admin/reload and /cases are disabled unless the server's ADMIN_TOKEN is set; pass the same value here
+ADMIN_HEADERS = {"X-Admin-Token": os.getenv("ADMIN_TOKEN", "")}
+
 def test_health_check():
     """Test the health check endpoint"""
     print("Testing health check...")
@@ -76,6 +80,36 @@ def test_symptom_recommendations():
         print(f"Error: {response.text}")
     print()
 
+def test_batch_recommendations():
+    """Test the batch recommendation endpoint"""
+    print("Testing batch recommendations...")
+    
+    batch = [
+        {
+            "gender": "male",
+            "age": 28,
+            "symptoms": ["ไอ", "เสมหะ"],
+            "search_terms": "มีเสมหะ, ไอ"
+        },
+        {
+            "gender": "female",
+            "age": 26,
+            "symptoms": ["ปวดท้อง"],
+            "search_terms": "ปวดท้อง"
+        }
+    ]
+    
+    response = requests.post(f"{BASE_URL}/recommend/batch", json=batch)
+    print(f"Status: {response.status_code}")
+    if response.status_code == 200:
+        results = response.json()
+        print(f"Received {len(results)} results for {len(batch)} patients")
+        for patient, result in zip(batch, results):
+            print(f"  {patient['symptoms']}: {len(result['recommendations'])} similar cases")
+    else:
+        print(f"Error: {response.text}")
+    print()
+
 def test_symptom_analysis():
     """Test the symptom analysis endpoint"""
     print("Testing symptom analysis...")
@@ -112,6 +146,73 @@ def test_age_group_insights():
             print(f"  Error: {response.text}")
         print()
 
+def test_comprehensive_recommendation():
+    """Test the model-backed comprehensive recommendation endpoint"""
+    print("Testing comprehensive recommendation...")
+    patient = {
+        "gender": "male",
+        "age": 28,
+        "symptoms": ["ไอ", "เสมหะ"],
+        "search_terms": "มีเสมหะ, ไอ"
+    }
+    
+    response = requests.post(f"{BASE_URL}/recommend/comprehensive", json=patient)
+    print(f"Status: {response.status_code}")
+    if response.status_code == 200:
+        result = response.json()
+        print(f"Primary diagnosis: {result['primary_diagnosis']} ({result['confidence_scores']})")
+        print(f"Cluster {result['cluster_insights']['cluster_id']}: {result['cluster_insights']['centroid_symptoms']}")
+        print(f"Similar cases: {len(result['similar_cases'])}")
+        print(f"Age group: {result['age_specific_insights']['age_group']}")
+        
+        latency = requests.get(f"{BASE_URL}/metrics").json()['comprehensive_latency']
+        print(f"p95 {latency['p95_ms']:.1f} ms (budget {latency['budget_p95_ms']} ms)")
+    else:
+        print(f"Error: {response.text}")
+    print()
+
+def test_case_ingestion():
+    """Test appending new cases"""
+    print("Testing case ingestion...")
+    new_case = {
+        "gender": "female",
+        "age": 41,
+        "symptoms": ["ไข้", "ผื่น", "ปวดข้อ"],
+        "search_terms": "ไข้, ผื่น"
+    }
+    
+    response = requests.post(f"{BASE_URL}/cases", json=[new_case], headers=ADMIN_HEADERS)
+    print(f"Status: {response.status_code}")
+    if response.status_code == 201:
+        result = response.json()
+        print(f"Ingested case ids: {result['case_ids']} ({result['delta_records']} cases in the delta segment)")
+        
+        # The new case is searchable straight away
+        response = requests.post(f"{BASE_URL}/recommend", json=new_case)
+        matches = [case['id'] for case in response.json()['similar_cases']]
+        print(f"New case among the matches: {result['case_ids'][0] in matches}")
+    else:
+        print(f"Error: {response.text}")
+    print()
+
+def test_model_reload():
+    """Test the hot reload endpoint"""
+    print("Testing model reload...")
+    response = requests.post(f"{BASE_URL}/admin/reload", headers=ADMIN_HEADERS)
+    print(f"Status: {response.status_code}")
+    if response.status_code == 202:
+        # Requests keep being served while the new snapshot builds
+        for _ in range(60):
+            reload_status = requests.get(f"{BASE_URL}/metrics").json()['model_snapshot']
+            if not reload_status['reloading']:
+                break
+            time.sleep(0.5)
+        print(f"Serving snapshot {reload_status['snapshot']['version']} "
+              f"({reload_status['reloads']} reloads, {reload_status['failures']} failures)")
+    else:
+        print(f"Error: {response.text}")
+    print()
+
 def test_comprehensive_scenarios():
     """Test comprehensive scenarios with different symptom combinations"""
     print("Testing comprehensive scenarios...")
@@ -178,8 +279,12 @@ def main():
         
         # Test main functionality
         test_symptom_recommendations()
+        test_batch_recommendations()
         test_symptom_analysis()
         test_age_group_insights()
+        test_comprehensive_recommendation()
+        test_case_ingestion()
+        test_model_reload()
         
         # Test comprehensive scenarios
         test_comprehensive_scenarios()
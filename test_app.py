@@ -0,0 +1,93 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from serving import ResultCache
+
+ADMIN = {'X-Admin-Token': 'test-token'}
+
+PATIENT = {'gender': 'male', 'age': 30, 'symptoms': ['ไอ', 'เสมหะ'], 'search_terms': 'มีเสมหะ, ไอ'}
+
+
+def test_app_survives_several_lifespans(api):
+    # Each context runs startup and shutdown; the compute pool must come back after shutdown
+    for _ in range(2):
+        with TestClient(api.app) as client:
+            response = client.post('/recommend', json=PATIENT)
+            assert response.status_code == 200
+            assert response.json()['similar_cases']
+
+
+def baseline_scores(csv_path, query, top_k=10):
+    """Scores of the original /recommend: one TF-IDF fit, cosine similarity, top 10 above zero"""
+    import json
+    import pandas as pd
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+    df = pd.read_csv(csv_path)
+    symptoms = df['summary'].map(lambda s: ' '.join(x['text'] for x in json.loads(s)['yes_symptoms']))
+    vectorizer = TfidfVectorizer(max_features=1000, stop_words=None, ngram_range=(1, 2), min_df=2)
+    vectors = vectorizer.fit_transform(symptoms + ' ' + df['search_term'].fillna(''))
+    similarities = cosine_similarity(vectorizer.transform([query]), vectors).flatten()
+    return [float(similarities[i]) for i in similarities.argsort()[-top_k:][::-1] if similarities[i] > 0]
+
+
+@pytest.mark.parametrize('coalesce', [False, True])
+@pytest.mark.parametrize('symptoms, search_terms', [
+    (['ไอ', 'เสมหะ'], 'มีเสมหะ, ไอ'),
+    (['pain', 'fever'], None),
+    (['fever', 'pain', 'fever'], 'Cough'),
+])
+def test_recommend_scores_the_request_as_sent(api, sample_csv, monkeypatch, coalesce, symptoms, search_terms):
+    # Caching off, so every response is computed from the request itself
+    monkeypatch.setattr(api, 'result_cache', ResultCache(0, 0))
+    if not coalesce:
+        monkeypatch.setattr(api, 'recommend_coalescer', None)
+    query = ' '.join(symptoms) + (' ' + search_terms if search_terms else '')
+    with TestClient(api.app) as client:
+        response = client.post('/recommend', json={'gender': 'female', 'age': 40, 'symptoms': symptoms,
+                                                   'search_terms': search_terms})
+    assert response.status_code == 200
+    assert response.json()['confidence_scores'] == pytest.approx(baseline_scores(sample_csv, query))
+
+
+def test_cache_keeps_reordered_symptoms_apart(api, monkeypatch):
+    monkeypatch.setattr(api, 'result_cache', ResultCache(16, 300))
+    with TestClient(api.app) as client:
+        forward = client.post('/recommend', json={**PATIENT, 'symptoms': ['pain', 'fever'], 'search_terms': None})
+        backward = client.post('/recommend', json={**PATIENT, 'symptoms': ['fever', 'pain'], 'search_terms': None})
+        spaced = client.post('/recommend', json={**PATIENT, 'symptoms': [' fever ', 'pain'], 'search_terms': None})
+    assert api.result_cache.stats()['hits'] == 1
+    assert spaced.json() == backward.json()
+    assert forward.json()['confidence_scores'] != backward.json()['confidence_scores']
+
+
+def wait_for_reload(api):
+    reloader = api.snapshots.reloader
+    if reloader is not None:
+        reloader.join(timeout=30)
+
+
+def test_ingested_cases_keep_their_ids_across_compaction_and_reload(api, monkeypatch):
+    monkeypatch.setattr(api, 'DELTA_COMPACT_ROWS', 3)
+    cases = [{'gender': 'female', 'age': 20 + i, 'symptoms': ['ผื่น', 'fever'], 'search_terms': f'case {i}'}
+             for i in range(3)]
+    with TestClient(api.app) as client:
+        n_main = len(api.snapshots.current())
+        first = client.post('/cases', json=cases[:2], headers=ADMIN).json()
+        second = client.post('/cases', json=cases[2:], headers=ADMIN).json()
+        assert first['case_ids'] == [n_main, n_main + 1]
+        assert second['case_ids'] == [n_main + 2]
+        assert second['compaction_started']
+        wait_for_reload(api)
+        compacted = api.snapshots.current()
+        assert compacted.delta is None and len(compacted.cases) == n_main + 3
+
+        assert client.post('/admin/reload', headers=ADMIN).status_code == 202
+        wait_for_reload(api)
+        reloaded = api.snapshots.current()
+        assert reloaded.version > compacted.version
+        assert len(reloaded) == n_main + 3 and len(reloaded.delta) == 3
+        records = reloaded.records(range(n_main, n_main + 3))
+        assert [record['search_terms'] for record in records] == ['case 0', 'case 1', 'case 2']
+        assert [record['age'] for record in records] == [20, 21, 22]
+        assert client.get('/stats').json()['total_records'] == n_main + 3
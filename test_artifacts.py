@@ -0,0 +1,58 @@
+import json
+import os
+
+import pytest
+
+from artifacts import MANIFEST_FILE, write_atomic_dir
+
+
+def write_marker(text):
+    def write_files(tmp_dir):
+        with open(os.path.join(tmp_dir, 'marker.txt'), 'w') as f:
+            f.write(text)
+    return write_files
+
+
+def read(directory, name):
+    with open(os.path.join(directory, name)) as f:
+        return f.read()
+
+
+def test_complete_directory_is_kept_unless_replaced(tmp_path):
+    target = str(tmp_path / 'bundle')
+    write_atomic_dir(target, {'version': 1}, write_marker('first'))
+    write_atomic_dir(target, {'version': 2}, write_marker('second'))
+    assert read(target, 'marker.txt') == 'first'
+
+    write_atomic_dir(target, {'version': 3}, write_marker('third'), replace=True)
+    assert read(target, 'marker.txt') == 'third'
+    assert json.loads(read(target, MANIFEST_FILE)) == {'version': 3}
+    # No temporary or retired directories are left next to it
+    assert os.listdir(tmp_path) == ['bundle']
+
+
+def test_failed_write_leaves_the_previous_directory(tmp_path):
+    target = str(tmp_path / 'bundle')
+    write_atomic_dir(target, {'version': 1}, write_marker('first'))
+
+    def fail(tmp_dir):
+        raise RuntimeError('disk full')
+
+    with pytest.raises(RuntimeError):
+        write_atomic_dir(target, {'version': 2}, fail, replace=True)
+    assert read(target, 'marker.txt') == 'first'
+    assert os.listdir(tmp_path) == ['bundle']
+
+
+def test_models_round_trip_through_the_models_dir(api):
+    data_hash = api.file_sha256(api.DATA_FILE)
+    trained = api.train_recommender(data_hash)
+    # Saving again replaces the directory in place
+    trained.save_models(api.MODELS_DIR, data_hash=data_hash)
+    assert sorted(os.listdir(os.path.dirname(api.MODELS_DIR))) == ['models']
+
+    df, _, _, _ = api.prepare_model_state(data_hash)
+    loaded = api.build_recommender(data_hash, api.CaseStore.from_frame(df))
+    assert loaded is not None and loaded.n_cases == trained.n_cases == len(df)
+    query = (['ไอ', 'เสมหะ'], 30, 'male')
+    assert loaded.get_comprehensive_recommendations(*query) == trained.get_comprehensive_recommendations(*query)
@@ -0,0 +1,70 @@
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from conftest import fixture_cases
+from delta import DeltaSegment, IngestLog
+from ingest import combined_texts
+from retrieval import ExactSearch
+from summaries import parse_summaries
+
+TFIDF_PARAMS = {'max_features': 1000, 'stop_words': None, 'ngram_range': (1, 2), 'min_df': 2}
+
+
+def served_cases(n_cases, seed):
+    df = fixture_cases(n_cases, seed)
+    df['extracted_symptoms'] = parse_summaries(df['summary'], df.index).texts()
+    return df
+
+
+def grown_segment(batch_sizes, offset=1000):
+    cases = served_cases(sum(batch_sizes), seed=1)
+    vectorizer = TfidfVectorizer(**TFIDF_PARAMS).fit(combined_texts(served_cases(400, seed=0)))
+    bounds = np.cumsum([0] + batch_sizes)
+    segment = DeltaSegment.create(offset, cases.iloc[:bounds[1]], vectorizer)
+    for start, stop in zip(bounds[1:-1], bounds[2:]):
+        segment = segment.appended(cases.iloc[start:stop], vectorizer)
+    return segment, cases, vectorizer
+
+
+def test_appends_keep_few_blocks_and_every_row():
+    segment, cases, _ = grown_segment([1] * 100 + [7, 3, 30])
+    assert len(segment) == len(cases) == 140
+    # Binary-counter merging: never more blocks than bits in the row count
+    assert len(segment.blocks) <= int(np.log2(len(segment))) + 1
+    assert [len(block) for block in segment.blocks] == sorted((len(block) for block in segment.blocks), reverse=True)
+    assert segment.frame['search_term'].tolist() == cases['search_term'].tolist()
+    for position in (0, 63, 99, 100, 139):
+        record = segment.record(position)
+        assert record['search_terms'] == cases['search_term'].iloc[position]
+        assert record['age'] == cases['age'].iloc[position]
+
+
+def test_appended_leaves_the_earlier_segment_untouched():
+    segment, cases, vectorizer = grown_segment([4, 4])
+    longer = segment.appended(cases.iloc[:4], vectorizer)
+    assert len(segment) == 8 and len(longer) == 12
+    assert segment.record(7)['search_terms'] == cases['search_term'].iloc[7]
+
+
+def test_block_search_matches_one_exact_search():
+    segment, cases, vectorizer = grown_segment([1] * 37 + [5, 11])
+    exact = ExactSearch(vectorizer.transform(combined_texts(cases)))
+    queries = vectorizer.transform(['ไอ เสมหะ', 'pain fever', 'ปวดหัว มีไข้'])
+    batch = segment.search_batch(queries, top_k=10)
+    for row in range(queries.shape[0]):
+        expected_ids, expected_scores = exact.search(queries[row], top_k=10)
+        ids, scores = segment.search(queries[row], top_k=10)
+        assert np.allclose(scores, expected_scores)
+        # Ties may come out in another order, but the scored ids are the same cases
+        assert sorted(zip(np.round(scores, 9), ids)) == sorted(zip(np.round(expected_scores, 9), expected_ids + 1000))
+        assert np.array_equal(batch[row][0], ids) and np.allclose(batch[row][1], scores)
+
+
+def test_ingest_log_keeps_cases_in_order():
+    cases = served_cases(10, seed=2)
+    log = IngestLog()
+    assert len(log) == 0 and len(log.frame()) == 0
+    log.append(cases.iloc[:3])
+    log.append(cases.iloc[3:])
+    assert len(log) == 10
+    assert log.frame()['search_term'].tolist() == cases['search_term'].tolist()
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from scipy import sparse
+from sklearn.ensemble import RandomForestClassifier
+
+from forest import ForestArrays, top_k_columns
+
+
+@pytest.fixture(scope='module')
+def fitted():
+    rng = np.random.default_rng(0)
+    X = sparse.random(300, 40, density=0.2, format='csr', random_state=1)
+    y = rng.integers(0, 6, 300)
+    forest = RandomForestClassifier(n_estimators=15, random_state=0).fit(X, y)
+    return forest, X
+
+
+def test_top_k_columns_match_a_stable_descending_sort():
+    rng = np.random.default_rng(2)
+    # Few distinct values, so most rows have ties at the k-th place
+    scores = rng.integers(0, 4, size=(200, 9)).astype(np.float64)
+    for k in (1, 3, 9, 12):
+        expected = np.argsort(-scores, axis=1, kind='stable')[:, :min(k, 9)]
+        assert np.array_equal(top_k_columns(scores, k), expected)
+    assert top_k_columns(scores, 0).shape == (200, 0)
+
+
+def test_forest_arrays_reproduce_predict_proba(fitted):
+    forest, X = fitted
+    arrays = ForestArrays.from_estimator(forest)
+    assert arrays.n_trees == 15
+    assert np.array_equal(arrays.predict_proba(X), forest.predict_proba(X))
+    assert np.array_equal(arrays.predict_proba(X[:1].toarray()), forest.predict_proba(X[:1]))
+
+
+def test_forest_arrays_pruning(fitted):
+    forest, X = fitted
+    arrays = ForestArrays.from_estimator(forest)
+    first_trees = np.mean([tree.predict_proba(X) for tree in forest.estimators_[:5]], axis=0)
+    assert np.allclose(arrays.predict_proba(X, max_trees=5), first_trees)
+    # Depth 0 stops at the roots: every row gets each tree's prior
+    shallow = arrays.predict_proba(X, max_depth=0)
+    assert np.allclose(shallow, shallow[0]) and np.allclose(shallow.sum(axis=1), 1)
+    with pytest.raises(ValueError):
+        arrays.predict_proba(X, max_trees=0)
+
+
+def test_forest_arrays_round_trip(fitted, tmp_path):
+    forest, X = fitted
+    ForestArrays.from_estimator(forest).save(str(tmp_path))
+    loaded = ForestArrays.load(str(tmp_path))
+    assert np.array_equal(loaded.predict_proba(X), forest.predict_proba(X))
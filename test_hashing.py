@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from conftest import fixture_cases
+from hashing import HashingTfidfVectorizer, select_features
+from ingest import combined_texts
+from summaries import parse_summaries
+
+
+@pytest.fixture(scope='module')
+def texts():
+    df = fixture_cases()
+    df['extracted_symptoms'] = parse_summaries(df['summary'], df.index).texts()
+    return list(combined_texts(df))
+
+
+def test_select_features_prunes_like_tfidf_vectorizer():
+    term_counts = np.array([5, 1, 9, 5, 2, 7])
+    doc_counts = np.array([4, 1, 6, 3, 2, 5])
+    positions, idf = select_features(term_counts, doc_counts, n_docs=6, min_df=2, max_df=5, max_features=3)
+    # df 1 is below min_df and df 6 above max_df; of the rest, the three most frequent terms
+    assert positions.tolist() == [0, 3, 5]
+    assert np.allclose(idf, np.log(7 / (doc_counts[positions] + 1)) + 1)
+    with pytest.raises(ValueError, match='no terms remain'):
+        select_features(term_counts, doc_counts, n_docs=6, min_df=10)
+
+
+@pytest.mark.parametrize('max_features', [None, 25])
+def test_hashed_fit_matches_a_vocabulary_fit(texts, max_features):
+    params = {'ngram_range': (1, 2), 'min_df': 2, 'max_features': max_features}
+    reference = TfidfVectorizer(**params)
+    expected = reference.fit_transform(texts)
+    hashed = HashingTfidfVectorizer(n_features=1 << 20, n_jobs=1, **params)
+    vectors = hashed.fit_transform(texts)
+    hashed.resolve_feature_names(texts)
+
+    # Without collisions every kept column is one kept term with the same IDF and weights
+    names = list(hashed.get_feature_names_out())
+    assert sorted(names) == sorted(reference.vocabulary_)
+    order = [reference.vocabulary_[name] for name in names]
+    assert np.allclose(hashed.idf_, reference.idf_[order])
+    assert abs(vectors - expected[:, order]).max() < 1e-12
+
+
+def test_sharded_statistics_add_up(texts):
+    whole = HashingTfidfVectorizer(n_features=1 << 12, n_jobs=1).statistics(texts)
+    parts = HashingTfidfVectorizer(n_features=1 << 12, n_jobs=1).statistics(texts[:150])
+    parts = parts + HashingTfidfVectorizer(n_features=1 << 12, n_jobs=1).statistics(texts[150:])
+    assert parts.n_docs == whole.n_docs == len(texts)
+    assert np.array_equal(parts.term_counts, whole.term_counts)
+    assert np.array_equal(parts.doc_counts, whole.doc_counts)
@@ -0,0 +1,103 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from case_store import CaseStore
+from conftest import fixture_cases
+from indexes import AgeBucketCache, DatasetStats, SymptomIndex, get_age_group, parse_age_buckets
+from summaries import parse_summaries
+
+
+@pytest.fixture(scope='module')
+def cases():
+    df = fixture_cases()
+    df['extracted_symptoms'] = parse_summaries(df['summary'], df.index).texts()
+    return df
+
+
+def brute_force_cooccurrence(texts, symptoms):
+    """The per-request loop /symptoms/analysis used to run over every case"""
+    counts = Counter()
+    for text in texts:
+        case_symptoms = set(text.split())
+        if case_symptoms & set(symptoms):
+            counts.update(case_symptoms - set(symptoms))
+    return counts
+
+
+def built_index(texts):
+    index = SymptomIndex()
+    index.build(texts)
+    return index
+
+
+@pytest.mark.parametrize('symptoms', [['ไอ'], ['pain', 'fever'], ['ผื่น', 'ไอ', 'headache'], ['unknown']])
+def test_cooccurrence_counts_each_case_once(cases, symptoms):
+    texts = list(cases['extracted_symptoms'])
+    expected = brute_force_cooccurrence(texts, symptoms)
+    result = built_index(texts).co_occurring_symptoms(symptoms, top_n=20)
+    assert result == {token: expected[token] for token in result}
+    assert sorted(result.values(), reverse=True) == sorted(expected.values(), reverse=True)[:20]
+
+
+def test_extended_index_matches_a_rebuild(cases):
+    texts = list(cases['extracted_symptoms'])
+    extended = built_index(texts[:300]).extended(texts[300:350]).extended(texts[350:] + ['brandnew ไอ'])
+    rebuilt = built_index(texts + ['brandnew ไอ'])
+    assert extended.common_symptoms(30) == rebuilt.common_symptoms(30)
+    for symptoms in (['ไอ'], ['brandnew'], ['pain', 'fever']):
+        assert extended.co_occurring_symptoms(symptoms, 30) == rebuilt.co_occurring_symptoms(symptoms, 30)
+
+
+def test_age_bucket_tables_count_each_bucket(cases):
+    texts = list(cases['extracted_symptoms'])
+    ages = cases['age'].to_numpy()
+    cache = AgeBucketCache(top_n=20)
+    cache.build(ages, built_index(texts))
+    for label, min_age, max_age in cache.buckets:
+        in_bucket = [text for text, age in zip(texts, ages) if min_age <= age <= max_age]
+        expected = Counter(token for text in in_bucket for token in text.split())
+        assert cache.case_totals[label] == len(in_bucket)
+        assert dict(cache.tables[label]) == {token: expected[token] for token, _ in cache.tables[label]}
+        assert [count for _, count in cache.tables[label]] == sorted(expected.values(), reverse=True)[:20]
+    assert cache.common_symptoms(45, top_n=3) == [token for token, _ in cache.tables['middle'][:3]]
+
+
+def test_extended_age_buckets_match_a_rebuild(cases):
+    texts = list(cases['extracted_symptoms'])
+    ages = cases['age'].to_numpy()
+    index = built_index(texts[:350])
+    cache = AgeBucketCache()
+    cache.build(ages[:350], index)
+    extended_index = index.extended(texts[350:])
+    extended = cache.extended(ages[350:], extended_index)
+
+    rebuilt = AgeBucketCache()
+    rebuilt.build(ages, built_index(texts))
+    assert extended.case_totals == rebuilt.case_totals
+    assert extended.tables == rebuilt.tables
+
+
+def test_age_groups_follow_the_bucket_spec():
+    buckets = parse_age_buckets('adult:18-65,child:0-18,senior:65-120')
+    assert [label for label, _, _ in buckets] == ['child', 'adult', 'senior']
+    assert [get_age_group(age, buckets) for age in (0, 17, 18, 64, 65, 200)] == \
+        ['child', 'child', 'adult', 'adult', 'senior', 'senior']
+    with pytest.raises(ValueError):
+        parse_age_buckets('adult:65-18')
+
+
+def test_dataset_stats_clip_ages_and_add_cases(cases):
+    store = CaseStore.from_frame(cases)
+    index = built_index(list(cases['extracted_symptoms']))
+    stats = DatasetStats().build(store, index).as_dict()
+    assert stats['total_records'] == len(cases)
+    assert stats['age_statistics']['median'] == float(np.median(cases['age']))
+    assert stats['age_statistics']['mean'] == pytest.approx(cases['age'].mean())
+
+    extended = DatasetStats().build(store, index).extended(['female', 'male'], np.array([10 ** 9, -5]), index)
+    summary = extended.as_dict()
+    assert summary['total_records'] == len(cases) + 2
+    assert summary['age_statistics']['max'] == 150 and summary['age_statistics']['min'] == 0
+    assert len(extended.age_histogram) <= 151
@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from ingest import SERVED_COLUMNS, build_model_state_chunked, combined_texts, iter_case_chunks
+
+TFIDF_PARAMS = {'max_features': 1000, 'stop_words': None, 'ngram_range': (1, 2), 'min_df': 2}
+
+
+def test_chunked_build_matches_a_one_shot_fit(sample_csv):
+    df, vectorizer, vectors, age_scaler = build_model_state_chunked(str(sample_csv), TFIDF_PARAMS, chunk_rows=64)
+    whole = pd.concat(iter_case_chunks(str(sample_csv), 1000), ignore_index=True)
+    reference = TfidfVectorizer(**TFIDF_PARAMS)
+    expected = reference.fit_transform(combined_texts(whole))
+
+    pd.testing.assert_frame_equal(df[SERVED_COLUMNS], whole[SERVED_COLUMNS])
+    assert vectorizer.vocabulary_ == reference.vocabulary_
+    assert abs(vectors - expected).max() < 1e-12
+    assert np.allclose(df['age_scaled'], (whole['age'] - whole['age'].mean()) / whole['age'].std(ddof=0))
@@ -0,0 +1,28 @@
+import pytest
+
+from conftest import fixture_cases
+from indexes import get_age_group
+from models import SymptomRecommender
+
+BUCKETS = [('child', 0, 12), ('adult', 12, 65), ('senior', 65, 120)]
+
+
+@pytest.fixture(scope='module')
+def recommender():
+    recommender = SymptomRecommender(n_jobs=1, age_buckets=BUCKETS)
+    recommender.train_models(fixture_cases())
+    return recommender
+
+
+def test_age_insights_use_the_api_age_groups(recommender):
+    assert sorted(recommender.age_insights) == ['adult', 'child', 'senior']
+    for age in (0, 11, 12, 64, 65, 119, 130):
+        insights = recommender._get_age_insights(age)
+        assert insights['age_group'] == get_age_group(age, BUCKETS)
+
+
+def test_models_trained_with_other_age_buckets_are_not_loaded(recommender, tmp_path):
+    recommender.save_models(str(tmp_path / 'models'))
+    with pytest.raises(ValueError, match='age buckets'):
+        SymptomRecommender(n_jobs=1).load_models(str(tmp_path / 'models'))
+    SymptomRecommender(n_jobs=1, age_buckets=BUCKETS).load_models(str(tmp_path / 'models'))
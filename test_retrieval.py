@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from conftest import fixture_cases
+from ingest import combined_texts
+from retrieval import ExactSearch, IVFSearch, build_retriever, merge_hits, recall_at_k, top_k_scores
+from summaries import parse_summaries
+
+QUERIES = ['ไอ เสมหะ', 'pain fever', 'ปวดหัว', 'ผื่น คลื่นไส้ headache', 'nothing matches']
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    df = fixture_cases(1000, seed=3)
+    df['extracted_symptoms'] = parse_summaries(df['summary'], df.index).texts()
+    vectorizer = TfidfVectorizer(ngram_range=(1, 2), min_df=2)
+    return vectorizer, vectorizer.fit_transform(combined_texts(df))
+
+
+def test_top_k_scores_and_merge_hits():
+    scores = np.array([0.2, 0.0, 0.9, 0.5, 0.9, -0.1])
+    positions, values = top_k_scores(scores, top_k=3)
+    assert positions.tolist() == [2, 4, 3] and values.tolist() == [0.9, 0.9, 0.5]
+    assert top_k_scores(scores, top_k=10, min_score=0.4)[0].tolist() == [2, 4, 3]
+
+    merged = merge_hits([(np.array([7, 8]), np.array([0.8, 0.3])), (np.array([20, 21]), np.array([0.8, 0.5]))], 3)
+    assert merged[0].tolist() == [7, 20, 21] and merged[1].tolist() == [0.8, 0.8, 0.5]
+
+
+def test_exact_search_matches_cosine_similarity(corpus):
+    vectorizer, vectors = corpus
+    search = ExactSearch(vectors)
+    queries = vectorizer.transform(QUERIES)
+    batch = search.search_batch(queries, top_k=10)
+    for row in range(len(QUERIES)):
+        similarities = cosine_similarity(queries[row], vectors).ravel()
+        expected = np.sort(similarities[similarities > 0])[::-1][:10]
+        ids, scores = search.search(queries[row], top_k=10)
+        assert np.allclose(scores, expected)
+        assert np.allclose(similarities[ids], scores)
+        assert np.array_equal(batch[row][0], ids) and np.allclose(batch[row][1], scores)
+    assert len(search.search(queries[-1], top_k=10)[0]) == 0
+
+
+def test_ivf_probing_every_list_is_exact(corpus):
+    vectorizer, vectors = corpus
+    exact = build_retriever('exact', vectors)
+    ivf = build_retriever('ivf', vectors, n_lists=16, n_probe=16)
+    assert isinstance(ivf, IVFSearch)
+    # Every case sits in exactly one inverted list
+    assert np.array_equal(np.sort(ivf.list_members), np.arange(vectors.shape[0]))
+    queries = vectorizer.transform(QUERIES)
+    for row in range(len(QUERIES)):
+        assert np.allclose(ivf.search(queries[row], 10)[1], exact.search(queries[row], 10)[1])
+    assert recall_at_k(exact, ivf, vectors[:50], k=10) == 1.0
+
+
+def test_ivf_recall_with_few_probes(corpus):
+    _, vectors = corpus
+    exact = ExactSearch(vectors)
+    ivf = IVFSearch(vectors, n_lists=16, n_probe=4).build()
+    ids, scores = ivf.search(vectors[0], 10)
+    assert np.all(np.diff(scores) <= 0)
+    assert np.allclose((vectors[ids] @ vectors[0].T).toarray().ravel(), scores)
+    assert recall_at_k(exact, ivf, vectors[:100], k=10) >= 0.8
+    with pytest.raises(ValueError):
+        build_retriever('annoy', vectors)
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+
+import pytest
+
+import serving
+from serving import ComputePool, ComputePoolFull, RequestCoalescer, ResultCache
+
+
+def test_result_cache_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2, ttl_seconds=60)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1  # 'b' is now the least recently used
+    cache.put('c', 3)
+    assert cache.get('b') is None and cache.get('a') == 1 and cache.get('c') == 3
+    stats = cache.stats()
+    assert (stats['entries'], stats['evictions'], stats['hits'], stats['misses']) == (2, 1, 3, 1)
+
+
+def test_result_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(serving.time, 'monotonic', lambda: now[0])
+    cache = ResultCache(max_entries=8, ttl_seconds=5)
+    cache.put('a', 1)
+    now[0] += 4.9
+    assert cache.get('a') == 1
+    now[0] += 0.2
+    assert cache.get('a') is None and cache.stats()['expirations'] == 1
+
+
+def test_result_cache_drops_results_computed_before_a_clear():
+    cache = ResultCache(max_entries=8)
+    generation = cache.generation
+    cache.clear()
+    cache.put('stale', 1, generation)
+    cache.put('fresh', 2, cache.generation)
+    assert cache.get('stale') is None and cache.get('fresh') == 2
+
+    disabled = ResultCache(max_entries=0)
+    disabled.put('a', 1)
+    assert disabled.get('a') is None
+
+
+async def run_inline(fn, *args):
+    return fn(*args)
+
+
+def test_coalescer_batches_concurrent_requests_in_order():
+    batches = []
+
+    def double(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    async def main():
+        coalescer = RequestCoalescer(double, run_inline, window_ms=20, max_batch=4)
+        results = await asyncio.gather(*(coalescer.submit(i) for i in range(6)))
+        return results, coalescer.stats()
+
+    results, stats = asyncio.run(main())
+    assert results == [0, 2, 4, 6, 8, 10]
+    # Four fill a batch at once; the other two wait out the window
+    assert batches == [[0, 1, 2, 3], [4, 5]]
+    assert (stats['batches'], stats['requests'], stats['max_batch_size']) == (2, 6, 4)
+    assert stats['batch_size_histogram'] == {'<=2': 1, '<=4': 1}
+
+
+def test_coalescer_fails_every_request_of_a_failed_batch():
+    def fail(items):
+        raise ComputePoolFull('busy')
+
+    async def main():
+        coalescer = RequestCoalescer(fail, run_inline, window_ms=5)
+        return await asyncio.gather(coalescer.submit(1), coalescer.submit(2), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ComputePoolFull) for result in results)
+
+
+def test_compute_pool_rejects_past_its_queue_and_restarts():
+    pool = ComputePool(max_workers=1, max_queue=0)
+    release = threading.Event()
+
+    async def main():
+        first = asyncio.ensure_future(pool.run(lambda: release.wait(5) and 'done'))
+        await asyncio.sleep(0.05)
+        with pytest.raises(ComputePoolFull):
+            await pool.run(lambda: None)
+        release.set()
+        return await first
+
+    assert asyncio.run(main()) == 'done'
+    assert pool.stats()['rejected'] == 1 and pool.stats()['in_flight'] == 0
+    pool.shutdown()
+    assert asyncio.run(pool.run(lambda: 42)) == 42
+    pool.shutdown()
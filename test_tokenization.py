@@ -0,0 +1,42 @@
+import pickle
+
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from tokenization import ThaiTokenizer, build_tokenizer, with_tokenizer
+
+SYMPTOM_TEXTS = ['ปวดท้อง ท้องเสีย', 'ปวดหัว ไข้', 'ไอ เสมหะ', 'น้ำมูกไหล', 'คลื่นไส้']
+
+
+def test_default_pattern_breaks_thai_words():
+    # The problem the tokenizer solves: vowel and tone marks are not \w
+    analyzer = TfidfVectorizer().build_analyzer()
+    assert analyzer('ปวดท้อง') == ['ปวดท', 'อง']
+
+
+def test_thai_runs_are_segmented_into_dictionary_terms():
+    tokenizer = ThaiTokenizer.from_texts(SYMPTOM_TEXTS)
+    assert tokenizer('ปวดท้อง') == ['ปวดท้อง']
+    assert tokenizer('มีเสมหะ, ไอ') == ['มี', 'เสมหะ', 'ไอ']
+    assert tokenizer('ปวดหัวไข้ pain, fever') == ['ปวดหัว', 'ไข้', 'pain', 'fever']
+    # Fewest unmatched characters first: ท้องเสีย stays whole rather than ท้อง + เสีย
+    assert tokenizer('ท้องเสียมาก') == ['ท้องเสีย', 'มาก']
+
+
+def test_tokenizer_survives_pickling_with_the_same_output():
+    tokenizer = ThaiTokenizer.from_texts(SYMPTOM_TEXTS)
+    restored = pickle.loads(pickle.dumps(tokenizer))
+    assert repr(restored) == repr(tokenizer)
+    assert restored('ปวดท้องมีไข้') == tokenizer('ปวดท้องมีไข้')
+
+
+def test_build_tokenizer_shares_one_instance_per_dictionary():
+    first = build_tokenizer('thai', SYMPTOM_TEXTS)
+    assert build_tokenizer('thai', list(SYMPTOM_TEXTS)) is first
+    assert build_tokenizer('', SYMPTOM_TEXTS) is None
+    with pytest.raises(ValueError):
+        build_tokenizer('icu', SYMPTOM_TEXTS)
+
+    params = with_tokenizer({'ngram_range': (1, 2)}, first)
+    vectorizer = TfidfVectorizer(**params).fit(['ปวดท้อง ท้องเสีย', 'ปวดท้อง ไอ'])
+    assert 'ปวดท้อง' in vectorizer.vocabulary_ and 'ปวดท้อง ท้องเสีย' in vectorizer.vocabulary_
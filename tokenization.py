@@ -0,0 +1,149 @@
+import hashlib
+import re
+import weakref
+from typing import Any, Dict, Iterable, List, Optional
+
+# Runs of Thai script, segmented against the dictionary
+THAI_RUN = re.compile(r'[\u0e00-\u0e7f]+')
+
+# Everything else is tokenised like TfidfVectorizer's default token_pattern
+WORD = re.compile(r"(?u)\b\w\w+\b")
+
+# Key marking the end of a term in a trie node (no character equals it)
+TERM_END = ''
+
+
+class ThaiTokenizer:
+    """Dictionary-based maximal matching for Thai text, memoised per phrase
+
+    Thai has no spaces between words, and the default token_pattern also breaks
+    words wherever a vowel or tone mark (not \\w) occurs, so "ปวดท้อง" becomes
+    "ปวดท" + "อง". Here each Thai run is segmented into dictionary terms, leaving
+    as few characters unmatched as possible and then using the fewest terms.
+    Unmatched characters are kept together as one token. Symptom text repeats a
+    lot, so every distinct whitespace-separated phrase is segmented only once.
+    """
+    # ตัดคำไทยด้วยพจนานุกรมอาการจาก yes_symptoms แทน token_pattern ที่ตัดกลางคำ
+
+    def __init__(self, terms: Iterable[str], cache_size: int = 100000):
+        # Only the Thai runs of a term can be matched
+        self.terms = sorted({run for term in terms for run in THAI_RUN.findall(str(term).lower())})
+        self.cache_size = cache_size
+        self._build()
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str], cache_size: int = 100000) -> 'ThaiTokenizer':
+        """Dictionary of every whitespace-separated phrase of texts (e.g. yes_symptoms texts)"""
+        return cls((phrase for text in texts if isinstance(text, str) for phrase in text.split()), cache_size)
+
+    def _build(self):
+        self.term_set = set(self.terms)
+        self.trie = {}
+        for term in self.terms:
+            node = self.trie
+            for char in term:
+                node = node.setdefault(char, {})
+            node[TERM_END] = True
+        self.digest = hashlib.sha1('\n'.join(self.terms).encode('utf-8')).hexdigest()[:16]
+        self.cache = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # The trie and the phrase cache are rebuilt on unpickling
+        return {'terms': self.terms, 'cache_size': self.cache_size}
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.terms = state['terms']
+        self.cache_size = state['cache_size']
+        self._build()
+
+    def __repr__(self) -> str:
+        # Content-based, so vectorizers with equal dictionaries compare alike (QueryEncoder groups them)
+        return f"ThaiTokenizer(terms={len(self.terms)}, digest={self.digest})"
+
+    def __call__(self, text: str) -> List[str]:
+        tokens = []
+        cache = self.cache
+        for phrase in text.split():
+            segmented = cache.get(phrase)
+            if segmented is None:
+                segmented = self._tokenize_phrase(phrase)
+                if len(cache) >= self.cache_size:
+                    cache.clear()
+                cache[phrase] = segmented
+            tokens.extend(segmented)
+        return tokens
+
+    def _tokenize_phrase(self, phrase: str) -> List[str]:
+        tokens = []
+        position = 0
+        for match in THAI_RUN.finditer(phrase):
+            tokens.extend(WORD.findall(phrase[position:match.start()]))
+            tokens.extend(self._segment(match.group()))
+            position = match.end()
+        tokens.extend(WORD.findall(phrase[position:]))
+        return tokens
+
+    def _segment(self, run: str) -> List[str]:
+        """Maximal matching: fewest unmatched characters, then fewest terms"""
+        if run in self.term_set:
+            return [run]
+
+        n = len(run)
+        # best[i]: cost of the best segmentation of run[:i], as unmatched characters * (n + 1)
+        # + terms, so comparing integers orders by unmatched characters first
+        unmatched_cost = n + 1
+        best = [0] + [unmatched_cost * (n + 1)] * n
+        start = [0] * (n + 1)
+        matched = [False] * (n + 1)
+        trie = self.trie
+        for i in range(n):
+            cost = best[i]
+            if cost + unmatched_cost < best[i + 1]:
+                best[i + 1], start[i + 1], matched[i + 1] = cost + unmatched_cost, i, False
+
+            node = trie
+            for j in range(i, n):
+                node = node.get(run[j])
+                if node is None:
+                    break
+                if TERM_END in node and cost + 1 < best[j + 1]:
+                    best[j + 1], start[j + 1], matched[j + 1] = cost + 1, i, True
+
+        # Walk back, merging adjacent unmatched characters into one token
+        pieces = []
+        end = n
+        while end > 0:
+            begin = start[end]
+            if not matched[end]:
+                while begin > 0 and not matched[begin]:
+                    begin = start[begin]
+            pieces.append((run[begin:end], matched[end]))
+            end = begin
+        # Lone unmatched characters are dropped, like the default pattern's 2-character minimum
+        return [piece for piece, is_term in reversed(pieces) if is_term or len(piece) > 1]
+
+
+# Tokenizers selectable by name (TOKENIZER in app.py, SymptomRecommender(tokenizer=...))
+TOKENIZERS = {
+    'thai': ThaiTokenizer
+}
+
+# Live tokenizers by dictionary, so components fitted on the same data share one phrase cache
+_shared = weakref.WeakValueDictionary()
+
+
+def build_tokenizer(name: Optional[str], texts: Iterable[str]):
+    """The named tokenizer over texts' dictionary, or None for the default token_pattern"""
+    if not name:
+        return None
+    if name not in TOKENIZERS:
+        raise ValueError(f"Unknown tokenizer '{name}', expected one of {sorted(TOKENIZERS)}")
+    tokenizer = TOKENIZERS[name].from_texts(texts)
+    return _shared.setdefault((name, tokenizer.digest), tokenizer)
+
+
+def with_tokenizer(params: Dict[str, Any], tokenizer) -> Dict[str, Any]:
+    """Vectorizer params using tokenizer in place of token_pattern (unchanged for None)"""
+    if tokenizer is None:
+        return params
+    return {**params, 'tokenizer': tokenizer, 'token_pattern': None}